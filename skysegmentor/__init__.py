@@ -1,3 +1,6 @@
+from .cache import set_result_cache_size
+from .cache import clear_result_cache
+
 from .coords import cart2sphere
 from .coords import sphere2cart
 from .coords import distusphere
@@ -8,11 +11,17 @@ from .groupfinder import _unionise
 from .groupfinder import _shuffle_down
 from .groupfinder import _if_list_concatenate
 from .groupfinder import unionfinder
+from .groupfinder import unionfinder_sparse
+from .groupfinder import unionfinder_rings
 
 from .maths import vector_norm
 from .maths import vector_dot
 from .maths import vector_cross
 from .maths import matrix_dot_3by3
+from .maths import vector_normalise
+from .maths import pseudo_angle
+
+from .regions import partition_adjacency, partition_components, partition_summary
 
 from .rotate import _rotmat_x
 from .rotate import _rotmat_y
@@ -26,22 +35,55 @@ from .rotate import midpoint_usphere
 from .rotate import rotate2plane
 from .rotate import forward_rotate
 from .rotate import backward_rotate
+from .rotate import rotate2plane_basis
+
+from .mask import pack_mask
+from .mask import packed2pixels
+from .mask import mask2pixels
+
+from .neighbours import set_neighbour_cache_size
+from .neighbours import clear_neighbour_cache
+from .neighbours import get_neighbour_table
+from .neighbours import get_footprint_neighbours
 
 from .partition import get_partition_IDs
 from .partition import total_partition_weights
 from .partition import remove_val4array
 from .partition import fill_map
+from .partition import assign_points_to_partitionmap
 from .partition import find_map_barycenter
 from .partition import find_points_barycenter
 from .partition import get_map_border
 from .partition import get_points_border
 from .partition import get_map_most_dist_points
 from .partition import get_points_most_dist_points
+from .partition import find_vectors_barycenter
+from .partition import get_vectors_border
+from .partition import get_vectors_most_dist_points
 from .partition import weight_dif
 from .partition import find_dphi
+from .partition import find_dphis
 from .partition import segmentmap2
 from .partition import segmentpoints2
+from .partition import segmentvectors2
 from .partition import segmentmapN
 from .partition import segmentpointsN
+from .partition import segmentvectorsN
+from .partition import refinemapN
+from .partition import refinepointsN
+from .partition import refinevectorsN
+from .partition import updatemapN
+
+from .tree import get_tree_levels
+from .tree import coarsen_partition
+from .tree import apply_partition_tree
+
+from .sketch import weighted_sketch
+from .sketch import update_sketch
+from .sketch import merge_sketches
+from .sketch import sketch_quantiles
+from .sketch import sketch_dphi
+
+from .stream import segmentshardsN
 
 from .utils import isscalar
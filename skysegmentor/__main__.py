@@ -0,0 +1,304 @@
+import os
+import time
+import argparse
+import tracemalloc
+import numpy as np
+import healpy as hp
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from .groupfinder import unionfinder
+from .partition import segmentmapN, segmentpointsN
+
+
+def _is_fits(fname: str) -> bool:
+    """Checks whether a file name has a FITS extension."""
+    return fname.lower().endswith((".fits", ".fit", ".fits.gz"))
+
+
+def _load_map(fname: str) -> np.ndarray:
+    """Loads a Healpix map in RING ordering from a .npy or FITS file, with
+    unseen pixels set to zero.
+
+    Parameters
+    ----------
+    fname : str
+        Map file name.
+
+    Returns
+    -------
+    hmap : array
+        Healpix map.
+    """
+    if _is_fits(fname):
+        hmap = hp.read_map(fname)
+        hmap[hmap == hp.UNSEEN] = 0.0
+        return hmap
+    return np.load(fname)
+
+
+def _load_catalog(
+    fname: str, columns: List[str]
+) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """Loads a catalog from a .npy shard of shape (N, 2) or (N, 3) with columns
+    phi, theta and optionally the weights, or from the named columns of a FITS
+    table.
+
+    Parameters
+    ----------
+    fname : str
+        Catalog file name.
+    columns : list
+        FITS column names of phi, theta and optionally the weights.
+
+    Returns
+    -------
+    phi, the : array
+        Angular positions.
+    weights : array or None
+        Weights, if given.
+    """
+    if _is_fits(fname):
+        from astropy.io import fits
+
+        with fits.open(fname) as hdul:
+            data = hdul[1].data
+            data = np.column_stack(
+                [np.asarray(data[name], dtype=float) for name in columns]
+            )
+    else:
+        data = np.load(fname)
+    if data.ndim != 2 or data.shape[1] not in [2, 3]:
+        raise ValueError("Catalogs must have 2 or 3 columns, phi, the and weights.")
+    weights = data[:, 2] if data.shape[1] == 3 else None
+    return data[:, 0], data[:, 1], weights
+
+
+def _output_name(fname: str, command: str, output_dir: Optional[str]) -> str:
+    """Returns the labels file name of an input file, <name>.<command>.labels.npy,
+    so the labels of different commands run on the same file are kept apart.
+
+    Parameters
+    ----------
+    fname : str
+        Input file name.
+    command : str
+        Command run on the file.
+    output_dir : str or None
+        Output directory, the directory of the input file if None.
+    """
+    stem = os.path.basename(fname)
+    for ext in [".fits.gz", ".fits", ".fit", ".npy"]:
+        if stem.lower().endswith(ext):
+            stem = stem[: -len(ext)]
+            break
+    if output_dir is None:
+        output_dir = os.path.dirname(fname)
+    return os.path.join(output_dir, "%s.%s.labels.npy" % (stem, command))
+
+
+def _compact_labels(labels: np.ndarray) -> np.ndarray:
+    """Returns labels in the smallest unsigned integer type which holds them."""
+    labels = np.asarray(labels).astype(int)
+    maxlabel = int(np.max(labels)) if len(labels) > 0 else 0
+    return labels.astype(np.min_scalar_type(maxlabel))
+
+
+def _run_command(command: str, fname: str, options: Dict[str, Any]) -> np.ndarray:
+    """Partitions or labels a single file.
+
+    Parameters
+    ----------
+    command : str
+        Either 'map', 'points' or 'groups'.
+    fname : str
+        Input file name.
+    options : dict
+        Command line options.
+
+    Returns
+    -------
+    labels : int array
+        Partition or group IDs.
+    """
+    if command == "map":
+        labels = segmentmapN(
+            _load_map(fname),
+            options["npartitions"],
+            res=[options["res"], options["res_theta"]],
+            Nsplit=options["nsplit"],
+            result_cache=options["result_cache"],
+        )
+    elif command == "points":
+        phi, the, weights = _load_catalog(fname, options["columns"])
+        labels = segmentpointsN(
+            phi,
+            the,
+            options["npartitions"],
+            weights=weights,
+            res=options["res"],
+            Nsplit=options["nsplit"],
+            nside=options["nside"],
+            result_cache=options["result_cache"],
+        )
+    else:
+        binmap = (_load_map(fname) != 0).astype(float)
+        labels = unionfinder(
+            binmap,
+            min_size=options["min_size"],
+            result_cache=options["result_cache"],
+        )
+    return labels
+
+
+def _run_file(
+    job: Tuple[str, str, str, Dict[str, Any]]
+) -> Tuple[str, str, float, float]:
+    """Partitions or labels a single file and writes its labels.
+
+    Parameters
+    ----------
+    job : tuple
+        The command, input file name, output file name and options.
+
+    Returns
+    -------
+    fname, outname : str
+        Input and output file names.
+    seconds : float
+        Time taken, including reading and writing.
+    peak : float
+        Peak memory allocated while processing the file in MB, as traced by
+        tracemalloc, so it is per file even when a worker process runs several.
+    """
+    command, fname, outname, options = job
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    t0 = time.perf_counter()
+    try:
+        labels = _run_command(command, fname, options)
+        np.save(outname, _compact_labels(labels))
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+    return fname, outname, time.perf_counter() - t0, peak
+
+
+def _get_parser() -> argparse.ArgumentParser:
+    """Returns the command line argument parser."""
+    parser = argparse.ArgumentParser(
+        prog="python -m skysegmentor",
+        description=(
+            "Partitions Healpix maps (map) or catalogs (points) into equal weight "
+            "regions, or labels the connected groups of maps (groups). Labels are "
+            "written as <name>.<command>.labels.npy in the smallest unsigned "
+            "integer type."
+        ),
+    )
+    parser.add_argument("command", choices=["map", "points", "groups"])
+    parser.add_argument(
+        "files",
+        nargs="+",
+        help=(
+            "Healpix maps (.npy or FITS), or for points catalogs as .npy arrays of "
+            "shape (N, 2) or (N, 3) with columns phi, the and weights, or FITS "
+            "tables."
+        ),
+    )
+    parser.add_argument(
+        "-N", "--npartitions", type=int, help="Number of partitions."
+    )
+    parser.add_argument(
+        "--res",
+        type=int,
+        default=100,
+        help="Longitude resolution of the grid used to find region borders.",
+    )
+    parser.add_argument(
+        "--res-theta",
+        type=int,
+        default=None,
+        help="Latitude resolution of the map border grid, half of --res by default.",
+    )
+    parser.add_argument(
+        "--nsplit", type=int, default=2, help="Maximum pieces per split."
+    )
+    parser.add_argument(
+        "--nside", type=int, default=None, help="Bin catalogs at this nside."
+    )
+    parser.add_argument(
+        "--columns",
+        default="phi,the",
+        help="FITS catalog columns of phi, the and optionally the weights.",
+    )
+    parser.add_argument(
+        "--min-size", type=int, default=0, help="Minimum group size in pixels."
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=None,
+        help="Directory of the label files, next to the inputs by default.",
+    )
+    parser.add_argument(
+        "--result-cache", default=None, help="Result cache directory."
+    )
+    parser.add_argument(
+        "--nworkers", type=int, default=1, help="Number of worker processes."
+    )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Runs the command line interface, reporting the time taken and the peak
+    memory allocated for each file.
+
+    Parameters
+    ----------
+    argv : list, optional
+        Command line arguments, sys.argv[1:] by default.
+    """
+    parser = _get_parser()
+    args = parser.parse_args(argv)
+    if args.command in ["map", "points"] and args.npartitions is None:
+        parser.error("-N/--npartitions is required for map and points.")
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+    options = {
+        "npartitions": args.npartitions,
+        "res": args.res,
+        "res_theta": args.res // 2 if args.res_theta is None else args.res_theta,
+        "nsplit": args.nsplit,
+        "nside": args.nside,
+        "columns": args.columns.split(","),
+        "min_size": args.min_size,
+        "result_cache": args.result_cache,
+    }
+    jobs = [
+        (
+            args.command,
+            fname,
+            _output_name(fname, args.command, args.output_dir),
+            options,
+        )
+        for fname in args.files
+    ]
+    t0 = time.perf_counter()
+    executor = None
+    mapper = map
+    if args.nworkers > 1:
+        executor = ProcessPoolExecutor(max_workers=args.nworkers)
+        mapper = executor.map
+    try:
+        for fname, outname, seconds, peak in mapper(_run_file, jobs):
+            print(
+                "%s: %.2f s, peak memory %.1f MB -> %s"
+                % (fname, seconds, peak, outname)
+            )
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    print("%i files in %.2f s" % (len(jobs), time.perf_counter() - t0))
+
+
+if __name__ == "__main__":
+    main()
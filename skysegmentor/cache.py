@@ -0,0 +1,196 @@
+import os
+import glob
+import hashlib
+import numpy as np
+from importlib import metadata
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+
+_RESULT_CACHE_MAXBYTES = [2**32]
+
+Result = Union[np.ndarray, Tuple[np.ndarray, Dict[str, np.ndarray]]]
+
+
+def set_result_cache_size(maxbytes: int) -> None:
+    """Sets the maximum size of a result cache directory.
+
+    Least recently used results are removed once the results stored in a cache
+    directory exceed maxbytes.
+
+    Parameters
+    ----------
+    maxbytes : int
+        Maximum number of bytes.
+    """
+    _RESULT_CACHE_MAXBYTES[0] = int(maxbytes)
+
+
+def clear_result_cache(cache_dir: str) -> None:
+    """Removes every stored result from a result cache directory.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Result cache directory.
+    """
+    for fname in glob.glob(os.path.join(cache_dir, "*.np[yz]")):
+        os.remove(fname)
+
+
+def _package_version() -> str:
+    """Returns the installed skysegmentor version, so results are not reused
+    across versions."""
+    try:
+        return metadata.version("skysegmentor")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def _hash_inputs(
+    name: str, arrays: List[Optional[np.ndarray]], params: Dict[str, Any]
+) -> str:
+    """Returns the sha256 key of a function call from its input arrays and
+    parameters.
+
+    Parameters
+    ----------
+    name : str
+        Function name.
+    arrays : list
+        Input arrays, or None for inputs that are not given.
+    params : dict
+        Other parameters, hashed by their repr.
+
+    Returns
+    -------
+    key : str
+        Hexadecimal sha256 digest.
+    """
+    sha = hashlib.sha256()
+    header = "%s %s %r" % (name, _package_version(), sorted(params.items()))
+    sha.update(header.encode())
+    for array in arrays:
+        if array is None:
+            sha.update(b"None")
+            continue
+        array = np.ascontiguousarray(array)
+        sha.update(("%s %s" % (array.dtype.str, array.shape)).encode())
+        sha.update(memoryview(array).cast("B"))
+    return sha.hexdigest()
+
+
+def _evict_results(cache_dir: str) -> None:
+    """Removes the least recently used results until the cache directory fits its
+    size.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Result cache directory.
+    """
+    entries = []
+    for fname in glob.glob(os.path.join(cache_dir, "*.npy")):
+        key = fname[:-4]
+        nbytes = os.path.getsize(fname)
+        if os.path.exists(key + ".npz"):
+            nbytes += os.path.getsize(key + ".npz")
+        entries.append((os.path.getmtime(fname), nbytes, key))
+    entries.sort()
+    total = sum(entry[1] for entry in entries)
+    for _, nbytes, key in entries:
+        if total <= _RESULT_CACHE_MAXBYTES[0]:
+            break
+        for fname in [key + ".npy", key + ".npz"]:
+            if os.path.exists(fname):
+                os.remove(fname)
+        total -= nbytes
+
+
+def _load_result(cache_dir: str, key: str) -> Optional[Result]:
+    """Returns a stored result, with the labels memory mapped, or None if it is
+    not stored.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Result cache directory.
+    key : str
+        Result key.
+    """
+    fname = os.path.join(cache_dir, key)
+    if not os.path.exists(fname + ".npy"):
+        return None
+    # Touching the file marks it as recently used.
+    os.utime(fname + ".npy")
+    labels = np.load(fname + ".npy", mmap_mode="r")
+    if not os.path.exists(fname + ".npz"):
+        return labels
+    with np.load(fname + ".npz") as extras:
+        return labels, {name: extras[name] for name in extras.files}
+
+
+def _store_result(cache_dir: str, key: str, result: Result) -> None:
+    """Stores a result, the labels as a .npy file and any dictionary returned with
+    them as a .npz file.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Result cache directory.
+    key : str
+        Result key.
+    result : array or tuple
+        Labels, or labels and a dictionary of arrays.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    fname = os.path.join(cache_dir, key)
+    tmpname = fname + ".%i.tmp" % os.getpid()
+    if isinstance(result, tuple):
+        labels, extras = result
+        np.savez(tmpname + ".npz", **extras)
+        os.replace(tmpname + ".npz", fname + ".npz")
+    else:
+        labels = result
+    # The labels are written last, their presence marks a complete result.
+    np.save(tmpname + ".npy", np.asarray(labels))
+    os.replace(tmpname + ".npy", fname + ".npy")
+    _evict_results(cache_dir)
+
+
+def _cached(
+    cache_dir: Optional[str],
+    name: str,
+    arrays: List[Optional[np.ndarray]],
+    params: Dict[str, Any],
+    compute: Callable[[], Result],
+) -> Result:
+    """Returns a result from the cache directory if it has been stored for the
+    same inputs, otherwise computes and stores it.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Result cache directory, if None the result is always computed.
+    name : str
+        Function name.
+    arrays : list
+        Input arrays.
+    params : dict
+        Other parameters which change the result.
+    compute : callable
+        Computes the result.
+
+    Returns
+    -------
+    result : array or tuple
+        Labels, or labels and a dictionary of arrays. Labels loaded from the
+        cache are read-only memory maps.
+    """
+    if cache_dir is None:
+        return compute()
+    key = _hash_inputs(name, arrays, params)
+    result = _load_result(cache_dir, key)
+    if result is None:
+        result = compute()
+        _store_result(cache_dir, key, result)
+    return result
@@ -1,6 +1,10 @@
 import numpy as np
 import healpy as hp
-from typing import List, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+from . import cache, mask, neighbours
+from .partition import _moments2barycenter, _partition_moments
 
 
 def _cascade(labels: np.ndarray, indexin: int) -> int:
@@ -27,6 +31,10 @@ def _cascade(labels: np.ndarray, indexin: int) -> int:
 def _cascade_all(labels: np.ndarray) -> np.ndarray:
     """Cascade label index for an array.
 
+    Every linked list is followed at once by pointer jumping, repeating
+    labels = labels[labels - 1] until nothing changes, which takes a logarithmic
+    number of passes in the depth of the lists.
+
     Parameters
     ----------
     labels : int array
@@ -38,9 +46,13 @@ def _cascade_all(labels: np.ndarray) -> np.ndarray:
         Cascade all label index in an array.
     """
     labelsout = np.copy(labels)
-    for i in range(0, len(labels)):
-        labelsout[i] = _cascade(labels, labels[i])
-    return labelsout
+    if len(labelsout) == 0:
+        return labelsout
+    while True:
+        _labelsout = labelsout[labelsout - 1]
+        if np.array_equal(_labelsout, labelsout):
+            return labelsout
+        labelsout = _labelsout
 
 
 def _unionise(ind1: int, ind2: int, labels: np.ndarray) -> Tuple[int, int, int]:
@@ -84,19 +96,8 @@ def _shuffle_down(labels: np.ndarray) -> np.ndarray:
     """
     assert np.all(labels > 0)
     labelsout = np.copy(labels)
-    nlabels = np.zeros(len(labels))
-    for i in range(0, len(labels)):
-        nlabels[labels[i] - 1] = nlabels[labels[i] - 1] + 1
-    maplabel = np.zeros(len(labels)).astype("int")
-    j = 0
-    for i in range(0, len(labels)):
-        if nlabels[i] > 0:
-            j = j + 1
-            maplabel[i] = j
-        else:
-            maplabel[i] = 0
-    for i in range(0, len(labels)):
-        labelsout[i] = maplabel[labels[i] - 1]
+    _, inverse = np.unique(labels, return_inverse=True)
+    labelsout[:] = inverse.reshape(-1) + 1
     return labelsout
 
 
@@ -107,45 +108,702 @@ def _if_list_concatenate(arr: List[Union[float, int]]) -> np.ndarray:
     return arr
 
 
-def unionfinder(binmap: np.ndarray) -> np.ndarray:
-    """Group or label assignment on a healpix grid using the HoshenKopelman algorithm.
+def _resolve_equivalences(groupID_equals: List[List[np.ndarray]]) -> np.ndarray:
+    """Resolves the label equivalences found by the HoshenKopelman scan.
 
     Parameters
     ----------
-    binmap : array
-        Binary healpix map.
+    groupID_equals : list
+        For each provisional label, a list of arrays of the labels it touches.
 
     Returns
     -------
-    groupID : array
+    groupID_ind : int array
+        Final compact label for each provisional label.
+    """
+    groupID_equals2 = [
+        np.unique(_if_list_concatenate(_groupID)) for _groupID in groupID_equals
+    ]
+    groupID_ind = np.arange(len(groupID_equals)) + 1
+    groupID_pair1 = []
+    groupID_pair2 = []
+    for i in range(0, len(groupID_equals2)):
+        for j in range(0, len(groupID_equals2[i])):
+            groupID_pair1.append(groupID_ind[i])
+            groupID_pair2.append(groupID_equals2[i][j])
+    groupID_pair1 = np.array(groupID_pair1, dtype=int)
+    groupID_pair2 = np.array(groupID_pair2, dtype=int)
+    # Hook the larger root of every unresolved pair onto the smaller one and
+    # cascade all labels, until each pair shares a root.
+    while len(groupID_pair1) > 0:
+        root1 = groupID_ind[groupID_pair1 - 1]
+        root2 = groupID_ind[groupID_pair2 - 1]
+        cond = np.where(root1 != root2)[0]
+        if len(cond) == 0:
+            break
+        groupID_pair1, groupID_pair2 = groupID_pair1[cond], groupID_pair2[cond]
+        root1, root2 = root1[cond], root2[cond]
+        np.minimum.at(
+            groupID_ind, np.maximum(root1, root2) - 1, np.minimum(root1, root2)
+        )
+        groupID_ind = _cascade_all(groupID_ind)
+    groupID_ind = _shuffle_down(groupID_ind)
+    return groupID_ind
+
+
+def _compact_neighbours(
+    pixels: np.ndarray, neighs: np.ndarray
+) -> np.ndarray:
+    """Maps neighbouring pixel indices to their positions in a sorted pixel list,
+    with -1 for neighbours outside the list.
+
+    Parameters
+    ----------
+    pixels : int array
+        Sorted pixel indices.
+    neighs : int array
+        Neighbouring pixel indices, -1 for missing neighbours.
+
+    Returns
+    -------
+    ind : int array
+        Position of each neighbour in pixels, or -1.
+    """
+    if len(pixels) == 0:
+        return -np.ones(np.shape(neighs), dtype=int)
+    ind = np.clip(np.searchsorted(pixels, neighs), 0, len(pixels) - 1)
+    return np.where((neighs >= 0) & (pixels[ind] == neighs), ind, -1)
+
+
+def _sparse_edges(
+    pixels: np.ndarray, nside: int, chunksize: int = 1000000
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the pairs of neighbouring pixels in a sorted pixel list.
+
+    Neighbours are only found for the listed pixels, chunksize pixels at a time,
+    and mapped to positions in the list with np.searchsorted.
+
+    Parameters
+    ----------
+    pixels : int array
+        Sorted pixel indices.
+    nside : int
+        Healpix nside.
+    chunksize : int, optional
+        Number of pixels processed at once.
+
+    Returns
+    -------
+    edge1, edge2 : int array
+        Positions in the pixel list of each neighbouring pair, with edge1 < edge2.
+    """
+    edge1, edge2 = [], []
+    for start in range(0, len(pixels), chunksize):
+        ind = np.arange(start, min(start + chunksize, len(pixels)))
+        neighs = _compact_neighbours(pixels, hp.get_all_neighbours(nside, pixels[ind]))
+        ind = np.repeat(ind[np.newaxis, :], len(neighs), axis=0)
+        cond = np.where(neighs > ind)
+        edge1.append(ind[cond])
+        edge2.append(neighs[cond])
+    if len(edge1) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    return np.concatenate(edge1), np.concatenate(edge2)
+
+
+def _connected_components(
+    nnodes: int, edge1: np.ndarray, edge2: np.ndarray
+) -> np.ndarray:
+    """Labels the connected components of a graph by hooking roots to the smallest
+    neighbouring root and pointer jumping, vectorised over the edges.
+
+    Parameters
+    ----------
+    nnodes : int
+        Number of nodes.
+    edge1, edge2 : int array
+        Nodes of each edge.
+
+    Returns
+    -------
+    groupID : int array
+        Label of each node, from 1 in order of the first node of each component.
+    """
+    roots = np.arange(nnodes)
+    while True:
+        root1, root2 = roots[edge1], roots[edge2]
+        cond = np.where(root1 != root2)[0]
+        if len(cond) == 0:
+            break
+        edge1, edge2 = edge1[cond], edge2[cond]
+        root1, root2 = root1[cond], root2[cond]
+        np.minimum.at(roots, np.maximum(root1, root2), np.minimum(root1, root2))
+        while True:
+            _roots = roots[roots]
+            if np.array_equal(_roots, roots):
+                break
+            roots = _roots
+    _, groupID = np.unique(roots, return_inverse=True)
+    return groupID.reshape(-1) + 1
+
+
+def unionfinder_sparse(
+    pixels: np.ndarray, nside: int, chunksize: int = 1000000
+) -> np.ndarray:
+    """Group or label assignment of a partial sky footprint given as a sorted list
+    of healpix pixels.
+
+    Neighbours are only found for the footprint pixels and no full sky arrays are
+    allocated, so memory and time scale with the footprint size. Labels match
+    those of unionfinder on the equivalent map.
+
+    Parameters
+    ----------
+    pixels : int array
+        Sorted pixel indices of the footprint.
+    nside : int
+        Healpix nside.
+    chunksize : int, optional
+        Number of pixels whose neighbours are found at once.
+
+    Returns
+    -------
+    groupID : int array
+        Label of each pixel in pixels.
+    """
+    pixels = mask.mask2pixels(pixels, mask_type="pixels", nside=nside)
+    edge1, edge2 = _sparse_edges(pixels, nside, chunksize=chunksize)
+    return _connected_components(len(pixels), edge1, edge2)
+
+
+def _first_order_labels(groupID: np.ndarray) -> np.ndarray:
+    """Relabels groups from 1 in order of their first element.
+
+    Parameters
+    ----------
+    groupID : int array
+        Group labels.
+
+    Returns
+    -------
+    groupID : int array
+        Relabelled groups.
+    """
+    _, first, inverse = np.unique(groupID, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=int)
+    rank[np.argsort(first)] = np.arange(1, len(first) + 1)
+    return rank[inverse.reshape(-1)]
+
+
+def _label_block(
+    args: Tuple[np.ndarray, int, int]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Labels the footprint pixels of one NESTED block and returns the pairs of
+    neighbouring pixels which cross into other blocks.
+
+    Parameters
+    ----------
+    args : tuple
+        Sorted NESTED pixel indices in the block, the Healpix nside and the
+        number of pixels in each block.
+
+    Returns
+    -------
+    groupID : int array
+        Label of each pixel within the block.
+    cross1, cross2 : int array
+        NESTED pixel indices of neighbouring pairs crossing into other blocks,
+        with cross1 < cross2.
+    """
+    pixels, nside, blocksize = args
+    neighs = hp.get_all_neighbours(nside, pixels, nest=True)
+    ind = _compact_neighbours(pixels, neighs)
+    rows = np.repeat(np.arange(len(pixels))[np.newaxis, :], len(neighs), axis=0)
+    cond = np.where(ind > rows)
+    groupID = _connected_components(len(pixels), rows[cond], ind[cond])
+    if len(pixels) > 0:
+        block = pixels[0] // blocksize
+    else:
+        block = -1
+    cond = np.where(
+        (neighs >= 0) & (neighs // blocksize != block) & (neighs > pixels[rows])
+    )
+    return groupID, pixels[rows[cond]], neighs[cond]
+
+
+def _unionfinder_blocks(
+    pixels: np.ndarray, nside: int, nblocks: int = 12, nworkers: int = 1
+) -> np.ndarray:
+    """Labels a footprint by labelling each NESTED block separately, on a pool of
+    worker processes, and merging the labels across block boundaries.
+
+    Parameters
+    ----------
+    pixels : int array
+        Sorted RING pixel indices of the footprint.
+    nside : int
+        Healpix nside.
+    nblocks : int, optional
+        Number of NESTED blocks, 12 times a power of 4.
+    nworkers : int, optional
+        Number of worker processes.
+
+    Returns
+    -------
+    groupID : int array
+        Label of each pixel in pixels, matching unionfinder_sparse.
+    """
+    npix = hp.nside2npix(nside)
+    nsub = nblocks // 12
+    if (
+        nblocks % 12 != 0
+        or nsub < 1
+        or (nsub & (nsub - 1)) != 0
+        or (nsub.bit_length() - 1) % 2 != 0
+        or nblocks > npix
+    ):
+        raise ValueError("nblocks must be 12 times a power of 4, at most npix.")
+    blocksize = npix // nblocks
+    if len(pixels) == 0:
+        return np.zeros(0, dtype=int)
+
+    nest = hp.ring2nest(nside, pixels)
+    order = np.argsort(nest)
+    nest = nest[order]
+    edges = np.searchsorted(nest, np.arange(nblocks + 1) * blocksize)
+    tasks = [
+        (nest[edges[i] : edges[i + 1]], nside, blocksize)
+        for i in range(nblocks)
+        if edges[i + 1] > edges[i]
+    ]
+    if nworkers > 1:
+        with ProcessPoolExecutor(max_workers=nworkers) as executor:
+            results = list(executor.map(_label_block, tasks))
+    else:
+        results = list(map(_label_block, tasks))
+
+    # Provisional labels are unique across blocks, starting from zero.
+    offsets = np.cumsum([0] + [np.max(result[0]) for result in results])
+    provisional = np.concatenate(
+        [result[0] - 1 + offset for result, offset in zip(results, offsets)]
+    )
+    cross1 = _compact_neighbours(nest, np.concatenate([r[1] for r in results]))
+    cross2 = _compact_neighbours(nest, np.concatenate([r[2] for r in results]))
+    cond = np.where(cross2 >= 0)[0]
+    merged = _connected_components(
+        offsets[-1], provisional[cross1[cond]], provisional[cross2[cond]]
+    )
+    groupID = np.zeros(len(pixels), dtype=int)
+    groupID[order] = merged[provisional]
+    return _first_order_labels(groupID)
+
+
+def _find_roots(parent: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """Follows an equivalence table to the root of each label.
+
+    Parameters
+    ----------
+    parent : int array
+        Equivalence table, where parent[label] <= label and roots point to
+        themselves.
+    labels : int array
+        Labels.
+
+    Returns
+    -------
+    roots : int array
+        Root of each label.
+    """
+    roots = parent[labels]
+    while True:
+        _roots = parent[roots]
+        if np.array_equal(_roots, roots):
+            return roots
+        roots = _roots
+
+
+def _ring_edges(
+    nside: int,
+    pixels: np.ndarray,
+    nodes: np.ndarray,
+    start: int,
+    inring: np.ndarray,
+    offset: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the pairs of neighbouring pixels between a set of pixels and the
+    footprint pixels of a single ring.
+
+    Parameters
+    ----------
+    nside : int
+        Healpix nside.
+    pixels : int array
+        RING pixel indices.
+    nodes : int array
+        Node index of each of pixels.
+    start : int
+        First pixel of the ring.
+    inring : bool array
+        Footprint membership of each pixel in the ring.
+    offset : int
+        Node index of the first pixel of the ring.
+
+    Returns
+    -------
+    edge1, edge2 : int array
+        Node indices of each neighbouring pair.
+    """
+    neighs = hp.get_all_neighbours(nside, pixels) - start
+    nodes = np.repeat(nodes[np.newaxis, :], len(neighs), axis=0)
+    cond = (neighs >= 0) & (neighs < len(inring))
+    cond[cond] = inring[neighs[cond]]
+    return nodes[cond], offset + neighs[cond]
+
+
+def unionfinder_rings(
+    binmap: Union[str, np.ndarray], output: Optional[Union[str, np.ndarray]] = None
+) -> np.ndarray:
+    """Group or label assignment on a healpix grid streamed one iso-latitude ring
+    at a time, for RING maps too large to hold in memory.
+
+    As in the classic HoshenKopelman algorithm, only the labels of the current
+    and previous two rings (diagonal neighbours near the poles can be two rings
+    apart) and the table of label equivalences are kept. Provisional
+    labels are written to the output as each ring is scanned and replaced by the
+    final labels in a second streamed pass, so peak memory is a few rings plus the
+    equivalence table. Labels match those of unionfinder.
+
+    Parameters
+    ----------
+    binmap : str or array
+        Binary healpix map in RING ordering, or a path to a .npy file which is
+        memory mapped.
+    output : str or int array, optional
+        Output array, or a path to a .npy file which is created as a memory map.
+
+    Returns
+    -------
+    groupID : int array
         Labelled healpix map.
     """
+    if isinstance(binmap, str):
+        binmap = np.load(binmap, mmap_mode="r")
+    npix = len(binmap)
+    nside = hp.npix2nside(npix)
+    if output is None:
+        groupID = np.zeros(npix, dtype=int)
+    elif isinstance(output, str):
+        groupID = np.lib.format.open_memmap(output, mode="w+", dtype=int, shape=(npix,))
+    else:
+        groupID = output
+    startpix, ringpix = hp.ringinfo(nside, np.arange(1, 4 * nside))[:2]
+
+    parent = np.zeros(1024, dtype=int)
+    nlabels = 0
+    # Diagonal neighbours in the polar caps can lie two rings away, so the last
+    # two rings are kept.
+    window = []
+    for start, nring in zip(startpix, ringpix):
+        inring = np.asarray(binmap[start : start + nring]) == 1
+        pixels = start + np.nonzero(inring)[0]
+        # Nodes are the pixels of the previous rings followed by the current ring.
+        offsets = np.cumsum([0] + [len(prev[1]) for prev in window])
+        nodes = offsets[-1] + pixels - start
+        edges = [_ring_edges(nside, pixels, nodes, start, inring, offsets[-1])]
+        prev_nodes, prev_labels = [], []
+        for (prev_start, prev_inring, _prev_labels), offset in zip(window, offsets):
+            _prev_nodes = np.nonzero(prev_inring)[0]
+            edges.append(
+                _ring_edges(nside, pixels, nodes, prev_start, prev_inring, offset)
+            )
+            edges.append(
+                _ring_edges(
+                    nside,
+                    prev_start + _prev_nodes,
+                    offset + _prev_nodes,
+                    start,
+                    inring,
+                    offsets[-1],
+                )
+            )
+            prev_nodes.append(offset + _prev_nodes)
+            prev_labels.append(_prev_labels[_prev_nodes])
+        edge1 = np.concatenate([edge[0] for edge in edges])
+        edge2 = np.concatenate([edge[1] for edge in edges])
+        comp = _connected_components(offsets[-1] + nring, edge1, edge2)
+        labels = np.zeros(nring, dtype=int)
+        if len(pixels) > 0:
+            cur_comp = comp[nodes]
+            cmin = np.full(np.max(comp) + 1, np.iinfo(int).max)
+            if len(prev_nodes) > 0:
+                prev_comp = comp[np.concatenate(prev_nodes)]
+                prev_roots = _find_roots(parent, np.concatenate(prev_labels))
+                # Two components of the window can be joined by a root reaching
+                # beyond it, so components and roots are merged transitively.
+                roots, rootind = np.unique(prev_roots, return_inverse=True)
+                ncomp = len(cmin)
+                merged = _connected_components(
+                    ncomp + len(roots), prev_comp, ncomp + rootind.reshape(-1)
+                )
+                mmin = np.full(np.max(merged) + 1, np.iinfo(int).max)
+                np.minimum.at(mmin, merged[ncomp:], roots)
+                parent[roots] = mmin[merged[ncomp:]]
+                cmin = mmin[merged[:ncomp]]
+            _labels = cmin[cur_comp]
+            new = _labels == np.iinfo(int).max
+            newcomps, inverse = np.unique(cur_comp[new], return_inverse=True)
+            newlabels = nlabels + 1 + np.arange(len(newcomps))
+            nlabels += len(newcomps)
+            if nlabels + 1 > len(parent):
+                parent = np.concatenate(
+                    [parent, np.zeros(max(len(parent), nlabels + 1), dtype=int)]
+                )
+            parent[newlabels] = newlabels
+            _labels[new] = newlabels[inverse.reshape(-1)]
+            labels[pixels - start] = _labels
+        groupID[start : start + nring] = labels
+        window = (window + [(start, inring, labels)])[-2:]
+
+    roots = _find_roots(parent[: nlabels + 1], np.arange(nlabels + 1))
+    final = np.zeros(nlabels + 1, dtype=int)
+    final[1:] = np.unique(roots[1:], return_inverse=True)[1].reshape(-1) + 1
+    for start, nring in zip(startpix, ringpix):
+        groupID[start : start + nring] = final[groupID[start : start + nring]]
+    if isinstance(output, str):
+        groupID.flush()
+    return groupID
+
+
+def _drop_small_groups(sizes: np.ndarray, min_size: int) -> np.ndarray:
+    """Returns the relabelling which removes groups smaller than min_size and
+    renumbers the remaining groups in order.
+
+    Parameters
+    ----------
+    sizes : int array
+        Number of pixels of groups 1 to len(sizes).
+    min_size : int
+        Minimum number of pixels of a group.
+
+    Returns
+    -------
+    relabel : int array
+        New label of groups 0 to len(sizes), zero for removed groups.
+    """
+    keep = np.concatenate([[False], np.asarray(sizes) >= min_size])
+    return np.where(keep, np.cumsum(keep), 0)
+
+
+def _label_moments(
+    labels: np.ndarray,
+    pixels: np.ndarray,
+    nside: int,
+    weights: np.ndarray,
+    nlabels: int,
+) -> np.ndarray:
+    """Returns the weighted moments of provisional labels, before they are
+    relabelled into the final groups.
+
+    Parameters
+    ----------
+    labels : int array
+        Provisional label of each pixel, from 1 to nlabels.
+    pixels : int array
+        Healpix pixel indices in RING ordering.
+    nside : int
+        Healpix nside.
+    weights : array
+        Weight of each pixel.
+    nlabels : int
+        Number of provisional labels.
+
+    Returns
+    -------
+    moments : array
+        Moments of labels 1 to nlabels, shape (nlabels, 4), see
+        _partition_moments.
+    """
+    x, y, z = hp.pix2vec(nside, pixels)
+    return _partition_moments(labels, x, y, z, weights, nlabels)
+
+
+def _group_stats(
+    relabel: np.ndarray,
+    counts: np.ndarray,
+    moments: np.ndarray,
+    Ngroups: int,
+) -> Dict[str, np.ndarray]:
+    """Returns the pixel counts, summed weights and weighted barycenters of
+    labelled groups, by folding the counts and moments of the provisional labels
+    through the relabelling to the final groups, as for the group sizes.
+
+    Parameters
+    ----------
+    relabel : int array
+        Final group of provisional labels 1 to len(relabel), zero for removed
+        groups.
+    counts : int array
+        Number of pixels of each provisional label.
+    moments : array
+        Moments of each provisional label, shape (len(relabel), 4).
+    Ngroups : int
+        Number of groups.
+
+    Returns
+    -------
+    stats : dict
+        Arrays 'counts', 'weights', 'phi' and 'the' for groups 1 to Ngroups.
+    """
+    group_moments = np.zeros((Ngroups, 4))
+    for i in range(0, 4):
+        group_moments[:, i] = np.bincount(
+            relabel, weights=moments[:, i], minlength=Ngroups + 1
+        )[1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        phic, thec = _moments2barycenter(group_moments.T)
+    counts = np.bincount(relabel, weights=counts, minlength=Ngroups + 1)[1:]
+    stats = {
+        "counts": counts.astype(int),
+        "weights": group_moments[:, 3],
+        "phi": np.asarray(phic),
+        "the": np.asarray(thec),
+    }
+    return stats
+
+
+def unionfinder(
+    binmap: np.ndarray,
+    mask_type: str = "map",
+    nside: Optional[int] = None,
+    nworkers: int = 1,
+    nblocks: int = 12,
+    cache_dir: Optional[str] = None,
+    min_size: int = 0,
+    weights: Optional[np.ndarray] = None,
+    return_stats: bool = False,
+    result_cache: Optional[str] = None,
+) -> Union[np.ndarray, Tuple[np.ndarray, Dict[str, np.ndarray]]]:
     """Group or label assignment on a healpix grid using the HoshenKopelman algorithm.
 
     Parameters
     ----------
     binmap : array
-        Binary healpix map.
+        Binary healpix map, or for mask_type 'packed' a bit-packed mask (see
+        pack_mask) and for 'pixels' a sorted list of pixel indices.
+    mask_type : str, optional
+        Mask type, either 'map', 'packed' or 'pixels'. Packed and pixel list masks
+        are labelled with unionfinder_sparse, without expanding them to a full sky
+        map.
+    nside : int, optional
+        Healpix nside, needed for 'packed' and 'pixels' masks.
+    nworkers : int, optional
+        If > 1, the footprint is split into nblocks NESTED blocks (the 12 base
+        faces by default) which are labelled on separate worker processes, and
+        labels are merged with a small union-find over the pixel pairs crossing
+        block boundaries.
+    nblocks : int, optional
+        Number of NESTED blocks used when nworkers > 1, 12 times a power of 4.
+    cache_dir : str, optional
+        Directory where the neighbour table of a 'map' is persisted, see
+        get_neighbour_table.
+    min_size : int, optional
+        Groups with fewer pixels are removed (set to zero) before the groups are
+        relabelled.
+    weights : array, optional
+        Weight of each pixel, a healpix map for 'map' masks and otherwise one
+        weight per pixel in the sorted pixel list. Unit weights if not given.
+    return_stats : bool, optional
+        If True the pixel counts, summed weights and weighted barycenters of the
+        groups are also returned.
+    result_cache : str, optional
+        Directory of a result cache. Results are stored under a sha256 hash of
+        the inputs and parameters, and later calls with the same inputs memory
+        map the stored labels instead of recomputing them.
 
     Returns
     -------
     groupID : array
-        Labelled healpix map.
+        Labelled healpix map, or for 'packed' and 'pixels' masks the label of each
+        pixel in the sorted pixel list of the mask.
+    stats : dict
+        Only returned if return_stats is True, the arrays 'counts', 'weights',
+        'phi' and 'the' (weighted barycenter) of groups 1 to max(groupID).
     """
-    nside = hp.npix2nside(len(binmap))
+    mask._check_mask_type(mask_type)
+    if result_cache is not None:
+        params = {
+            "mask_type": mask_type,
+            "nside": nside,
+            "min_size": min_size,
+            "return_stats": return_stats,
+        }
+        return cache._cached(
+            result_cache,
+            "unionfinder",
+            [binmap, weights],
+            params,
+            lambda: unionfinder(
+                binmap,
+                nworkers=nworkers,
+                nblocks=nblocks,
+                cache_dir=cache_dir,
+                weights=weights,
+                **params,
+            ),
+        )
+    if mask_type == "map":
+        nside = hp.npix2nside(len(binmap))
+        if nworkers > 1:
+            pixels = np.where(np.asarray(binmap) == 1)[0]
+    else:
+        pixels = mask.mask2pixels(binmap, mask_type=mask_type, nside=nside)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=float)
+    if nworkers > 1 or mask_type != "map":
+        if nworkers > 1:
+            groupID = _unionfinder_blocks(
+                pixels, nside, nblocks=nblocks, nworkers=nworkers
+            )
+        else:
+            groupID = unionfinder_sparse(pixels, nside)
+        nlabels = int(np.max(groupID)) if len(groupID) > 0 else 0
+        relabel = np.arange(nlabels + 1)
+        if min_size > 0 or return_stats:
+            sizes = np.bincount(groupID, minlength=nlabels + 1)[1:]
+        if return_stats:
+            if weights is None:
+                weights = np.ones(len(pixels))
+            elif mask_type == "map":
+                weights = weights[pixels]
+            moments = _label_moments(groupID, pixels, nside, weights, nlabels)
+        if min_size > 0:
+            relabel = _drop_small_groups(sizes, min_size)
+            groupID = relabel[groupID]
+        if mask_type == "map":
+            groupmap = np.zeros(len(binmap), dtype=int)
+            groupmap[pixels] = groupID
+        else:
+            groupmap = groupID
+        if not return_stats:
+            return groupmap
+        Ngroups = int(np.max(relabel))
+        return groupmap, _group_stats(relabel[1:], sizes, moments, Ngroups)
     groupID = np.zeros(hp.nside2npix(nside))
     groupID = groupID.astype("int")
     cond = np.where(binmap == 1)[0]
     groupID[cond] = -1
     groupID_equals = []
     currentID = 0
-    for i in range(0, len(binmap)):
-        if binmap[i] == 1 and groupID[i] == -1:
+    footprint_neighs = neighbours.get_footprint_neighbours(
+        nside, cond, cache_dir=cache_dir
+    )
+    # Only footprint pixels are labelled, so the loop skips every other pixel.
+    for j, i in enumerate(cond):
+        if groupID[i] == -1:
             currentID += 1
             groupID[i] = currentID
             groupID_equals.append([])
         if groupID[i] != 0:
-            neighs = hp.get_all_neighbours(nside, i)
+            neighs = footprint_neighs[:, j]
             neighs = neighs[neighs != -1]
             neighs = neighs[groupID[neighs] != 0]
             if len(neighs) > 0:
@@ -153,30 +811,22 @@ def unionfinder(binmap: np.ndarray) -> np.ndarray:
                 neighs = neighs[groupID[neighs] != groupID[i]]
             if len(neighs) > 0:
                 groupID_equals[groupID[i] - 1].append(np.unique(groupID[neighs]))
-    groupID_equals2 = [
-        np.unique(_if_list_concatenate(_groupID)) for _groupID in groupID_equals
-    ]
-    groupID_ind = np.arange(len(groupID_equals)) + 1
-    groupID_pair1 = []
-    groupID_pair2 = []
-    for i in range(0, len(groupID_equals2)):
-        for j in range(0, len(groupID_equals2[i])):
-            groupID_pair1.append(groupID_ind[i])
-            groupID_pair2.append(groupID_equals2[i][j])
-    groupID_pair1 = np.array(groupID_pair1)
-    groupID_pair2 = np.array(groupID_pair2)
-    cond = np.where(groupID_pair1 > groupID_pair2)[0]
-    temp = groupID_pair2[cond]
-    groupID_pair2[cond] = groupID_pair1[cond]
-    groupID_pair1[cond] = temp
-    for i in range(0, len(groupID_pair1)):
-        ind1out, ind2out, indout = _unionise(
-            groupID_pair1[i], groupID_pair2[i], groupID_ind
-        )
-        groupID_ind[ind1out - 1] = indout
-        groupID_ind[ind2out - 1] = indout
-    groupID_ind = _cascade_all(groupID_ind)
-    groupID_ind = _shuffle_down(groupID_ind)
+    groupID_ind = _resolve_equivalences(groupID_equals)
     cond = np.where(groupID != 0)[0]
+    # Sizes and moments of the provisional labels, which are folded into those
+    # of the resolved groups, so small groups are dropped and the statistics are
+    # found within the final relabel.
+    if min_size > 0 or return_stats:
+        sizes = np.bincount(groupID[cond], minlength=currentID + 1)[1:]
+    if return_stats:
+        if weights is None:
+            weights = np.ones(len(binmap))
+        moments = _label_moments(groupID[cond], cond, nside, weights[cond], currentID)
+    if min_size > 0 and len(groupID_ind) > 0:
+        group_sizes = np.bincount(groupID_ind, weights=sizes)[1:]
+        groupID_ind = _drop_small_groups(group_sizes, min_size)[groupID_ind]
     groupID[cond] = groupID_ind[groupID[cond] - 1]
-    return groupID
+    if not return_stats:
+        return groupID
+    Ngroups = int(np.max(groupID_ind)) if len(groupID_ind) > 0 else 0
+    return groupID, _group_stats(groupID_ind, sizes, moments, Ngroups)
@@ -0,0 +1,103 @@
+import numpy as np
+import healpy as hp
+from typing import Optional
+
+
+def _check_mask_type(mask_type: str) -> None:
+    """Checks the mask type is supported.
+
+    Parameters
+    ----------
+    mask_type : str
+        Mask type, either 'map', 'packed' or 'pixels'.
+    """
+    if mask_type not in ["map", "packed", "pixels"]:
+        raise ValueError("mask_type must be either 'map', 'packed' or 'pixels'.")
+
+
+def pack_mask(binmap: np.ndarray) -> np.ndarray:
+    """Packs a binary Healpix map into bits, using the np.packbits layout.
+
+    Parameters
+    ----------
+    binmap : array
+        Binary healpix map.
+
+    Returns
+    -------
+    packed : uint8 array
+        Bit-packed mask, with one bit per pixel.
+    """
+    return np.packbits(np.asarray(binmap) != 0)
+
+
+def packed2pixels(
+    packed: np.ndarray, nside: int, chunksize: int = 1000000
+) -> np.ndarray:
+    """Returns the sorted pixel indices of a bit-packed mask.
+
+    The mask is unpacked chunksize bytes at a time, so the dense mask is never
+    expanded in memory.
+
+    Parameters
+    ----------
+    packed : uint8 array
+        Bit-packed mask, see pack_mask.
+    nside : int
+        Healpix nside of the mask.
+    chunksize : int, optional
+        Number of bytes unpacked at once.
+
+    Returns
+    -------
+    pixels : int array
+        Sorted pixel indices inside the mask.
+    """
+    npix = hp.nside2npix(nside)
+    if len(packed) != (npix + 7) // 8:
+        raise ValueError("Packed mask length does not match nside.")
+    pixels = []
+    for start in range(0, len(packed), chunksize):
+        bits = np.unpackbits(packed[start : start + chunksize])
+        pixels.append(8 * start + np.nonzero(bits)[0])
+    pixels = np.concatenate(pixels)
+    return pixels[pixels < npix]
+
+
+def mask2pixels(
+    mask: np.ndarray,
+    mask_type: str = "map",
+    nside: Optional[int] = None,
+) -> np.ndarray:
+    """Returns the sorted pixel indices inside a mask given as a Healpix map, a
+    bit-packed mask or a sorted pixel list.
+
+    Parameters
+    ----------
+    mask : array
+        Binary healpix map, bit-packed mask (see pack_mask) or sorted pixel
+        indices.
+    mask_type : str, optional
+        Mask type, either 'map', 'packed' or 'pixels'.
+    nside : int, optional
+        Healpix nside, needed for 'packed' and 'pixels' masks.
+
+    Returns
+    -------
+    pixels : int array
+        Sorted pixel indices inside the mask.
+    """
+    _check_mask_type(mask_type)
+    if mask_type == "map":
+        return np.nonzero(mask)[0]
+    if nside is None:
+        raise ValueError("nside must be given for 'packed' and 'pixels' masks.")
+    if mask_type == "packed":
+        return packed2pixels(mask, nside)
+    pixels = np.asarray(mask, dtype=int)
+    if len(pixels) > 0:
+        if np.any(np.diff(pixels) <= 0):
+            raise ValueError("Pixel list must be sorted and unique.")
+        if pixels[0] < 0 or pixels[-1] >= hp.nside2npix(nside):
+            raise ValueError("Pixel list contains pixels outside the map.")
+    return pixels
@@ -79,3 +79,45 @@ def matrix_dot_3by3(mat1: np.ndarray, mat2: np.ndarray) -> np.ndarray:
         ]
     )
     return mat3
+
+
+def vector_normalise(a: np.ndarray) -> np.ndarray:
+    """Returns a vector divided by its magnitude.
+
+    Parameters
+    ----------
+    a : array
+        Vector a.
+
+    Returns
+    -------
+    ahat : array
+        Unit vector in the direction of a.
+    """
+    return np.asarray(a, dtype=float) / vector_norm(a)
+
+
+def pseudo_angle(y: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """Returns a trig-free pseudo-angle which increases monotonically with the
+    polar angle arctan2(y, x) taken in the range [0, 2pi).
+
+    The pseudo-angle lies in the range [0, 4), where each quadrant spans a unit
+    interval, so it can be used in place of the angle for sorting and
+    thresholding without evaluating any inverse trigonometric functions.
+
+    Parameters
+    ----------
+    y, x : array
+        Planar coordinates.
+
+    Returns
+    -------
+    p : array
+        Pseudo-angle in the range [0, 4).
+    """
+    y = np.asarray(y, dtype=float)
+    x = np.asarray(x, dtype=float)
+    norm = np.abs(x) + np.abs(y)
+    r = np.divide(y, norm, out=np.zeros(np.shape(norm)), where=norm != 0.0)
+    p = np.where(x < 0.0, 2.0 - r, np.where(y < 0.0, 4.0 + r, r))
+    return p
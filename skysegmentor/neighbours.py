@@ -0,0 +1,187 @@
+import os
+import numpy as np
+import healpy as hp
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+_NEIGHBOUR_CACHE: "OrderedDict[Tuple[int, bool], np.ndarray]" = OrderedDict()
+_NEIGHBOUR_CACHE_MAXBYTES = [2**30]
+
+
+def set_neighbour_cache_size(maxbytes: int) -> None:
+    """Sets the maximum size of the in-process neighbour table cache.
+
+    Least recently used tables are evicted once the tables held in memory exceed
+    maxbytes. Memory mapped tables are not counted.
+
+    Parameters
+    ----------
+    maxbytes : int
+        Maximum number of bytes.
+    """
+    _NEIGHBOUR_CACHE_MAXBYTES[0] = int(maxbytes)
+    _evict_neighbour_tables()
+
+
+def clear_neighbour_cache() -> None:
+    """Removes every table from the in-process neighbour table cache."""
+    _NEIGHBOUR_CACHE.clear()
+
+
+def _cache_nbytes() -> int:
+    """Returns the number of bytes of the in-memory cached tables."""
+    return sum(
+        table.nbytes
+        for table in _NEIGHBOUR_CACHE.values()
+        if not isinstance(table, np.memmap)
+    )
+
+
+def _evict_neighbour_tables() -> None:
+    """Evicts the least recently used tables until the cache fits its size."""
+    while len(_NEIGHBOUR_CACHE) > 0 and _cache_nbytes() > _NEIGHBOUR_CACHE_MAXBYTES[0]:
+        _NEIGHBOUR_CACHE.popitem(last=False)
+
+
+def _neighbour_table_dtype(nside: int) -> type:
+    """Returns the smallest integer type which can hold every pixel index."""
+    if hp.nside2npix(nside) < 2**31:
+        return np.int32
+    return np.int64
+
+
+def _fill_neighbour_table(
+    table: np.ndarray, nside: int, nest: bool = False, chunksize: int = 1000000
+) -> None:
+    """Fills a neighbour table with batched calls to hp.get_all_neighbours.
+
+    Parameters
+    ----------
+    table : int array
+        Table of shape (8, npix), filled in place.
+    nside : int
+        Healpix nside.
+    nest : bool, optional
+        If True the table is in NESTED ordering, otherwise RING.
+    chunksize : int, optional
+        Number of pixels processed at once.
+    """
+    npix = hp.nside2npix(nside)
+    for start in range(0, npix, chunksize):
+        pix = np.arange(start, min(start + chunksize, npix))
+        table[:, start : start + len(pix)] = hp.get_all_neighbours(
+            nside, pix, nest=nest
+        )
+
+
+def _table_fname(cache_dir: str, nside: int, nest: bool) -> str:
+    """Returns the file name of a neighbour table persisted in cache_dir."""
+    ordering = "nest" if nest else "ring"
+    return os.path.join(cache_dir, "neighbours_nside%i_%s.npy" % (nside, ordering))
+
+
+def get_neighbour_table(
+    nside: int, nest: bool = False, cache_dir: Optional[str] = None
+) -> np.ndarray:
+    """Returns the table of the 8 neighbours of every Healpix pixel.
+
+    Tables are built once with batched calls to hp.get_all_neighbours and kept in
+    an in-process cache, which evicts the least recently used tables (see
+    set_neighbour_cache_size). If cache_dir is given the table is also stored
+    there as a .npy file and memory mapped, so later calls, including from other
+    processes, start from the table on disk.
+
+    Parameters
+    ----------
+    nside : int
+        Healpix nside.
+    nest : bool, optional
+        If True the table is in NESTED ordering, otherwise RING.
+    cache_dir : str, optional
+        Directory where the table is persisted.
+
+    Returns
+    -------
+    table : int array
+        Neighbour pixel indices of shape (8, npix), with -1 where a pixel has no
+        neighbour in that direction. Tables are int32 when every pixel index
+        fits, and are read-only.
+    """
+    key = (int(nside), bool(nest))
+    if cache_dir is not None:
+        fname = _table_fname(cache_dir, nside, nest)
+    if key in _NEIGHBOUR_CACHE and (cache_dir is None or os.path.exists(fname)):
+        _NEIGHBOUR_CACHE.move_to_end(key)
+        return _NEIGHBOUR_CACHE[key]
+    npix = hp.nside2npix(nside)
+    dtype = _neighbour_table_dtype(nside)
+    if cache_dir is not None:
+        if not os.path.exists(fname):
+            os.makedirs(cache_dir, exist_ok=True)
+            tmpname = fname + ".%i.tmp.npy" % os.getpid()
+            table = np.lib.format.open_memmap(
+                tmpname, mode="w+", dtype=dtype, shape=(8, npix)
+            )
+            _fill_neighbour_table(table, nside, nest=nest)
+            table.flush()
+            del table
+            os.replace(tmpname, fname)
+        table = np.load(fname, mmap_mode="r")
+    else:
+        table = np.empty((8, npix), dtype=dtype)
+        _fill_neighbour_table(table, nside, nest=nest)
+        # The table is shared by every caller, so it must not be modified.
+        table.flags.writeable = False
+    _NEIGHBOUR_CACHE[key] = table
+    _evict_neighbour_tables()
+    return table
+
+
+def get_footprint_neighbours(
+    nside: int,
+    pixels: np.ndarray,
+    nest: bool = False,
+    cache_dir: Optional[str] = None,
+    chunksize: int = 1000000,
+) -> np.ndarray:
+    """Returns the 8 neighbours of every pixel of a footprint.
+
+    The neighbours are read from the neighbour table (see get_neighbour_table) if
+    it is already cached or the footprint covers at least an eighth of the sky.
+    Otherwise they are found with batched calls to hp.get_all_neighbours, so a
+    small footprint does not build the full sky table.
+
+    Parameters
+    ----------
+    nside : int
+        Healpix nside.
+    pixels : int array
+        Pixel indices of the footprint.
+    nest : bool, optional
+        If True the pixels are in NESTED ordering, otherwise RING.
+    cache_dir : str, optional
+        Directory where the neighbour table is persisted.
+    chunksize : int, optional
+        Number of pixels processed at once.
+
+    Returns
+    -------
+    neighs : int array
+        Neighbour pixel indices of shape (8, len(pixels)), with -1 where a pixel
+        has no neighbour in that direction.
+    """
+    pixels = np.asarray(pixels, dtype=int)
+    cached = (int(nside), bool(nest)) in _NEIGHBOUR_CACHE
+    if cache_dir is not None:
+        cached = cached or os.path.exists(_table_fname(cache_dir, nside, nest))
+    if cached or 8 * len(pixels) >= hp.nside2npix(nside):
+        table = get_neighbour_table(nside, nest=nest, cache_dir=cache_dir)
+        return table[:, pixels]
+    neighs = np.empty((8, len(pixels)), dtype=_neighbour_table_dtype(nside))
+    for start in range(0, len(pixels), chunksize):
+        pix = pixels[start : start + chunksize]
+        neighs[:, start : start + len(pix)] = hp.get_all_neighbours(
+            nside, pix, nest=nest
+        )
+    return neighs
@@ -1,8 +1,18 @@
+import os
+import time
 import numpy as np
 import healpy as hp
-from typing import List, Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Tuple, Optional, Union
 
-from . import coords, rotate
+from . import cache, coords, mask, maths, rotate, sketch
+from .tree import (
+    _coarsen_mapping,
+    _new_tree,
+    _record_split,
+    apply_partition_tree,
+    get_tree_levels,
+)
 
 
 def get_partition_IDs(partition: np.ndarray) -> np.ndarray:
@@ -78,8 +88,182 @@ def fill_map(pixID: np.ndarray, nside: int, val: float = 1.0) -> np.ndarray:
     return tmap
 
 
+def assign_points_to_partitionmap(
+    phi: np.ndarray,
+    the: np.ndarray,
+    partitionmap: np.ndarray,
+    output: Optional[Union[str, np.ndarray]] = None,
+    chunksize: int = 1000000,
+    nthreads: Optional[int] = None,
+    dtype: type = int,
+) -> np.ndarray:
+    """Labels points with the partition ID of the Healpix pixel they fall in.
+
+    The points are processed in chunks on a thread pool, so the pixel indices are
+    never held for the full catalog, and labels are written into a preallocated
+    integer output.
+
+    Parameters
+    ----------
+    phi, the : array
+        Angular positions.
+    partitionmap : array
+        Partitioned map IDs, in RING ordering.
+    output : str or int array, optional
+        Preallocated output array, or a path to a .npy file which is created as a
+        memory map and written through chunk by chunk.
+    chunksize : int, optional
+        Number of points labelled at once by each thread.
+    nthreads : int, optional
+        Number of threads, by default chosen by ThreadPoolExecutor.
+    dtype : type, optional
+        Integer type of the output, if it is created.
+
+    Returns
+    -------
+    partitionID : int array
+        Partition IDs of the points, zero outside the partitioned map.
+    """
+    if len(phi) != len(the):
+        raise ValueError("phi and the must have the same length.")
+    nside = hp.npix2nside(len(partitionmap))
+    if output is None:
+        partitionID = np.empty(len(phi), dtype=dtype)
+    elif isinstance(output, str):
+        partitionID = np.lib.format.open_memmap(
+            output, mode="w+", dtype=dtype, shape=(len(phi),)
+        )
+    else:
+        if len(output) != len(phi):
+            raise ValueError("output must be the same length as phi and the.")
+        partitionID = output
+
+    def _assign(start):
+        chunk = slice(start, min(start + chunksize, len(phi)))
+        pix = hp.ang2pix(nside, the[chunk], phi[chunk])
+        partitionID[chunk] = partitionmap[pix]
+
+    with ThreadPoolExecutor(max_workers=nthreads) as executor:
+        list(executor.map(_assign, range(0, len(phi), chunksize)))
+
+    if isinstance(output, str):
+        partitionID.flush()
+    return partitionID
+
+
+def _get_moments(
+    x: np.ndarray, y: np.ndarray, z: np.ndarray, weights: np.ndarray
+) -> np.ndarray:
+    """Returns the weighted first moments of a set of unit vectors.
+
+    Parameters
+    ----------
+    x, y, z : array
+        Unit vector coordinates.
+    weights : array
+        Weights for each unit vector.
+
+    Returns
+    -------
+    moments : array
+        The moments [sum(w*x), sum(w*y), sum(w*z), sum(w)].
+    """
+    return np.array(
+        [np.sum(weights * x), np.sum(weights * y), np.sum(weights * z), np.sum(weights)]
+    )
+
+
+def _moments2barycenter(moments: np.ndarray) -> Tuple[float, float]:
+    """Converts weighted first moments into a barycenter direction.
+
+    Parameters
+    ----------
+    moments : array
+        The moments [sum(w*x), sum(w*y), sum(w*z), sum(w)].
+
+    Returns
+    -------
+    phic, thec : float
+        The center
+    """
+    xc = moments[0] / moments[3]
+    yc = moments[1] / moments[3]
+    zc = moments[2] / moments[3]
+    _, phic, thec = coords.cart2sphere(xc, yc, zc)
+    return phic, thec
+
+
+def _get_themax(
+    x: np.ndarray, y: np.ndarray, z: np.ndarray, phic: float, thec: float
+) -> float:
+    """Returns the largest angular distance of a set of unit vectors from a center.
+
+    Parameters
+    ----------
+    x, y, z : array
+        Unit vector coordinates.
+    phic, thec : float
+        The center.
+
+    Returns
+    -------
+    themax : float
+        Maximum angular distance from the center.
+    """
+    xc, yc, zc = coords.sphere2cart(1.0, phic, thec)
+    mindot = np.min(x * xc + y * yc + z * zc)
+    return float(np.arccos(np.clip(mindot, -1.0, 1.0)))
+
+
+def _split_moments(
+    moments: np.ndarray,
+    get_vectors: Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray, np.ndarray]],
+    weights: np.ndarray,
+    child: np.ndarray,
+    nchild: int = 2,
+) -> np.ndarray:
+    """Splits the moments of a region into the moments of its children, summing
+    over every child except the largest, whose moments are found by subtraction.
+
+    Parameters
+    ----------
+    moments : array
+        Moments of the parent region.
+    get_vectors : callable
+        Returns the unit vectors (x, y, z) of the parent members at given indices.
+    weights : array
+        Weights for each member of the parent region.
+    child : int array
+        Child index, from 0 to nchild - 1, for each member of the parent region.
+    nchild : int, optional
+        Number of children.
+
+    Returns
+    -------
+    child_moments : array
+        Moments of each child, shape (nchild, 4).
+    """
+    largest = np.argmax(np.bincount(child, minlength=nchild))
+    ind = np.where(child != largest)[0]
+    x, y, z = get_vectors(ind)
+    _child = child[ind]
+    _weights = weights[ind]
+    child_moments = np.zeros((nchild, 4))
+    # Each child is summed with _get_moments, so a binary split gives exactly the
+    # moments of summing the smaller child alone.
+    for k in range(0, nchild):
+        if k != largest:
+            cond = np.where(_child == k)[0]
+            child_moments[k] = _get_moments(x[cond], y[cond], z[cond], _weights[cond])
+    child_moments[largest] = moments - np.sum(child_moments, axis=0)
+    return child_moments
+
+
 def find_map_barycenter(
-    bnmap: np.ndarray, wmap: Optional[np.ndarray] = None
+    bnmap: np.ndarray,
+    wmap: Optional[np.ndarray] = None,
+    moments: Optional[np.ndarray] = None,
+    vectors: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
 ) -> Tuple[float, float]:
     """Determines the barycenter of center of mass direction of the input binary map.
 
@@ -89,6 +273,12 @@ def find_map_barycenter(
         binary map.
     wmap : array, optional
         The weights.
+    moments : array, optional
+        Precomputed moments [sum(w*x), sum(w*y), sum(w*z), sum(w)] of the region,
+        if given these are not recomputed.
+    vectors : tuple, optional
+        Precomputed unit vectors (x, y, z) of the non-zero pixels in pixel order,
+        if given these are not recomputed.
 
     Returns
     -------
@@ -100,22 +290,22 @@ def find_map_barycenter(
     pixID = np.where(bnmap != 0.0)[0]
     if len(pixID) == 0:
         raise ValueError("Binary map must contain at least one non-zero pixel.")
-    nside = hp.npix2nside(len(bnmap))
-    pixID = np.where(bnmap != 0.0)[0]
-    the, phi = hp.pix2ang(nside, pixID)
-    wei = wmap[pixID]
-    x, y, z = coords.sphere2cart(np.ones(len(phi)), phi, the, center=[0.0, 0.0, 0.0])
-    xc = np.sum(x * wei) / np.sum(wei)
-    yc = np.sum(y * wei) / np.sum(wei)
-    zc = np.sum(z * wei) / np.sum(wei)
-    _, phic, thec = coords.cart2sphere(xc, yc, zc)
-    phir, ther = rotate.rotate_usphere(phi, the, [-phic, -thec, 0.0])
-    themax = np.max(ther)
+    if vectors is None:
+        vectors = hp.pix2vec(hp.npix2nside(len(bnmap)), pixID)
+    x, y, z = vectors
+    if moments is None:
+        moments = _get_moments(x, y, z, wmap[pixID])
+    phic, thec = _moments2barycenter(moments)
+    themax = _get_themax(x, y, z, phic, thec)
     return phic, thec, themax
 
 
 def find_points_barycenter(
-    phi: np.ndarray, the: np.ndarray, weights: Optional[np.ndarray] = None
+    phi: np.ndarray,
+    the: np.ndarray,
+    weights: Optional[np.ndarray] = None,
+    moments: Optional[np.ndarray] = None,
+    vectors: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
 ) -> Tuple[float, float]:
     """Determines the barycenter of center of mass direction of the input point dataset.
 
@@ -125,6 +315,12 @@ def find_points_barycenter(
         Angular coordinates.
     weights : array, optional
         Weights for points.
+    moments : array, optional
+        Precomputed moments [sum(w*x), sum(w*y), sum(w*z), sum(w)] of the points,
+        if given these are not recomputed.
+    vectors : tuple, optional
+        Precomputed unit vectors (x, y, z) of the points, if given these are not
+        recomputed.
 
     Returns
     -------
@@ -139,18 +335,24 @@ def find_points_barycenter(
         raise ValueError("Weights array must be the same length as phi and the.")
     if weights is None:
         weights = np.ones(len(phi))
-    x, y, z = coords.sphere2cart(np.ones(len(phi)), phi, the, center=[0.0, 0.0, 0.0])
-    xc = np.sum(x * weights) / np.sum(weights)
-    yc = np.sum(y * weights) / np.sum(weights)
-    zc = np.sum(z * weights) / np.sum(weights)
-    _, phic, thec = coords.cart2sphere(xc, yc, zc)
-    phir, ther = rotate.rotate_usphere(phi, the, [-phic, -thec, 0.0])
-    themax = np.max(ther)
+    if vectors is None:
+        vectors = coords.sphere2cart(
+            np.ones(len(phi)), phi, the, center=[0.0, 0.0, 0.0]
+        )
+    x, y, z = vectors
+    if moments is None:
+        moments = _get_moments(x, y, z, weights)
+    phic, thec = _moments2barycenter(moments)
+    themax = _get_themax(x, y, z, phic, thec)
     return phic, thec, themax
 
 
 def get_map_border(
-    bnmap: np.ndarray, wmap: Optional[np.ndarray] = None, res: List[float] = [200, 100]
+    bnmap: np.ndarray,
+    wmap: Optional[np.ndarray] = None,
+    res: List[float] = [200, 100],
+    moments: Optional[np.ndarray] = None,
+    vectors: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
 ) -> Tuple[np.ndarray, np.ndarray]:
     """Determines the outer border of binary map region.
 
@@ -163,6 +365,11 @@ def get_map_border(
     res : list, optional
         Resolution of spherical cap grid where [phiresolution, thetaresolution]
         to find region border.
+    moments : array, optional
+        Precomputed moments [sum(w*x), sum(w*y), sum(w*z), sum(w)] of the region.
+    vectors : tuple, optional
+        Precomputed unit vectors (x, y, z) of the non-zero pixels in pixel order,
+        if given these are not recomputed.
 
     Returns
     -------
@@ -170,7 +377,9 @@ def get_map_border(
         Approximate border region.
     """
     nside = hp.npix2nside(len(bnmap))
-    phic, thec, themax = find_map_barycenter(bnmap, wmap=wmap)
+    phic, thec, themax = find_map_barycenter(
+        bnmap, wmap=wmap, moments=moments, vectors=vectors
+    )
 
     psize = res[0]
     tsize = res[1]
@@ -214,6 +423,8 @@ def get_points_border(
     the: np.ndarray,
     weights: Optional[np.ndarray] = None,
     res: int = 100,
+    moments: Optional[np.ndarray] = None,
+    vectors: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
 ) -> Tuple[np.ndarray, np.ndarray]:
     """Determines the outer border of binary map region.
 
@@ -225,6 +436,11 @@ def get_points_border(
         Weights for points.
     res : int, optional
         Resolution of spherical cap grid for phiresolution to find region border.
+    moments : array, optional
+        Precomputed moments [sum(w*x), sum(w*y), sum(w*z), sum(w)] of the region.
+    vectors : tuple, optional
+        Precomputed unit vectors (x, y, z) of the points, if given these are not
+        recomputed.
 
     Returns
     -------
@@ -235,7 +451,9 @@ def get_points_border(
     if phi.size == 0 or the.size == 0:
         raise ValueError("Input point set is empty")
 
-    phic, thec, themax = find_points_barycenter(phi, the, weights=weights)
+    phic, thec, themax = find_points_barycenter(
+        phi, the, weights=weights, moments=moments, vectors=vectors
+    )
 
     pedges = np.linspace(0.0, 2 * np.pi, res + 1)
 
@@ -257,7 +475,11 @@ def get_points_border(
 
 
 def get_map_most_dist_points(
-    bnmap: np.ndarray, wmap: Optional[np.ndarray] = None, res: List[float] = [100, 50]
+    bnmap: np.ndarray,
+    wmap: Optional[np.ndarray] = None,
+    res: List[float] = [100, 50],
+    moments: Optional[np.ndarray] = None,
+    vectors: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
 ) -> Tuple[float, float, float, float]:
     """Returns the most distant points on a binary map.
 
@@ -270,6 +492,11 @@ def get_map_most_dist_points(
     res : list, optional
         Resolution of spherical cap grid where [phiresolution, thetaresolution]
         to find region border.
+    moments : array, optional
+        Precomputed moments [sum(w*x), sum(w*y), sum(w*z), sum(w)] of the region.
+    vectors : tuple, optional
+        Precomputed unit vectors (x, y, z) of the non-zero pixels in pixel order,
+        if given these are not recomputed.
 
     Returns
     -------
@@ -278,7 +505,9 @@ def get_map_most_dist_points(
         the binary map.
     """
 
-    phi_border, the_border = get_map_border(bnmap, wmap=wmap, res=res)
+    phi_border, the_border = get_map_border(
+        bnmap, wmap=wmap, res=res, moments=moments, vectors=vectors
+    )
 
     pp1, pp2 = np.meshgrid(phi_border, phi_border, indexing="ij")
     tt1, tt2 = np.meshgrid(the_border, the_border, indexing="ij")
@@ -298,6 +527,8 @@ def get_points_most_dist_points(
     the: np.ndarray,
     weights: Optional[np.ndarray] = None,
     res: int = 100,
+    moments: Optional[np.ndarray] = None,
+    vectors: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
 ) -> Tuple[float, float, float, float]:
     """Returns the most distant points from a set of points.
 
@@ -309,6 +540,11 @@ def get_points_most_dist_points(
         Weights for points.
     res : int, optional
         Resolution of spherical cap grid for phiresolution to find region border.
+    moments : array, optional
+        Precomputed moments [sum(w*x), sum(w*y), sum(w*z), sum(w)] of the region.
+    vectors : tuple, optional
+        Precomputed unit vectors (x, y, z) of the points, if given these are not
+        recomputed.
 
     Returns
     -------
@@ -320,7 +556,9 @@ def get_points_most_dist_points(
     if len(phi) == 0 or len(the) == 0:
         raise ValueError("Input coordinate arrays are empty.")
 
-    phi_border, the_border = get_points_border(phi, the, weights=weights, res=res)
+    phi_border, the_border = get_points_border(
+        phi, the, weights=weights, res=res, moments=moments, vectors=vectors
+    )
 
     pp1, pp2 = np.meshgrid(phi_border, phi_border, indexing="ij")
     tt1, tt2 = np.meshgrid(the_border, the_border, indexing="ij")
@@ -335,6 +573,218 @@ def get_points_most_dist_points(
     return p1, t1, p2, t2
 
 
+def _check_vectors(
+    x: np.ndarray, y: np.ndarray, z: np.ndarray, weights: Optional[np.ndarray]
+) -> np.ndarray:
+    """Checks unit vector inputs, returning the weights.
+
+    Parameters
+    ----------
+    x, y, z : array
+        Unit vector coordinates.
+    weights : array, optional
+        Weights for the unit vectors.
+
+    Returns
+    -------
+    weights : array
+        Weights, set to ones if not given.
+    """
+    if len(x) == 0:
+        raise ValueError("Input unit vector arrays must not be empty.")
+    if len(x) != len(y) or len(x) != len(z):
+        raise ValueError("Input arrays x, y and z must have the same length.")
+    if weights is None:
+        weights = np.ones(len(x))
+    elif len(weights) != len(x):
+        raise ValueError("Weights array must be the same length as x, y and z.")
+    return weights
+
+
+def _center_basis(center: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the local theta and phi unit vectors at a center on the sphere, i.e.
+    the x and y axes of the frame given by rotating the center to the pole.
+
+    Parameters
+    ----------
+    center : array
+        Unit vector of the center.
+
+    Returns
+    -------
+    etheta, ephi : array
+        Local theta and phi unit vectors.
+    """
+    rho = np.sqrt(center[0] ** 2.0 + center[1] ** 2.0)
+    if rho == 0.0:
+        ephi = np.array([0.0, 1.0, 0.0])
+    else:
+        ephi = np.array([-center[1] / rho, center[0] / rho, 0.0])
+    etheta = maths.vector_cross(ephi, center)
+    return etheta, ephi
+
+
+def find_vectors_barycenter(
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    weights: Optional[np.ndarray] = None,
+    moments: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, float]:
+    """Determines the barycenter of center of mass direction of a set of unit vectors.
+
+    Parameters
+    ----------
+    x, y, z : array
+        Unit vector coordinates.
+    weights : array, optional
+        Weights for the unit vectors.
+    moments : array, optional
+        Precomputed moments [sum(w*x), sum(w*y), sum(w*z), sum(w)], if given these
+        are not recomputed.
+
+    Returns
+    -------
+    center : array
+        Unit vector of the center.
+    mindot : float
+        Minimum dot product with the center, i.e. the cosine of the largest angular
+        distance from the center.
+    """
+    weights = _check_vectors(x, y, z, weights)
+    if moments is None:
+        moments = _get_moments(x, y, z, weights)
+    center = np.array(moments[:3], dtype=float)
+    if maths.vector_norm(center) == 0.0:
+        center = np.array([0.0, 0.0, 1.0])
+    else:
+        center = maths.vector_normalise(center)
+    mindot = float(np.min(x * center[0] + y * center[1] + z * center[2]))
+    return center, mindot
+
+
+def _vectors_border_candidates(
+    x: np.ndarray, y: np.ndarray, z: np.ndarray, center: np.ndarray, res: int = 100
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Finds the most distant unit vector from the center in each angular bin
+    around the center.
+
+    Bins are uniform in the pseudo-angle about the center, so no inverse trig is
+    evaluated.
+
+    Parameters
+    ----------
+    x, y, z : array
+        Unit vector coordinates.
+    center : array
+        Unit vector of the center.
+    res : int, optional
+        Number of angular bins around the center.
+
+    Returns
+    -------
+    bins : int array
+        Occupied bin index.
+    ind : int array
+        Index of the most distant unit vector in each occupied bin.
+    dots : array
+        Dot product of the most distant unit vector with the center.
+    """
+    etheta, ephi = _center_basis(center)
+    p = rotate._pseudo_longitude(x, y, z, etheta, ephi)
+    bins = np.minimum((p * (res / 4.0)).astype(int), res - 1)
+    dots = x * center[0] + y * center[1] + z * center[2]
+    order = np.lexsort((dots, bins))
+    bins, first = np.unique(bins[order], return_index=True)
+    ind = order[first]
+    return bins, ind, dots[ind]
+
+
+def get_vectors_border(
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    weights: Optional[np.ndarray] = None,
+    res: int = 100,
+    moments: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Determines the outer border of a set of unit vectors.
+
+    Parameters
+    ----------
+    x, y, z : array
+        Unit vector coordinates.
+    weights : array, optional
+        Weights for the unit vectors.
+    res : int, optional
+        Number of angular bins around the barycenter used to find region border.
+    moments : array, optional
+        Precomputed moments [sum(w*x), sum(w*y), sum(w*z), sum(w)] of the region.
+
+    Returns
+    -------
+    x_border, y_border, z_border : array
+        Approximate border region.
+    """
+    center, _ = find_vectors_barycenter(x, y, z, weights=weights, moments=moments)
+    _, ind, _ = _vectors_border_candidates(x, y, z, center, res=res)
+    return x[ind], y[ind], z[ind]
+
+
+def _most_dist_vectors(
+    x: np.ndarray, y: np.ndarray, z: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the most distant pair from a small set of unit vectors.
+
+    Parameters
+    ----------
+    x, y, z : array
+        Unit vector coordinates.
+
+    Returns
+    -------
+    v1, v2 : array
+        Unit vectors of the most distant pair.
+    """
+    vecs = np.array([x, y, z]).T
+    dots = vecs @ vecs.T
+    i, j = np.unravel_index(np.argmin(dots), np.shape(dots))
+    return vecs[i], vecs[j]
+
+
+def get_vectors_most_dist_points(
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    weights: Optional[np.ndarray] = None,
+    res: int = 100,
+    moments: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the most distant points from a set of unit vectors.
+
+    Parameters
+    ----------
+    x, y, z : array
+        Unit vector coordinates.
+    weights : array, optional
+        Weights for the unit vectors.
+    res : int, optional
+        Number of angular bins around the barycenter used to find region border.
+    moments : array, optional
+        Precomputed moments [sum(w*x), sum(w*y), sum(w*z), sum(w)] of the region.
+
+    Returns
+    -------
+    v1, v2 : array
+        Unit vectors of the most distant points (1 and 2), which can be converted
+        to angles with cart2sphere if needed.
+    """
+    x_border, y_border, z_border = get_vectors_border(
+        x, y, z, weights=weights, res=res, moments=moments
+    )
+    return _most_dist_vectors(x_border, y_border, z_border)
+
+
 def weight_dif(
     phi_split: float, phi: np.ndarray, weights: np.ndarray, balance: int = 1
 ) -> float:
@@ -397,33 +847,188 @@ def find_dphi(phi: np.ndarray, weights: np.ndarray, balance: int = 1) -> float:
     return dphi
 
 
-def segmentmap2(
+def find_dphis(phi: np.ndarray, weights: np.ndarray, shares: List[float]) -> np.ndarray:
+    """Determines the splitting longitudes required to partition into len(shares)
+    pieces with weights proportional to shares, from a single sorted weighted
+    quantile pass.
+
+    Piece i contains the longitudes dphis[i-1] < phi <= dphis[i].
+
+    Parameters
+    ----------
+    phi : array
+        Longitude coordinates.
+    weights : array
+        Weights corresponding to each longitude coordinates.
+    shares : list
+        Relative weight assigned to each piece.
+
+    Returns
+    -------
+    dphis : array
+        The len(shares) - 1 splitting longitudes.
+    """
+    cond = np.where(weights != 0.0)[0]
+    if len(cond) == 0:
+        raise ValueError("Weights must contain at least one non-zero value.")
+    if len(shares) < 2:
+        raise ValueError("shares must have at least two elements.")
+
+    order = np.argsort(phi, kind="stable")
+    _phi = phi[order]
+    cumweights = np.cumsum(weights[order])
+    targets = cumweights[-1] * np.cumsum(shares)[:-1] / np.sum(shares)
+
+    ind = np.searchsorted(cumweights, targets)
+    ind = np.clip(ind, 0, len(_phi) - 1)
+    # Step back one member where that lands closer to the target weight.
+    prev = np.clip(ind - 1, 0, len(_phi) - 1)
+    closer = np.abs(cumweights[prev] - targets) < np.abs(cumweights[ind] - targets)
+    ind = np.where(closer, prev, ind)
+    dphis = _phi[ind]
+    return dphis
+
+
+def _assign_children(
+    phi: np.ndarray,
+    weights: np.ndarray,
+    balance: float = 1,
+    shares: Optional[List[float]] = None,
+    tolerance: Optional[float] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Assigns members to the children of a split along a longitude.
+
+    Parameters
+    ----------
+    phi : array
+        Longitude coordinates, in the split frame.
+    weights : array
+        Weights corresponding to each longitude coordinates.
+    balance : float, optional
+        Balance of the weights for a split into two.
+    shares : list, optional
+        Relative weight of each child for a split into len(shares), if given
+        this is used instead of balance.
+    tolerance : float, optional
+        If given, the splitting longitudes are found to within tolerance from a
+        weighted quantile sketch instead of the exact search.
+
+    Returns
+    -------
+    child : int array
+        Child index for each member, child i holding the members with
+        dphis[i-1] < phi <= dphis[i].
+    dphis : array
+        The len(shares) - 1 (or 1) splitting longitudes, in the units of phi.
+    """
+    if tolerance is not None:
+        if shares is None:
+            shares = [1.0, balance]
+        _sketch = sketch.weighted_sketch(np.min(phi), np.max(phi), tolerance=tolerance)
+        sketch.update_sketch(_sketch, phi, weights)
+        dphis = sketch.sketch_quantiles(_sketch, shares)
+    elif shares is None or len(shares) == 2:
+        if shares is not None:
+            balance = shares[1] / shares[0]
+        dphis = np.array([find_dphi(phi, weights, balance=balance)])
+    else:
+        dphis = find_dphis(phi, weights, shares)
+    child = np.searchsorted(dphis, phi, side="left")
+    return child, dphis
+
+
+def _replay_cuts(
+    prot: np.ndarray, p: np.ndarray, child: np.ndarray, nchild: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the splitting pseudo-longitudes of a rotate mode split, as recorded
+    in the partition tree, and the children as apply_partition_tree replays them.
+
+    Each cut is placed midway between the members on either side of it, so members
+    are not moved across a cut by the rounding between the rotated longitudes and
+    the pseudo-longitudes of the replay. The few members that still disagree,
+    which lie on the longitude seam of the split frame, take the replayed child.
+
+    Parameters
+    ----------
+    prot : array
+        Pseudo-angles of the rotated longitudes the children were assigned from.
+    p : array
+        Pseudo-longitudes of the members in the split frame, see
+        rotate._pseudo_longitude.
+    child : int array
+        Child index of each member.
+    nchild : int
+        Number of children.
+
+    Returns
+    -------
+    cuts : array
+        The nchild - 1 splitting pseudo-longitudes.
+    child : int array
+        Child index of each member when the tree is replayed.
+    """
+    cuts = np.zeros(nchild - 1)
+    for k in range(0, nchild - 1):
+        below, above = prot[child <= k], prot[child > k]
+        if len(below) > 0 and len(above) > 0:
+            cuts[k] = 0.5 * (np.max(below) + np.min(above))
+        elif len(below) > 0:
+            # Pseudo-longitudes are below 4, so every member stays below.
+            cuts[k] = 4.0
+        else:
+            cuts[k] = -1.0
+    cuts = np.maximum.accumulate(cuts)
+    return cuts, np.searchsorted(cuts, p, side="left")
+
+
+def _check_split(split: str) -> None:
+    """Checks the split mode is supported.
+
+    Parameters
+    ----------
+    split : str
+        Split mode, either 'rotate' or 'normal'.
+    """
+    if split not in ["rotate", "normal"]:
+        raise ValueError("split must be either 'rotate' or 'normal'.")
+
+
+def _segmentmap2(
     weightmap: np.ndarray,
     balance: int = 1,
     partitionmap: Optional[np.ndarray] = None,
     partition: Optional[int] = None,
     res: List[int] = [100, 50],
-) -> np.ndarray:
-    """Segment a map with weights into 2 equal (unequal in balance != 1).
+    moments: Optional[np.ndarray] = None,
+    split: str = "rotate",
+    shares: Optional[List[float]] = None,
+    newpartition: Optional[int] = None,
+    record: bool = False,
+) -> Tuple[np.ndarray, np.ndarray, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Segment a map with weights into 2 equal (unequal in balance != 1), or into
+    len(shares) pieces, also returning the moments of the child partitions. See
+    segmentmap2.
 
     Parameters
     ----------
-    weightmap : array
-        Healpix weight map.
-    balance : float, optional
-        Balance of the weights for the partitioning.
-    partitionmap : int array, optional
-        Partitioned map IDs.
-    partition : int, optional
-        A singular partition to be partitioned in two pieces.
-    res : list, optional
-        Resolution of spherical cap grid where [phiresolution, thetaresolution]
-        to find region border.
+    shares : list, optional
+        Relative weights of the pieces when splitting into more than two.
+    newpartition : int, optional
+        ID of the first new partition, by default one more than the maximum ID.
+    record : bool, optional
+        If True the split is made for a partition tree which is returned, and its
+        cuts are placed so that apply_partition_tree replays it exactly, see
+        _replay_cuts. Otherwise the cuts are only converted to pseudo-longitudes.
 
     Returns
     -------
     partitionmap : int array
         Partitioned map IDs.
+    child_moments : array
+        Moments of the remaining and new partitions, shape (len(shares), 4).
+    geometry : tuple
+        The split frame axes and splitting pseudo-longitudes (xaxis, yaxis, cuts),
+        see apply_partition_tree.
     """
     npix = len(weightmap)
     nside = hp.npix2nside(npix)
@@ -442,57 +1047,156 @@ def segmentmap2(
     _bnmap = np.zeros(npix)
     _bnmap[_pixID] = 1
 
-    _the, _phi = hp.pix2ang(nside, _pixID)
+    _check_split(split)
     _weights = weightmap[_pixID]
 
+    # The unit vectors are found once, for the moments, the barycenter and the
+    # child moments.
+    _x, _y, _z = hp.pix2vec(nside, _pixID)
+    if moments is None:
+        moments = _get_moments(_x, _y, _z, _weights)
+
+    if split == "rotate":
+        _the, _phi = hp.pix2ang(nside, _pixID)
+
+    xaxis, yaxis = np.array([1.0, 0.0, 0.0]), np.array([0.0, 1.0, 0.0])
+
     if np.sum(_bnmap) != len(_bnmap):
 
-        p1, t1, p2, t2 = get_map_most_dist_points(_bnmap, wmap=weightmap, res=res)
+        p1, t1, p2, t2 = get_map_most_dist_points(
+            _bnmap, wmap=weightmap, res=res, moments=moments, vectors=(_x, _y, _z)
+        )
 
-        a1, a2, a3 = rotate.rotate2plane([p1, t1], [p2, t2])
+        if split == "rotate":
+            a1, a2, a3 = rotate.rotate2plane([p1, t1], [p2, t2])
+            _phi, _the = rotate.forward_rotate(_phi, _the, a1, a2, a3)
 
-        _phi, _the = rotate.forward_rotate(_phi, _the, a1, a2, a3)
+        xaxis, yaxis, _ = rotate.rotate2plane_basis([p1, t1], [p2, t2])
 
-    _dphi = find_dphi(_phi, _weights, balance=balance)
+    if split == "normal":
+        _phi = rotate._pseudo_longitude(_x, _y, _z, xaxis, yaxis)
 
-    _cond = np.where(_phi > _dphi)[0]
-    partitionmap[_pixID[_cond]] = maxpartition + 1
+    if newpartition is None:
+        newpartition = maxpartition + 1
 
-    return partitionmap
+    nchild = 2 if shares is None else len(shares)
+    _child, _dphis = _assign_children(_phi, _weights, balance=balance, shares=shares)
+    if split == "rotate" and record:
+        _dphis, _child = _replay_cuts(
+            maths.pseudo_angle(np.sin(_phi), np.cos(_phi)),
+            rotate._pseudo_longitude(_x, _y, _z, xaxis, yaxis),
+            _child,
+            nchild,
+        )
+    elif split == "rotate":
+        _dphis = maths.pseudo_angle(np.sin(_dphis), np.cos(_dphis))
+    _cond = np.where(_child > 0)[0]
+    partitionmap[_pixID[_cond]] = newpartition + _child[_cond] - 1
 
+    def _get_vectors(ind):
+        return _x[ind], _y[ind], _z[ind]
 
-def segmentpoints2(
-    phi: np.ndarray,
-    the: np.ndarray,
-    weights: Optional[np.ndarray] = None,
+    child_moments = _split_moments(moments, _get_vectors, _weights, _child, nchild)
+
+    return partitionmap, child_moments, (xaxis, yaxis, _dphis)
+
+
+def segmentmap2(
+    weightmap: np.ndarray,
     balance: int = 1,
-    partitionID: Optional[np.ndarray] = None,
+    partitionmap: Optional[np.ndarray] = None,
     partition: Optional[int] = None,
-    res: int = 100,
+    res: List[int] = [100, 50],
+    moments: Optional[np.ndarray] = None,
+    split: str = "rotate",
 ) -> np.ndarray:
-    """Segments a set of points with weights into 2 equal (unequal in balance != 1).
+    """Segment a map with weights into 2 equal (unequal in balance != 1).
 
     Parameters
     ----------
-    phi, the : array
-        Angular positions.
-    weights : array, optional
-        Angular position weights.
+    weightmap : array
+        Healpix weight map.
     balance : float, optional
         Balance of the weights for the partitioning.
-    partitionID : int array, optional
+    partitionmap : int array, optional
         Partitioned map IDs.
     partition : int, optional
         A singular partition to be partitioned in two pieces.
-    res : float, optional
-        Resolution of spherical cap phiresolution to find region border.
+    res : list, optional
+        Resolution of spherical cap grid where [phiresolution, thetaresolution]
+        to find region border.
+    moments : array, optional
+        Precomputed moments [sum(w*x), sum(w*y), sum(w*z), sum(w)] of the
+        partition being split.
+    split : str, optional
+        How members are assigned to each side of the split. 'rotate' rotates every
+        member to a frame where the split is a longitude, while 'normal' finds the
+        same longitude ordering from dot products with the rotated frame axes and
+        a trig-free pseudo-angle, avoiding rotate_usphere and inverse trig.
+
+    Returns
+    -------
+    partitionmap : int array
+        Partitioned map IDs.
+    """
+    partitionmap, _, _ = _segmentmap2(
+        weightmap,
+        balance=balance,
+        partitionmap=partitionmap,
+        partition=partition,
+        res=res,
+        moments=moments,
+        split=split,
+    )
+    return partitionmap
+
+
+def _segmentpoints2(
+    phi: np.ndarray,
+    the: np.ndarray,
+    weights: Optional[np.ndarray] = None,
+    balance: int = 1,
+    partitionID: Optional[np.ndarray] = None,
+    partition: Optional[int] = None,
+    res: int = 100,
+    moments: Optional[np.ndarray] = None,
+    split: str = "rotate",
+    shares: Optional[List[float]] = None,
+    newpartition: Optional[int] = None,
+    tolerance: Optional[float] = None,
+    record: bool = False,
+) -> Tuple[np.ndarray, np.ndarray, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Segments a set of points with weights into 2 equal (unequal in balance != 1),
+    or into len(shares) pieces, also returning the moments of the child
+    partitions. See segmentpoints2.
+
+    Parameters
+    ----------
+    shares : list, optional
+        Relative weights of the pieces when splitting into more than two.
+    newpartition : int, optional
+        ID of the first new partition, by default one more than the maximum ID.
+    tolerance : float, optional
+        If given, the splitting longitudes are found from a weighted quantile
+        sketch to within tolerance, in radians of longitude in both split modes.
+    record : bool, optional
+        If True the split is made for a partition tree which is returned, and its
+        cuts are placed so that apply_partition_tree replays it exactly, see
+        _replay_cuts. Otherwise the cuts are only converted to pseudo-longitudes.
 
     Returns
     -------
     partitionID : int array
         Partitioned map IDs.
+    child_moments : array
+        Moments of the remaining and new partitions, shape (len(shares), 4).
+    geometry : tuple
+        The split frame axes and splitting pseudo-longitudes (xaxis, yaxis, cuts),
+        see apply_partition_tree.
     """
 
+    _check_split(split)
+
     if weights is None:
         weights = np.ones(len(phi))
 
@@ -504,30 +1208,559 @@ def segmentpoints2(
         maxpartition = int(np.max(partitionID))
 
     _pixID = np.where(partitionID == partition)[0]
-    _bnmap = np.ones(len(_pixID))
 
     _phi, _the = phi[_pixID], the[_pixID]
     _weights = weights[_pixID]
 
-    p1, t1, p2, t2 = get_points_most_dist_points(_phi, _the, weights=_weights, res=res)
+    # The unit vectors are found once, for the moments, the barycenter and the
+    # child moments.
+    _x, _y, _z = coords.sphere2cart(np.ones(len(_phi)), _phi, _the)
+    if moments is None:
+        moments = _get_moments(_x, _y, _z, _weights)
+
+    p1, t1, p2, t2 = get_points_most_dist_points(
+        _phi,
+        _the,
+        weights=_weights,
+        res=res,
+        moments=moments,
+        vectors=(_x, _y, _z),
+    )
 
-    a1, a2, a3 = rotate.rotate2plane([p1, t1], [p2, t2])
+    xaxis, yaxis, _ = rotate.rotate2plane_basis([p1, t1], [p2, t2])
 
-    _phi, _the = rotate.forward_rotate(_phi, _the, a1, a2, a3)
+    if split == "rotate":
+        a1, a2, a3 = rotate.rotate2plane([p1, t1], [p2, t2])
+        _phir, _ther = rotate.forward_rotate(_phi, _the, a1, a2, a3)
+    else:
+        _phir = rotate._pseudo_longitude(_x, _y, _z, xaxis, yaxis)
 
-    _dphi = find_dphi(_phi, _weights, balance=balance)
+    if newpartition is None:
+        newpartition = maxpartition + 1
 
-    _cond = np.where(_phi > _dphi)[0]
-    partitionID[_pixID[_cond]] = maxpartition + 1
+    if split == "normal" and tolerance is not None:
+        # The pseudo-longitude changes by at least half a unit per radian, so its
+        # bins must be half as wide for the same precision in radians.
+        tolerance = 0.5 * tolerance
+
+    nchild = 2 if shares is None else len(shares)
+    _child, _dphis = _assign_children(
+        _phir, _weights, balance=balance, shares=shares, tolerance=tolerance
+    )
+    if split == "rotate" and record:
+        _dphis, _child = _replay_cuts(
+            maths.pseudo_angle(np.sin(_phir), np.cos(_phir)),
+            rotate._pseudo_longitude(_x, _y, _z, xaxis, yaxis),
+            _child,
+            nchild,
+        )
+    elif split == "rotate":
+        _dphis = maths.pseudo_angle(np.sin(_dphis), np.cos(_dphis))
+    _cond = np.where(_child > 0)[0]
+    partitionID[_pixID[_cond]] = newpartition + _child[_cond] - 1
+
+    def _get_vectors(ind):
+        return _x[ind], _y[ind], _z[ind]
+
+    child_moments = _split_moments(moments, _get_vectors, _weights, _child, nchild)
+
+    return partitionID, child_moments, (xaxis, yaxis, _dphis)
+
+
+def segmentpoints2(
+    phi: np.ndarray,
+    the: np.ndarray,
+    weights: Optional[np.ndarray] = None,
+    balance: int = 1,
+    partitionID: Optional[np.ndarray] = None,
+    partition: Optional[int] = None,
+    res: int = 100,
+    moments: Optional[np.ndarray] = None,
+    split: str = "rotate",
+    tolerance: Optional[float] = None,
+) -> np.ndarray:
+    """Segments a set of points with weights into 2 equal (unequal in balance != 1).
+
+    Parameters
+    ----------
+    phi, the : array
+        Angular positions.
+    weights : array, optional
+        Angular position weights.
+    balance : float, optional
+        Balance of the weights for the partitioning.
+    partitionID : int array, optional
+        Partitioned map IDs.
+    partition : int, optional
+        A singular partition to be partitioned in two pieces.
+    res : float, optional
+        Resolution of spherical cap phiresolution to find region border.
+    moments : array, optional
+        Precomputed moments [sum(w*x), sum(w*y), sum(w*z), sum(w)] of the
+        partition being split.
+    split : str, optional
+        How members are assigned to each side of the split. 'rotate' rotates every
+        member to a frame where the split is a longitude, while 'normal' finds the
+        same longitude ordering from dot products with the rotated frame axes and
+        a trig-free pseudo-angle, avoiding rotate_usphere and inverse trig.
+    tolerance : float, optional
+        If given, the splitting longitude is found to within tolerance radians
+        from a weighted quantile sketch (see weighted_sketch) in a single pass,
+        instead of the exact search of find_dphi. In 'normal' mode the sketch of
+        the pseudo-longitude is made fine enough for the same precision in
+        radians.
 
+    Returns
+    -------
+    partitionID : int array
+        Partitioned map IDs.
+    """
+    partitionID, _, _ = _segmentpoints2(
+        phi,
+        the,
+        weights=weights,
+        balance=balance,
+        partitionID=partitionID,
+        partition=partition,
+        res=res,
+        moments=moments,
+        split=split,
+        tolerance=tolerance,
+    )
     return partitionID
 
 
-def segmentmapN(
-    weightmap: np.ndarray, Npartitions: int, res: List[int] = [100, 50]
+def _segmentvectors2(
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    weights: Optional[np.ndarray] = None,
+    balance: int = 1,
+    partitionID: Optional[np.ndarray] = None,
+    partition: Optional[int] = None,
+    res: int = 100,
+    moments: Optional[np.ndarray] = None,
+    shares: Optional[List[float]] = None,
+    newpartition: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Segments a set of unit vectors with weights into 2 equal (unequal in
+    balance != 1), or into len(shares) pieces, also returning the moments of the
+    child partitions. See segmentvectors2.
+
+    Parameters
+    ----------
+    shares : list, optional
+        Relative weights of the pieces when splitting into more than two.
+    newpartition : int, optional
+        ID of the first new partition, by default one more than the maximum ID.
+
+    Returns
+    -------
+    partitionID : int array
+        Partitioned IDs.
+    child_moments : array
+        Moments of the remaining and new partitions, shape (len(shares), 4).
+    geometry : tuple
+        The split frame axes and splitting pseudo-longitudes (xaxis, yaxis, cuts),
+        see apply_partition_tree.
+    """
+    if weights is None:
+        weights = np.ones(len(x))
+
+    if partitionID is None:
+        partitionID = np.ones(len(x))
+        maxpartition = 1
+        partition = 1
+    else:
+        maxpartition = int(np.max(partitionID))
+
+    _pixID = np.where(partitionID == partition)[0]
+
+    _x, _y, _z = x[_pixID], y[_pixID], z[_pixID]
+    _weights = weights[_pixID]
+
+    if moments is None:
+        moments = _get_moments(_x, _y, _z, _weights)
+
+    v1, v2 = get_vectors_most_dist_points(
+        _x, _y, _z, weights=_weights, res=res, moments=moments
+    )
+
+    xaxis, yaxis, _ = rotate._rotate2plane_basis(v1, v2)
+
+    _phir = rotate._pseudo_longitude(_x, _y, _z, xaxis, yaxis)
+
+    if newpartition is None:
+        newpartition = maxpartition + 1
+
+    _child, _dphis = _assign_children(_phir, _weights, balance=balance, shares=shares)
+    _cond = np.where(_child > 0)[0]
+    partitionID[_pixID[_cond]] = newpartition + _child[_cond] - 1
+
+    def _get_vectors(ind):
+        return _x[ind], _y[ind], _z[ind]
+
+    nchild = 2 if shares is None else len(shares)
+    child_moments = _split_moments(moments, _get_vectors, _weights, _child, nchild)
+
+    return partitionID, child_moments, (xaxis, yaxis, _dphis)
+
+
+def segmentvectors2(
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    weights: Optional[np.ndarray] = None,
+    balance: int = 1,
+    partitionID: Optional[np.ndarray] = None,
+    partition: Optional[int] = None,
+    res: int = 100,
+    moments: Optional[np.ndarray] = None,
 ) -> np.ndarray:
+    """Segments a set of unit vectors with weights into 2 equal (unequal in
+    balance != 1).
+
+    The barycenter, border, most distant points, rotation and split are all
+    computed directly on the unit vectors, without converting back to angles.
+
+    Parameters
+    ----------
+    x, y, z : array
+        Unit vector coordinates.
+    weights : array, optional
+        Unit vector weights.
+    balance : float, optional
+        Balance of the weights for the partitioning.
+    partitionID : int array, optional
+        Partitioned IDs.
+    partition : int, optional
+        A singular partition to be partitioned in two pieces.
+    res : int, optional
+        Number of angular bins around the barycenter used to find region border.
+    moments : array, optional
+        Precomputed moments [sum(w*x), sum(w*y), sum(w*z), sum(w)] of the
+        partition being split.
+
+    Returns
+    -------
+    partitionID : int array
+        Partitioned IDs.
+    """
+    partitionID, _, _ = _segmentvectors2(
+        x,
+        y,
+        z,
+        weights=weights,
+        balance=balance,
+        partitionID=partitionID,
+        partition=partition,
+        res=res,
+        moments=moments,
+    )
+    return partitionID
+
+
+def _split_shares(Npart: int, Nsplit: int) -> List[int]:
+    """Divides Npart partitions as evenly as possible between Nsplit pieces.
+
+    Parameters
+    ----------
+    Npart : int
+        Number of partitions to divide.
+    Nsplit : int
+        Number of pieces.
+
+    Returns
+    -------
+    shares : list
+        Number of partitions assigned to each piece, smallest first.
+    """
+    base = Npart // Nsplit
+    remainder = Npart - base * Nsplit
+    return [base] * (Nsplit - remainder) + [base + 1] * remainder
+
+
+def _check_Nsplit(Nsplit: int) -> None:
+    """Checks the number of pieces each region is split into.
+
+    Parameters
+    ----------
+    Nsplit : int
+        Maximum number of pieces each region is split into.
+    """
+    if Nsplit < 2:
+        raise ValueError("Nsplit must be >= 2.")
+
+
+def _iterate_splits(
+    part_Npart: np.ndarray, maxpartition: int = 1, Nsplit: int = 2
+) -> Iterator[Tuple[int, np.ndarray, List[int]]]:
+    """Iterates over the splits needed to divide each partition into its assigned
+    number of final partitions.
+
+    Parameters
+    ----------
+    part_Npart : int array
+        The number of final partitions assigned to each partition ID, with zeros
+        for the IDs still to be created. This is updated in place.
+    maxpartition : int, optional
+        The number of partition IDs already in use.
+    Nsplit : int, optional
+        Maximum number of pieces each region is split into at once.
+
+    Yields
+    ------
+    index : int
+        Index of the partition to split, i.e. partition ID - 1.
+    newindex : int array
+        Indices of the new partitions created by the split.
+    shares : list
+        Number of final partitions assigned to the split partition and each of
+        the new partitions.
+    """
+    while any(part_Npart == 0):
+
+        for i in range(0, len(part_Npart)):
+
+            if part_Npart[i] > 1:
+
+                shares = _split_shares(part_Npart[i], min(Nsplit, part_Npart[i]))
+                newindex = np.arange(maxpartition, maxpartition + len(shares) - 1)
+                part_Npart[i] = shares[0]
+                part_Npart[newindex] = shares[1:]
+
+                yield i, newindex, shares
+
+                maxpartition += len(shares) - 1
+
+
+def _run_splits(
+    split_func: Callable[
+        [int, List[int], np.ndarray, int],
+        Tuple[np.ndarray, Tuple[np.ndarray, np.ndarray, np.ndarray]],
+    ],
+    part_Npart: np.ndarray,
+    part_moments: np.ndarray,
+    maxpartition: int = 1,
+    Nsplit: int = 2,
+    tree: Optional[Dict[str, np.ndarray]] = None,
+    nskip: int = 0,
+    on_split: Optional[Callable[[int], None]] = None,
+) -> None:
+    """Runs every split needed to divide each partition into its assigned number of
+    final partitions, carrying the moments of each partition down the tree.
+
+    Parameters
+    ----------
+    split_func : callable
+        Splits a partition given (partition, shares, moments, newpartition) and
+        returns the child moments and split geometry.
+    part_Npart : int array
+        The number of final partitions assigned to each partition ID.
+    part_moments : array
+        Moments of each partition, updated in place.
+    maxpartition : int, optional
+        The number of partition IDs already in use.
+    Nsplit : int, optional
+        Maximum number of pieces each region is split into at once.
+    tree : dict, optional
+        Partition tree, if given each split is appended to it.
+    nskip : int, optional
+        Number of splits already made, e.g. when resuming from a checkpoint. The
+        order of the splits only depends on part_Npart, so these are skipped.
+    on_split : callable, optional
+        Called with the number of splits made after each split.
+    """
+    splits = _iterate_splits(part_Npart, maxpartition, Nsplit)
+    for n, (i, j, shares) in enumerate(splits):
+        if n < nskip:
+            continue
+        child_moments, geometry = split_func(i + 1, shares, part_moments[i], j[0] + 1)
+        part_moments[i] = child_moments[0]
+        part_moments[j] = child_moments[1:]
+        if tree is not None:
+            _record_split(tree, i + 1, j[0] + 1, shares, geometry)
+        if on_split is not None:
+            on_split(n + 1)
+
+
+def _partition_moments(
+    partitionID: np.ndarray,
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    weights: np.ndarray,
+    Npartitions: int,
+) -> np.ndarray:
+    """Returns the moments of every partition from a single pass.
+
+    Parameters
+    ----------
+    partitionID : int array
+        Partition IDs, zero for unassigned elements.
+    x, y, z : array
+        Unit vector coordinates.
+    weights : array
+        Weights.
+    Npartitions : int
+        Number of partitions, excluding zero.
+
+    Returns
+    -------
+    part_moments : array
+        Moments of partitions 1 to Npartitions, shape (Npartitions, 4).
+    """
+    _partitionID = np.asarray(partitionID).astype(int)
+    part_moments = np.zeros((Npartitions, 4))
+    for i, w in enumerate([weights * x, weights * y, weights * z, weights]):
+        part_moments[:, i] = np.bincount(
+            _partitionID, weights=w, minlength=Npartitions + 1
+        )[1 : Npartitions + 1]
+    return part_moments
+
+
+def _refine_targets(partition_weights: np.ndarray, Npartitions: int) -> np.ndarray:
+    """Assigns final partition counts to existing partitions in proportion to their
+    weights, so that only the partitions that need it are split.
+
+    Parameters
+    ----------
+    partition_weights : array
+        Total weight of each existing partition.
+    Npartitions : int
+        Total number of final partitions.
+
+    Returns
+    -------
+    part_Npart : int array
+        Number of final partitions assigned to each existing partition.
+    """
+    part_Npart = np.ones(len(partition_weights), dtype=int)
+    for i in range(len(partition_weights), Npartitions):
+        part_Npart[np.argmax(partition_weights / part_Npart)] += 1
+    return part_Npart
+
+
+def _check_refine(Nprevious: int, Npartitions: int) -> None:
+    """Checks a partition can be refined to Npartitions.
+
+    Parameters
+    ----------
+    Nprevious : int
+        Current number of partitions.
+    Npartitions : int
+        Number of partitions after refinement.
+    """
+    if Npartitions <= Nprevious:
+        raise ValueError(
+            "Npartitions must be larger than the current number of partitions."
+        )
+
+
+def _copy_tree(tree: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Returns a copy of a partition tree."""
+    return {key: np.copy(tree[key]) for key in tree}
+
+
+def _save_checkpoint(
+    fname: str,
+    key: str,
+    nsplits: int,
+    partitionmap: np.ndarray,
+    part_moments: np.ndarray,
+    tree: Dict[str, np.ndarray],
+) -> None:
+    """Writes the state of a partially built partitioning to a checkpoint file.
+
+    The file is written next to fname and moved into place, so an interrupted
+    write never replaces the previous checkpoint.
+
+    Parameters
+    ----------
+    fname : str
+        Checkpoint file name.
+    key : str
+        Hash of the inputs and parameters of the partitioning.
+    nsplits : int
+        Number of splits made.
+    partitionmap : array
+        Partitioned map IDs.
+    part_moments : array
+        Moments of each partition.
+    tree : dict
+        Partition tree of the splits made.
+    """
+    tmpname = fname + ".%i.tmp" % os.getpid()
+    arrays = {"tree_" + name: tree[name] for name in tree}
+    with open(tmpname, "wb") as f:
+        np.savez(
+            f,
+            key=key,
+            nsplits=nsplits,
+            partitionmap=partitionmap,
+            part_moments=part_moments,
+            **arrays,
+        )
+    os.replace(tmpname, fname)
+
+
+def _load_checkpoint(
+    fname: str, key: str
+) -> Optional[Tuple[int, np.ndarray, np.ndarray, Dict[str, np.ndarray]]]:
+    """Reads a checkpoint written by _save_checkpoint.
+
+    Parameters
+    ----------
+    fname : str
+        Checkpoint file name.
+    key : str
+        Hash of the inputs and parameters of the partitioning.
+
+    Returns
+    -------
+    state : tuple or None
+        The number of splits made, partitioned map IDs, moments of each partition
+        and partition tree, or None if there is no checkpoint for these inputs.
+    """
+    if not os.path.exists(fname):
+        return None
+    with np.load(fname) as checkpoint:
+        if str(checkpoint["key"]) != key:
+            return None
+        tree = {
+            name[5:]: checkpoint[name]
+            for name in checkpoint.files
+            if name.startswith("tree_")
+        }
+        return (
+            int(checkpoint["nsplits"]),
+            checkpoint["partitionmap"],
+            checkpoint["part_moments"],
+            tree,
+        )
+
+
+def segmentmapN(
+    weightmap: np.ndarray,
+    Npartitions: int,
+    res: List[int] = [100, 50],
+    split: str = "rotate",
+    cartesian: bool = False,
+    Nsplit: int = 2,
+    return_tree: bool = False,
+    mask_type: str = "map",
+    nside: Optional[int] = None,
+    result_cache: Optional[str] = None,
+    checkpoint: Optional[str] = None,
+    checkpoint_splits: Optional[int] = None,
+    checkpoint_seconds: Optional[float] = None,
+) -> Union[np.ndarray, Tuple[np.ndarray, Dict[str, np.ndarray]]]:
     """Segment a map with weights into equal Npartition sides.
 
+    The weighted moments [sum(w*x), sum(w*y), sum(w*z), sum(w)] of each partition
+    are carried down the tree, so they are only summed for the smaller child of
+    each split.
+
     Parameters
     ----------
     weightmap : array
@@ -537,112 +1770,1050 @@ def segmentmapN(
     res : list, optional
         Resolution of spherical cap grid where [phiresolution, thetaresolution]
         to find region border.
+    split : str, optional
+        Split mode, either 'rotate' or the trig-free 'normal', see segmentmap2.
+    cartesian : bool, optional
+        If True the pixel centers are converted to unit vectors once and
+        partitioned with segmentvectorsN, using res[0] angular bins to find the
+        border of each region.
+    Nsplit : int, optional
+        Maximum number of pieces each region is cut into at once. Regions are cut
+        into slabs along their longest axis, with the Nsplit - 1 splitting
+        longitudes found from one sorted weighted quantile pass (find_dphis). This
+        reduces the depth of the tree and the number of border and rotation
+        steps for large Npartitions. The default of 2 is a binary split.
+    return_tree : bool, optional
+        If True the partition tree recording every split is also returned, which
+        can be used to read out coarser partitions with coarsen_partition, to
+        refine the partitions further or to assign new data with
+        apply_partition_tree.
+    mask_type : str, optional
+        Type of weightmap, either a Healpix 'map', or for a binary footprint a
+        bit-packed mask ('packed', see pack_mask) or a sorted list of pixel
+        indices ('pixels'). Packed and pixel list masks are never expanded to a
+        full sky map, their pixel centers are partitioned as points with
+        segmentpointsN (or segmentvectorsN if cartesian) using res[0].
+    nside : int, optional
+        Healpix nside, needed for 'packed' and 'pixels' masks.
+    result_cache : str, optional
+        Directory of a result cache. Results are stored under a sha256 hash of
+        the inputs and parameters, and later calls with the same inputs memory
+        map the stored partitions instead of recomputing them. See
+        set_result_cache_size for the size of the cache.
+    checkpoint : str, optional
+        File where the partially built partitions and tree are checkpointed. A
+        rerun with the same inputs and parameters resumes from the last
+        checkpoint instead of from the root, and the file is removed once the
+        partitioning is complete. Only for 'map' masks without cartesian.
+    checkpoint_splits : int, optional
+        Checkpoint every checkpoint_splits splits.
+    checkpoint_seconds : float, optional
+        Checkpoint after the first split made checkpoint_seconds after the last
+        checkpoint. If neither this nor checkpoint_splits is given, checkpoints
+        are written every 600 seconds.
 
     Returns
     -------
     partitionmap : int array
-        Partitioned map IDs.
+        Partitioned map IDs, or for 'packed' and 'pixels' masks the partition ID
+        of each pixel in the sorted pixel list of the mask.
+    tree : dict
+        Partition tree, only returned if return_tree is True.
     """
     if Npartitions <= 1:
         raise ValueError("Npartitions must be > 1.")
-    
-    # The number of partitions currently assigned for each partition ID.
-    part_Npart = np.zeros(Npartitions)
-    part_Npart[0] = Npartitions
-    maxpartition = 1
+    _check_Nsplit(Nsplit)
+    mask._check_mask_type(mask_type)
+
+    if checkpoint is not None and (mask_type != "map" or cartesian):
+        raise ValueError(
+            "checkpoint is only supported for 'map' masks without cartesian."
+        )
+
+    if result_cache is not None:
+        params = {
+            "Npartitions": Npartitions,
+            "res": list(res),
+            "split": split,
+            "cartesian": cartesian,
+            "Nsplit": Nsplit,
+            "return_tree": return_tree,
+            "mask_type": mask_type,
+            "nside": nside,
+        }
+        return cache._cached(
+            result_cache,
+            "segmentmapN",
+            [weightmap],
+            params,
+            lambda: segmentmapN(
+                weightmap,
+                checkpoint=checkpoint,
+                checkpoint_splits=checkpoint_splits,
+                checkpoint_seconds=checkpoint_seconds,
+                **params,
+            ),
+        )
+
+    if mask_type != "map":
+        pixID = mask.mask2pixels(weightmap, mask_type=mask_type, nside=nside)
+        if len(pixID) == 0:
+            raise ValueError("Binary map must contain at least one non-zero pixel.")
+        if cartesian:
+            x, y, z = hp.pix2vec(nside, pixID)
+            return segmentvectorsN(
+                x,
+                y,
+                z,
+                Npartitions,
+                res=res[0],
+                Nsplit=Nsplit,
+                return_tree=return_tree,
+            )
+        the, phi = hp.pix2ang(nside, pixID)
+        return segmentpointsN(
+            phi,
+            the,
+            Npartitions,
+            res=res[0],
+            split=split,
+            Nsplit=Nsplit,
+            return_tree=return_tree,
+        )
 
     partitionmap = np.zeros(len(weightmap))
-    pixID = np.nonzero(weightmap)
+    pixID = np.nonzero(weightmap)[0]
+    if len(pixID) == 0:
+        raise ValueError("Binary map must contain at least one non-zero pixel.")
     partitionmap[pixID] = 1.0
 
-    while any(part_Npart == 0):
+    x, y, z = hp.pix2vec(hp.npix2nside(len(weightmap)), pixID)
+
+    if cartesian:
+        partitionID, tree = segmentvectorsN(
+            x,
+            y,
+            z,
+            Npartitions,
+            weights=weightmap[pixID],
+            res=res[0],
+            Nsplit=Nsplit,
+            return_tree=True,
+        )
+        partitionmap[pixID] = partitionID
+    else:
 
-        for i in range(0, len(part_Npart)):
+        def _split_func(partition, shares, moments, newpartition):
+            _, child_moments, geometry = _segmentmap2(
+                weightmap,
+                partitionmap=partitionmap,
+                partition=partition,
+                res=res,
+                moments=moments,
+                split=split,
+                shares=shares,
+                newpartition=newpartition,
+                record=return_tree or checkpoint is not None,
+            )
+            return child_moments, geometry
+
+        part_Npart = np.zeros(Npartitions, dtype=int)
+        part_Npart[0] = Npartitions
+        # Moments of each partition, the root is the only one computed in full.
+        part_moments = np.zeros((Npartitions, 4))
+        part_moments[0] = _get_moments(x, y, z, weightmap[pixID])
+        tree = _new_tree()
+        nskip, on_split = 0, None
+
+        if checkpoint is not None:
+            params = [Npartitions, list(res), split, Nsplit]
+            key = cache._hash_inputs("segmentmapN", [weightmap], {"params": params})
+            state = _load_checkpoint(checkpoint, key)
+            if state is not None:
+                nskip, partitionmap[:], part_moments[:], tree = state
+            if checkpoint_splits is None and checkpoint_seconds is None:
+                checkpoint_seconds = 600.0
+            last = {"nsplits": nskip, "time": time.time()}
+
+            def on_split(nsplits):
+                if (
+                    checkpoint_splits is not None
+                    and nsplits - last["nsplits"] >= checkpoint_splits
+                ) or (
+                    checkpoint_seconds is not None
+                    and time.time() - last["time"] >= checkpoint_seconds
+                ):
+                    _save_checkpoint(
+                        checkpoint, key, nsplits, partitionmap, part_moments, tree
+                    )
+                    last["nsplits"], last["time"] = nsplits, time.time()
+
+        _run_splits(
+            _split_func,
+            part_Npart,
+            part_moments,
+            Nsplit=Nsplit,
+            tree=tree,
+            nskip=nskip,
+            on_split=on_split,
+        )
+        if checkpoint is not None and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+    if return_tree:
+        return partitionmap, tree
+    return partitionmap
 
-            partition = i + 1
 
-            if part_Npart[i] > 1:
-
-                wei1 = int(np.floor(part_Npart[i] / 2.0))
-                wei2 = part_Npart[i] - wei1
-                part_Npart[i] = wei1
-                part_Npart[maxpartition] = wei2
-                maxpartition += 1
+def refinemapN(
+    weightmap: np.ndarray,
+    partitionmap: np.ndarray,
+    Npartitions: int,
+    res: List[int] = [100, 50],
+    split: str = "rotate",
+    cartesian: bool = False,
+    Nsplit: int = 2,
+    tree: Optional[Dict[str, np.ndarray]] = None,
+) -> Union[np.ndarray, Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+    """Refines an existing map partitioning into Npartitions, only splitting the
+    partitions that need it.
+
+    The extra partitions are assigned to the existing partitions in proportion to
+    their weights, so refining N equal partitions into a multiple of N splits each
+    partition into equal pieces.
 
-                balance = wei2 / wei1
+    Parameters
+    ----------
+    weightmap : array
+        Healpix weight map.
+    partitionmap : int array
+        Partitioned map IDs, from 1 to the current number of partitions.
+    Npartitions : int
+        Number of partitioned regions after refinement.
+    res : list, optional
+        Resolution of spherical cap grid where [phiresolution, thetaresolution]
+        to find region border.
+    split : str, optional
+        Split mode, either 'rotate' or the trig-free 'normal', see segmentmap2.
+    cartesian : bool, optional
+        If True the refinement is carried out on unit vectors with
+        refinevectorsN, see segmentmapN.
+    Nsplit : int, optional
+        Maximum number of pieces each region is cut into at once. Regions are cut
+        into slabs along their longest axis, with the Nsplit - 1 splitting
+        longitudes found from one sorted weighted quantile pass (find_dphis). This
+        reduces the depth of the tree and the number of border and rotation
+        steps for large Npartitions. The default of 2 is a binary split.
+    tree : dict, optional
+        Partition tree of the input partitions, if given the new splits are
+        appended to a copy of the tree which is also returned.
 
-                partitionmap = segmentmap2(
-                    weightmap,
-                    balance=balance,
-                    partitionmap=partitionmap,
-                    partition=partition,
-                    res=res,
-                )
+    Returns
+    -------
+    partitionmap : int array
+        Refined partitioned map IDs.
+    tree : dict
+        Extended partition tree, only returned if tree is given.
+    """
+    _check_Nsplit(Nsplit)
+    Nprevious = int(np.max(partitionmap))
+    _check_refine(Nprevious, Npartitions)
+
+    partitionmap = np.copy(partitionmap)
+    pixID = np.where(partitionmap != 0)[0]
+    x, y, z = hp.pix2vec(hp.npix2nside(len(weightmap)), pixID)
+
+    if tree is not None:
+        tree = _copy_tree(tree)
+
+    if cartesian:
+        output = refinevectorsN(
+            x,
+            y,
+            z,
+            partitionmap[pixID],
+            Npartitions,
+            weights=weightmap[pixID],
+            res=res[0],
+            Nsplit=Nsplit,
+            tree=tree,
+        )
+        if tree is not None:
+            partitionmap[pixID], tree = output
+        else:
+            partitionmap[pixID] = output
+    else:
 
+        def _split_func(partition, shares, moments, newpartition):
+            _, child_moments, geometry = _segmentmap2(
+                weightmap,
+                partitionmap=partitionmap,
+                partition=partition,
+                res=res,
+                moments=moments,
+                split=split,
+                shares=shares,
+                newpartition=newpartition,
+                record=tree is not None,
+            )
+            return child_moments, geometry
+
+        part_moments = np.zeros((Npartitions, 4))
+        part_moments[:Nprevious] = _partition_moments(
+            partitionmap[pixID], x, y, z, weightmap[pixID], Nprevious
+        )
+        part_Npart = np.zeros(Npartitions, dtype=int)
+        part_Npart[:Nprevious] = _refine_targets(
+            part_moments[:Nprevious, 3], Npartitions
+        )
+        _run_splits(
+            _split_func,
+            part_Npart,
+            part_moments,
+            maxpartition=Nprevious,
+            Nsplit=Nsplit,
+            tree=tree,
+        )
+
+    if tree is not None:
+        return partitionmap, tree
     return partitionmap
 
 
+def _within_tolerance(
+    child_weights: np.ndarray, shares: np.ndarray, target: float, tolerance: float
+) -> bool:
+    """Checks the children of a split hold their share of the weight.
+
+    Parameters
+    ----------
+    child_weights : array
+        Total weight of each child.
+    shares : int array
+        Number of final partitions assigned to each child.
+    target : float
+        Weight of a single final partition.
+    tolerance : float
+        Maximum relative deviation of each child's weight per final partition
+        from target.
+
+    Returns
+    -------
+    balanced : bool
+        True if every child is within tolerance of its share.
+    """
+    return bool(np.all(np.abs(child_weights / shares / target - 1.0) <= tolerance))
+
+
+def _same_children(
+    child: np.ndarray,
+    previous: np.ndarray,
+    tree: Dict[str, np.ndarray],
+    i: int,
+) -> bool:
+    """Checks a replayed split sends its members to the children they were in
+    according to the previous partition IDs.
+
+    Parameters
+    ----------
+    child : int array
+        Child of each member of the split, from replaying the tree.
+    previous : int array
+        Previous final partition ID of each member, zero for members which were
+        not in the previous footprint.
+    tree : dict
+        Partition tree.
+    i : int
+        Row of the split in the tree.
+
+    Returns
+    -------
+    same : bool
+        True if every member of the previous footprint is in the same child.
+    """
+    cond = np.where(previous > 0)[0]
+    # The partition each previous final partition belonged to after split i.
+    mapping = _coarsen_mapping(tree, i + 1)
+    newpartition = tree["newpartition"][i]
+    expected = np.where(
+        child[cond] == 0, tree["partition"][i], newpartition + child[cond] - 1
+    )
+    return bool(np.array_equal(mapping[previous[cond]], expected))
+
+
+def updatemapN(
+    weightmap: np.ndarray,
+    tree: Dict[str, np.ndarray],
+    res: List[int] = [100, 50],
+    split: str = "rotate",
+    tolerance: float = 0.02,
+    partitionmap: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Updates a map partitioning after the mask or weights have changed, only
+    recomputing the parts of the partition tree that are no longer balanced.
+
+    The splits of the tree are replayed on the new map in the order they were
+    made. A split keeps its existing geometry if its children still hold their
+    share of the weight, i.e. their weight per final partition is within
+    tolerance of the total weight divided by the number of partitions, and, if
+    the previous partition IDs are given, the pixels of the previous footprint
+    are sent to the same children as before. Otherwise it is recomputed as in
+    segmentmapN together with every split below it. A small mask edit therefore
+    only recomputes the few subtrees it unbalances, and an unchanged map gives
+    back the same partitions and tree.
+
+    Parameters
+    ----------
+    weightmap : array
+        Updated Healpix weight map.
+    tree : dict
+        Partition tree of the previous partitioning, from segmentmapN or
+        refinemapN (not with cartesian=True).
+    res : list, optional
+        Resolution of spherical cap grid where [phiresolution, thetaresolution]
+        to find region border.
+    split : str, optional
+        Split mode, either 'rotate' or the trig-free 'normal', see segmentmap2.
+    tolerance : float, optional
+        Maximum relative deviation of the weight per final partition of each
+        child from an equal share for a split to be kept.
+    partitionmap : int array, optional
+        Previous partitioned map IDs, made with tree. If given, splits whose
+        members are no longer grouped as in the previous partitioning, e.g.
+        because the tree does not belong to it, are recomputed.
+
+    Returns
+    -------
+    partitionmap : int array
+        Partitioned map IDs.
+    tree : dict
+        Updated partition tree.
+    """
+    if tolerance < 0.0:
+        raise ValueError("tolerance must be >= 0.")
+    _check_split(split)
+    Npartitions = int(get_tree_levels(tree)[-1])
+    pixID = np.nonzero(weightmap)[0]
+    if len(pixID) == 0:
+        raise ValueError("Binary map must contain at least one non-zero pixel.")
+    previous = None
+    if partitionmap is not None:
+        if len(partitionmap) != len(weightmap):
+            raise ValueError("partitionmap and weightmap must have the same length.")
+        previous = np.asarray(partitionmap).astype(int)
+        if np.min(previous) < 0 or np.max(previous) > Npartitions:
+            raise ValueError("partitionmap IDs are not partitions of the tree.")
+        previous = previous[pixID]
+    partitionmap = np.zeros(len(weightmap))
+    partitionmap[pixID] = 1.0
+    labels = np.ones(len(pixID), dtype=int)
+    weights = weightmap[pixID]
+    x, y, z = hp.pix2vec(hp.npix2nside(len(weightmap)), pixID)
+
+    tree = _copy_tree(tree)
+    target = np.sum(weights) / Npartitions
+    # Partitions whose splits are recomputed, since an ancestor split was.
+    dirty = np.zeros(Npartitions + 1, dtype=bool)
+    for i in range(0, len(tree["partition"])):
+        partition = tree["partition"][i]
+        newpartition = tree["newpartition"][i]
+        nsplit = tree["nsplit"][i]
+        shares = tree["shares"][i, :nsplit]
+        ind = np.where(labels == partition)[0]
+        if len(ind) == 0:
+            continue
+        if not dirty[partition]:
+            p = rotate._pseudo_longitude(
+                x[ind], y[ind], z[ind], tree["xaxis"][i], tree["yaxis"][i]
+            )
+            child = np.searchsorted(tree["cuts"][i, : nsplit - 1], p, side="left")
+            child_weights = np.bincount(child, weights=weights[ind], minlength=nsplit)
+            keep = _within_tolerance(child_weights, shares, target, tolerance)
+            if keep and previous is not None:
+                keep = _same_children(child, previous[ind], tree, i)
+            if keep:
+                cond = np.where(child > 0)[0]
+                labels[ind[cond]] = newpartition + child[cond] - 1
+                partitionmap[pixID[ind[cond]]] = labels[ind[cond]]
+                continue
+            dirty[partition] = True
+        dirty[newpartition : newpartition + nsplit - 1] = True
+        _, _, geometry = _segmentmap2(
+            weightmap,
+            partitionmap=partitionmap,
+            partition=partition,
+            res=res,
+            split=split,
+            shares=list(shares),
+            newpartition=newpartition,
+            record=True,
+        )
+        labels[ind] = partitionmap[pixID[ind]]
+        tree["xaxis"][i], tree["yaxis"][i] = geometry[0], geometry[1]
+        tree["cuts"][i, : nsplit - 1] = geometry[2]
+
+    return partitionmap, tree
+
+
+def _unique_points(
+    phi: np.ndarray, the: np.ndarray, weights: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Collapses identical positions into unique positions with summed weights.
+
+    Parameters
+    ----------
+    phi, the : array
+        Angular positions.
+    weights : array
+        Angular position weights.
+
+    Returns
+    -------
+    phi, the : array
+        Unique angular positions.
+    weights : array
+        Summed weights of each unique position.
+    inverse : int array
+        Index of the unique position of each input position.
+    """
+    positions, inverse = np.unique(
+        np.array([phi, the]).T, axis=0, return_inverse=True
+    )
+    inverse = inverse.reshape(-1)
+    weights = np.bincount(inverse, weights=weights, minlength=len(positions))
+    return positions[:, 0], positions[:, 1], weights, inverse
+
+
+def _segmentpoints_binned(
+    phi: np.ndarray,
+    the: np.ndarray,
+    Npartitions: int,
+    weights: np.ndarray,
+    nside: int,
+    res: int = 100,
+    split: str = "rotate",
+    cartesian: bool = False,
+    Nsplit: int = 2,
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Segments a set of points by partitioning their weighted Healpix map.
+
+    Labels are pushed back to the points from their pixel, except in pixels which
+    neighbour a different partition, where the recorded splits are applied to
+    each point with apply_partition_tree.
+
+    Parameters
+    ----------
+    phi, the : array
+        Angular positions.
+    Npartitions : int
+        Number of partitioned regions
+    weights : array
+        Angular position weights.
+    nside : int
+        Healpix nside of the binned weight map.
+    res : int, optional
+        Resolution of spherical cap phiresolution to find region border.
+    split : str, optional
+        Split mode, see segmentmapN.
+    cartesian : bool, optional
+        Partition the map with unit vectors, see segmentmapN.
+    Nsplit : int, optional
+        Maximum number of pieces each region is cut into at once.
+
+    Returns
+    -------
+    partitionID : int array
+        Partitioned IDs.
+    tree : dict
+        Partition tree.
+    """
+    pix = hp.ang2pix(nside, the, phi)
+    weightmap = np.bincount(pix, weights=weights, minlength=hp.nside2npix(nside))
+    partitionmap, tree = segmentmapN(
+        weightmap,
+        Npartitions,
+        res=[res, res // 2],
+        split=split,
+        cartesian=cartesian,
+        Nsplit=Nsplit,
+        return_tree=True,
+    )
+    partitionID = partitionmap[pix]
+
+    # Pixels straddling a cut have a neighbour in a different partition.
+    pixID = np.nonzero(weightmap)[0]
+    neighbours = hp.get_all_neighbours(nside, pixID)
+    neighbour_labels = np.where(neighbours >= 0, partitionmap[neighbours], 0)
+    straddle = np.any(
+        (neighbour_labels != 0) & (neighbour_labels != partitionmap[pixID]), axis=0
+    )
+    straddlemap = np.zeros(len(weightmap), dtype=bool)
+    straddlemap[pixID[straddle]] = True
+
+    ind = np.where(straddlemap[pix] | (partitionID == 0))[0]
+    x, y, z = coords.sphere2cart(np.ones(len(ind)), phi[ind], the[ind])
+    partitionID[ind] = apply_partition_tree(x, y, z, tree)
+    return partitionID, tree
+
+
 def segmentpointsN(
     phi: np.ndarray,
     the: np.ndarray,
     Npartitions: int,
     weights: Optional[np.ndarray] = None,
     res: int = 100,
-) -> np.ndarray:
+    split: str = "rotate",
+    cartesian: bool = False,
+    Nsplit: int = 2,
+    return_tree: bool = False,
+    tolerance: Optional[float] = None,
+    nside: Optional[int] = None,
+    unique: bool = False,
+    result_cache: Optional[str] = None,
+) -> Union[np.ndarray, Tuple[np.ndarray, Dict[str, np.ndarray]]]:
     """Segments a set of points with weights into equal Npartition sides.
 
+    The weighted moments [sum(w*x), sum(w*y), sum(w*z), sum(w)] of each partition
+    are carried down the tree, so they are only summed for the smaller child of
+    each split.
+
     Parameters
     ----------
-    weightmap : array
-        Healpix weight map.
+    phi, the : array
+        Angular positions.
     Npartitions : int
         Number of partitioned regions
-    res : list, optional
-        Resolution of spherical cap grid where [phiresolution, thetaresolution]
-        to find region border.
+    weights : array, optional
+        Angular position weights.
+    res : int, optional
+        Resolution of spherical cap phiresolution to find region border.
+    split : str, optional
+        Split mode, either 'rotate' or the trig-free 'normal', see segmentpoints2.
+    cartesian : bool, optional
+        If True the points are converted to unit vectors once and partitioned with
+        segmentvectorsN.
+    Nsplit : int, optional
+        Maximum number of pieces each region is cut into at once. Regions are cut
+        into slabs along their longest axis, with the Nsplit - 1 splitting
+        longitudes found from one sorted weighted quantile pass (find_dphis). This
+        reduces the depth of the tree and the number of border and rotation
+        steps for large Npartitions. The default of 2 is a binary split.
+    return_tree : bool, optional
+        If True the partition tree recording every split is also returned, which
+        can be used to read out coarser partitions with coarsen_partition, to
+        refine the partitions further or to assign new data with
+        apply_partition_tree.
+    tolerance : float, optional
+        If given, splitting longitudes are found to within tolerance radians
+        from a weighted quantile sketch, see segmentpoints2.
+    nside : int, optional
+        If given, the points are binned into a weighted Healpix map at this nside
+        which is partitioned with segmentmapN, and only points in pixels on the
+        border between partitions are split individually. This is much faster
+        for catalogs with many more points than occupied pixels, at the cost of
+        balancing weights at the pixel level.
+    unique : bool, optional
+        If True, identical positions are first collapsed into unique positions
+        with summed weights, which are partitioned and the labels expanded back,
+        cutting the work in proportion to the number of duplicates.
+    result_cache : str, optional
+        Directory of a result cache, see segmentmapN.
 
     Returns
     -------
-    partitionmap : int array
-        Partitioned map IDs.
+    partitionID : int array
+        Partitioned IDs.
+    tree : dict
+        Partition tree, only returned if return_tree is True.
     """
     if Npartitions <= 1:
         raise ValueError("Npartitions must be > 1.")
-    
-    # The number of partitions currently assigned for each partition ID.
-    part_Npart = np.zeros(Npartitions)
-    part_Npart[0] = Npartitions
-    maxpartition = 1
+    _check_Nsplit(Nsplit)
+
+    if result_cache is not None:
+        params = {
+            "Npartitions": Npartitions,
+            "res": res,
+            "split": split,
+            "cartesian": cartesian,
+            "Nsplit": Nsplit,
+            "return_tree": return_tree,
+            "tolerance": tolerance,
+            "nside": nside,
+            "unique": unique,
+        }
+        return cache._cached(
+            result_cache,
+            "segmentpointsN",
+            [phi, the, weights],
+            params,
+            lambda: segmentpointsN(phi, the, weights=weights, **params),
+        )
 
     if weights is None:
         weights = np.ones(len(phi))
 
+    if unique:
+        _phi, _the, _weights, inverse = _unique_points(phi, the, weights)
+        output = segmentpointsN(
+            _phi,
+            _the,
+            Npartitions,
+            weights=_weights,
+            res=res,
+            split=split,
+            cartesian=cartesian,
+            Nsplit=Nsplit,
+            return_tree=return_tree,
+            tolerance=tolerance,
+            nside=nside,
+        )
+        if return_tree:
+            return output[0][inverse], output[1]
+        return output[inverse]
+
+    if nside is not None:
+        partitionID, tree = _segmentpoints_binned(
+            phi,
+            the,
+            Npartitions,
+            weights,
+            nside,
+            res=res,
+            split=split,
+            cartesian=cartesian,
+            Nsplit=Nsplit,
+        )
+        if return_tree:
+            return partitionID, tree
+        return partitionID
+
+    x, y, z = coords.sphere2cart(np.ones(len(phi)), phi, the)
+
+    if cartesian:
+        return segmentvectorsN(
+            x,
+            y,
+            z,
+            Npartitions,
+            weights=weights,
+            res=res,
+            Nsplit=Nsplit,
+            return_tree=return_tree,
+        )
+
     partitionID = np.ones(len(weights))
 
-    while any(part_Npart == 0):
+    def _split_func(partition, shares, moments, newpartition):
+        _, child_moments, geometry = _segmentpoints2(
+            phi,
+            the,
+            weights=weights,
+            partitionID=partitionID,
+            partition=partition,
+            res=res,
+            moments=moments,
+            split=split,
+            shares=shares,
+            newpartition=newpartition,
+            tolerance=tolerance,
+            record=return_tree,
+        )
+        return child_moments, geometry
+
+    part_Npart = np.zeros(Npartitions, dtype=int)
+    part_Npart[0] = Npartitions
+    # Moments of each partition, the root is the only one computed in full.
+    part_moments = np.zeros((Npartitions, 4))
+    part_moments[0] = _get_moments(x, y, z, weights)
+    tree = _new_tree()
+    _run_splits(_split_func, part_Npart, part_moments, Nsplit=Nsplit, tree=tree)
+
+    if return_tree:
+        return partitionID, tree
+    return partitionID
 
-        for i in range(0, len(part_Npart)):
 
-            partition = i + 1
+def refinepointsN(
+    phi: np.ndarray,
+    the: np.ndarray,
+    partitionID: np.ndarray,
+    Npartitions: int,
+    weights: Optional[np.ndarray] = None,
+    res: int = 100,
+    split: str = "rotate",
+    cartesian: bool = False,
+    Nsplit: int = 2,
+    tree: Optional[Dict[str, np.ndarray]] = None,
+    tolerance: Optional[float] = None,
+) -> Union[np.ndarray, Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+    """Refines an existing partitioning of points into Npartitions, only splitting
+    the partitions that need it. See refinemapN.
 
-            if part_Npart[i] > 1:
+    Parameters
+    ----------
+    phi, the : array
+        Angular positions.
+    partitionID : int array
+        Partitioned IDs, from 1 to the current number of partitions.
+    Npartitions : int
+        Number of partitioned regions after refinement.
+    weights : array, optional
+        Angular position weights.
+    res : int, optional
+        Resolution of spherical cap phiresolution to find region border.
+    split : str, optional
+        Split mode, either 'rotate' or the trig-free 'normal', see segmentpoints2.
+    cartesian : bool, optional
+        If True the refinement is carried out on unit vectors with
+        refinevectorsN.
+    Nsplit : int, optional
+        Maximum number of pieces each region is cut into at once. Regions are cut
+        into slabs along their longest axis, with the Nsplit - 1 splitting
+        longitudes found from one sorted weighted quantile pass (find_dphis). This
+        reduces the depth of the tree and the number of border and rotation
+        steps for large Npartitions. The default of 2 is a binary split.
+    tree : dict, optional
+        Partition tree of the input partitions, if given the new splits are
+        appended to a copy of the tree which is also returned.
+    tolerance : float, optional
+        If given, splitting longitudes are found to within tolerance radians
+        from a weighted quantile sketch, see segmentpoints2.
 
-                wei1 = int(np.floor(part_Npart[i] / 2.0))
-                wei2 = part_Npart[i] - wei1
-                part_Npart[i] = wei1
-                part_Npart[maxpartition] = wei2
-                maxpartition += 1
+    Returns
+    -------
+    partitionID : int array
+        Refined partitioned IDs.
+    tree : dict
+        Extended partition tree, only returned if tree is given.
+    """
+    if weights is None:
+        weights = np.ones(len(phi))
+
+    x, y, z = coords.sphere2cart(np.ones(len(phi)), phi, the)
+
+    if cartesian:
+        return refinevectorsN(
+            x,
+            y,
+            z,
+            partitionID,
+            Npartitions,
+            weights=weights,
+            res=res,
+            Nsplit=Nsplit,
+            tree=tree,
+        )
+
+    _check_Nsplit(Nsplit)
+    Nprevious = int(np.max(partitionID))
+    _check_refine(Nprevious, Npartitions)
+
+    partitionID = np.copy(partitionID)
+
+    if tree is not None:
+        tree = _copy_tree(tree)
+
+    def _split_func(partition, shares, moments, newpartition):
+        _, child_moments, geometry = _segmentpoints2(
+            phi,
+            the,
+            weights=weights,
+            partitionID=partitionID,
+            partition=partition,
+            res=res,
+            moments=moments,
+            split=split,
+            shares=shares,
+            newpartition=newpartition,
+            tolerance=tolerance,
+            record=tree is not None,
+        )
+        return child_moments, geometry
+
+    part_moments = np.zeros((Npartitions, 4))
+    part_moments[:Nprevious] = _partition_moments(
+        partitionID, x, y, z, weights, Nprevious
+    )
+    part_Npart = np.zeros(Npartitions, dtype=int)
+    part_Npart[:Nprevious] = _refine_targets(part_moments[:Nprevious, 3], Npartitions)
+    _run_splits(
+        _split_func,
+        part_Npart,
+        part_moments,
+        maxpartition=Nprevious,
+        Nsplit=Nsplit,
+        tree=tree,
+    )
+
+    if tree is not None:
+        return partitionID, tree
+    return partitionID
+
+
+def segmentvectorsN(
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    Npartitions: int,
+    weights: Optional[np.ndarray] = None,
+    res: int = 100,
+    Nsplit: int = 2,
+    return_tree: bool = False,
+) -> Union[np.ndarray, Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+    """Segments a set of unit vectors with weights into equal Npartition sides.
+
+    Every step of the partitioning works on the unit vectors, so coordinates are
+    only converted once by the caller rather than at every level of the tree.
+
+    Parameters
+    ----------
+    x, y, z : array
+        Unit vector coordinates.
+    Npartitions : int
+        Number of partitioned regions
+    weights : array, optional
+        Unit vector weights.
+    res : int, optional
+        Number of angular bins around the barycenter used to find region border.
+    Nsplit : int, optional
+        Maximum number of pieces each region is cut into at once. Regions are cut
+        into slabs along their longest axis, with the Nsplit - 1 splitting
+        longitudes found from one sorted weighted quantile pass (find_dphis). This
+        reduces the depth of the tree and the number of border and rotation
+        steps for large Npartitions. The default of 2 is a binary split.
+    return_tree : bool, optional
+        If True the partition tree recording every split is also returned, which
+        can be used to read out coarser partitions with coarsen_partition, to
+        refine the partitions further or to assign new data with
+        apply_partition_tree.
+
+    Returns
+    -------
+    partitionID : int array
+        Partitioned IDs.
+    tree : dict
+        Partition tree, only returned if return_tree is True.
+    """
+    if Npartitions <= 1:
+        raise ValueError("Npartitions must be > 1.")
+    _check_Nsplit(Nsplit)
+
+    weights = _check_vectors(x, y, z, weights)
+
+    partitionID = np.ones(len(weights))
+
+    def _split_func(partition, shares, moments, newpartition):
+        _, child_moments, geometry = _segmentvectors2(
+            x,
+            y,
+            z,
+            weights=weights,
+            partitionID=partitionID,
+            partition=partition,
+            res=res,
+            moments=moments,
+            shares=shares,
+            newpartition=newpartition,
+        )
+        return child_moments, geometry
+
+    part_Npart = np.zeros(Npartitions, dtype=int)
+    part_Npart[0] = Npartitions
+    # Moments of each partition, the root is the only one computed in full.
+    part_moments = np.zeros((Npartitions, 4))
+    part_moments[0] = _get_moments(x, y, z, weights)
+    tree = _new_tree()
+    _run_splits(_split_func, part_Npart, part_moments, Nsplit=Nsplit, tree=tree)
+
+    if return_tree:
+        return partitionID, tree
+    return partitionID
+
+
+def refinevectorsN(
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    partitionID: np.ndarray,
+    Npartitions: int,
+    weights: Optional[np.ndarray] = None,
+    res: int = 100,
+    Nsplit: int = 2,
+    tree: Optional[Dict[str, np.ndarray]] = None,
+) -> Union[np.ndarray, Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+    """Refines an existing partitioning of unit vectors into Npartitions, only
+    splitting the partitions that need it. See refinemapN.
 
-                balance = wei2 / wei1
+    Parameters
+    ----------
+    x, y, z : array
+        Unit vector coordinates.
+    partitionID : int array
+        Partitioned IDs, from 1 to the current number of partitions.
+    Npartitions : int
+        Number of partitioned regions after refinement.
+    weights : array, optional
+        Unit vector weights.
+    res : int, optional
+        Number of angular bins around the barycenter used to find region border.
+    Nsplit : int, optional
+        Maximum number of pieces each region is cut into at once. Regions are cut
+        into slabs along their longest axis, with the Nsplit - 1 splitting
+        longitudes found from one sorted weighted quantile pass (find_dphis). This
+        reduces the depth of the tree and the number of border and rotation
+        steps for large Npartitions. The default of 2 is a binary split.
+    tree : dict, optional
+        Partition tree of the input partitions, if given the new splits are
+        appended to a copy of the tree which is also returned.
 
-                partitionID = segmentpoints2(
-                    phi,
-                    the,
-                    weights=weights,
-                    balance=balance,
-                    partitionID=partitionID,
-                    partition=partition,
-                    res=res,
-                )
+    Returns
+    -------
+    partitionID : int array
+        Refined partitioned IDs.
+    tree : dict
+        Extended partition tree, only returned if tree is given.
+    """
+    _check_Nsplit(Nsplit)
+    weights = _check_vectors(x, y, z, weights)
+    Nprevious = int(np.max(partitionID))
+    _check_refine(Nprevious, Npartitions)
+
+    partitionID = np.copy(partitionID)
+
+    if tree is not None:
+        tree = _copy_tree(tree)
+
+    def _split_func(partition, shares, moments, newpartition):
+        _, child_moments, geometry = _segmentvectors2(
+            x,
+            y,
+            z,
+            weights=weights,
+            partitionID=partitionID,
+            partition=partition,
+            res=res,
+            moments=moments,
+            shares=shares,
+            newpartition=newpartition,
+        )
+        return child_moments, geometry
+
+    part_moments = np.zeros((Npartitions, 4))
+    part_moments[:Nprevious] = _partition_moments(
+        partitionID, x, y, z, weights, Nprevious
+    )
+    part_Npart = np.zeros(Npartitions, dtype=int)
+    part_Npart[:Nprevious] = _refine_targets(part_moments[:Nprevious, 3], Npartitions)
+    _run_splits(
+        _split_func,
+        part_Npart,
+        part_moments,
+        maxpartition=Nprevious,
+        Nsplit=Nsplit,
+        tree=tree,
+    )
 
+    if tree is not None:
+        return partitionID, tree
     return partitionID
@@ -0,0 +1,222 @@
+import numpy as np
+import healpy as hp
+from typing import Optional, Tuple
+
+from . import coords, neighbours
+from .groupfinder import _connected_components
+from .partition import _moments2barycenter, _partition_moments
+
+
+def partition_adjacency(
+    partitionmap: np.ndarray,
+    cache_dir: Optional[str] = None,
+    chunksize: int = 1000000,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the adjacency graph of the regions of a partition map.
+
+    The graph is found in one vectorised pass over the neighbour table (see
+    get_neighbour_table), chunksize pixels at a time.
+
+    Parameters
+    ----------
+    partitionmap : int array
+        Partitioned map IDs in RING ordering, zero outside the footprint.
+    cache_dir : str, optional
+        Directory where the neighbour table is persisted.
+    chunksize : int, optional
+        Number of pixels processed at once.
+
+    Returns
+    -------
+    region1, region2 : int array
+        IDs of each pair of touching regions, with region1 < region2.
+    counts : int array
+        Number of neighbouring pixel pairs shared by the boundary of each pair of
+        regions.
+    """
+    nside = hp.npix2nside(len(partitionmap))
+    table = neighbours.get_neighbour_table(nside, cache_dir=cache_dir)
+    labels = np.asarray(partitionmap).astype(int)
+    nregions = int(np.max(labels)) + 1 if len(labels) > 0 else 1
+    pixID = np.nonzero(labels)[0]
+    keys, counts = [], []
+    for start in range(0, len(pixID), chunksize):
+        pix = pixID[start : start + chunksize]
+        neighs = table[:, pix]
+        label1 = np.repeat(labels[pix][np.newaxis, :], len(neighs), axis=0)
+        label2 = np.where(neighs >= 0, labels[neighs], 0)
+        cond = np.where(label1 < label2)
+        _keys, _counts = np.unique(
+            label1[cond] * nregions + label2[cond], return_counts=True
+        )
+        keys.append(_keys)
+        counts.append(_counts)
+    if len(keys) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+    counts = np.bincount(inverse.reshape(-1), weights=np.concatenate(counts))
+    return keys // nregions, keys % nregions, counts.astype(int)
+
+
+_SUMMARY_DTYPE = [
+    ("partition", int),
+    ("count", int),
+    ("weight", float),
+    ("area", float),
+    ("phi", float),
+    ("the", float),
+    ("extent", float),
+    ("neff", float),
+]
+
+
+def partition_summary(
+    partition: np.ndarray,
+    weights: Optional[np.ndarray] = None,
+    phi: Optional[np.ndarray] = None,
+    the: Optional[np.ndarray] = None,
+    nside: Optional[int] = None,
+) -> np.ndarray:
+    """Returns the area, weighted centroid, angular extent and effective weight of
+    every region of a partition.
+
+    Everything is found with segmented reductions over the partition IDs, so the
+    cost is a single pass over the data whatever the number of regions. Centroids
+    are the barycenters of the weighted moments, as in find_map_barycenter.
+
+    Parameters
+    ----------
+    partition : int array
+        Partition IDs, zero for unassigned elements. A Healpix map in RING
+        ordering unless phi and the are given, in which case the IDs of each point.
+    weights : array, optional
+        Weight of each pixel or point, unit weights if not given.
+    phi, the : array, optional
+        Longitude and latitude coordinates of the points.
+    nside : int, optional
+        For points, the area of a region is that of the nside pixels it occupies.
+        If not given, areas of point partitions are NaN.
+
+    Returns
+    -------
+    summary : structured array
+        One row per non-empty region with fields 'partition' (ID), 'count' (number
+        of pixels or points), 'weight' (summed weight), 'area' (steradians), 'phi'
+        and 'the' (weighted barycenter), 'extent' (largest angular distance from
+        the barycenter) and 'neff' (effective weight, sum(w)^2/sum(w^2)).
+    """
+    labels = np.asarray(partition).astype(int)
+    if phi is None and the is None:
+        mapnside = hp.npix2nside(len(labels))
+        pixID = np.nonzero(labels)[0]
+        x, y, z = hp.pix2vec(mapnside, pixID)
+        labels = labels[pixID]
+        if weights is not None:
+            weights = np.asarray(weights, dtype=float)[pixID]
+    elif phi is not None and the is not None:
+        if len(phi) != len(labels) or len(the) != len(labels):
+            raise ValueError("phi, the and partition must have the same length.")
+        cond = np.nonzero(labels)[0]
+        labels = labels[cond]
+        phi, the = np.asarray(phi)[cond], np.asarray(the)[cond]
+        x, y, z = coords.sphere2cart(1.0, phi, the)
+        if weights is not None:
+            weights = np.asarray(weights, dtype=float)[cond]
+    else:
+        raise ValueError("phi and the must be given together.")
+    if weights is None:
+        weights = np.ones(len(labels))
+    if len(labels) == 0:
+        return np.zeros(0, dtype=_SUMMARY_DTYPE)
+    Npartitions = int(np.max(labels))
+    part_moments = _partition_moments(labels, x, y, z, weights, Npartitions)
+    counts = np.bincount(labels, minlength=Npartitions + 1)
+    weights2 = np.bincount(labels, weights=weights**2, minlength=Npartitions + 1)
+    IDs = np.nonzero(counts)[0]
+    IDs = IDs[IDs > 0]
+    summary = np.zeros(len(IDs), dtype=_SUMMARY_DTYPE)
+    summary["partition"] = IDs
+    summary["count"] = counts[IDs]
+    summary["weight"] = part_moments[IDs - 1, 3]
+    if phi is None:
+        summary["area"] = counts[IDs] * hp.nside2pixarea(mapnside)
+    elif nside is not None:
+        npix = hp.nside2npix(nside)
+        keys = np.unique(labels * npix + hp.ang2pix(nside, the, phi))
+        summary["area"] = np.bincount(keys // npix, minlength=Npartitions + 1)[
+            IDs
+        ] * hp.nside2pixarea(nside)
+    else:
+        summary["area"] = np.nan
+    with np.errstate(divide="ignore", invalid="ignore"):
+        phic, thec = _moments2barycenter(part_moments[IDs - 1].T)
+        summary["neff"] = summary["weight"] ** 2 / weights2[IDs]
+    summary["phi"], summary["the"] = phic, thec
+    # Largest angular distance from the barycenter, from the smallest dot product.
+    xc, yc, zc = np.zeros((3, Npartitions + 1))
+    xc[IDs], yc[IDs], zc[IDs] = coords.sphere2cart(1.0, phic, thec)
+    mindot = np.full(Npartitions + 1, np.inf)
+    np.minimum.at(mindot, labels, x * xc[labels] + y * yc[labels] + z * zc[labels])
+    summary["extent"] = np.arccos(np.clip(mindot[IDs], -1.0, 1.0))
+    summary["extent"][np.isnan(phic)] = np.nan
+    return summary
+
+
+def partition_components(
+    partitionmap: np.ndarray,
+    cache_dir: Optional[str] = None,
+    chunksize: int = 1000000,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Labels the connected components of every region of a partition map at once.
+
+    Two pixels are connected only if they are neighbours and share a partition ID,
+    so a single labelling pass, at the cost of one unionfinder call, finds every
+    region split into disconnected islands.
+
+    Parameters
+    ----------
+    partitionmap : int array
+        Partitioned map IDs in RING ordering, zero outside the footprint.
+    cache_dir : str, optional
+        Directory where the neighbour table is persisted.
+    chunksize : int, optional
+        Number of pixels processed at once.
+
+    Returns
+    -------
+    componentID : int array
+        Connected component labels, from 1 in RING order of their first pixel and
+        zero outside the footprint.
+    ncomponents : int array
+        Number of connected components of partitions 1 to max(partitionmap).
+    """
+    nside = hp.npix2nside(len(partitionmap))
+    table = neighbours.get_neighbour_table(nside, cache_dir=cache_dir)
+    labels = np.asarray(partitionmap).astype(int)
+    pixID = np.nonzero(labels)[0]
+    index = -np.ones(len(labels), dtype=int)
+    index[pixID] = np.arange(len(pixID))
+    edge1, edge2 = [], []
+    for start in range(0, len(pixID), chunksize):
+        pix = pixID[start : start + chunksize]
+        neighs = table[:, pix]
+        ind = np.repeat(index[pix][np.newaxis, :], len(neighs), axis=0)
+        neighind = np.where(neighs >= 0, index[neighs], -1)
+        same = labels[neighs] == labels[pix][np.newaxis, :]
+        cond = np.where((neighind > ind) & same)
+        edge1.append(ind[cond])
+        edge2.append(neighind[cond])
+    componentID = np.zeros(len(labels), dtype=int)
+    Npartitions = int(np.max(labels)) if len(pixID) > 0 else 0
+    if len(pixID) == 0:
+        return componentID, np.zeros(Npartitions, dtype=int)
+    components = _connected_components(
+        len(pixID), np.concatenate(edge1), np.concatenate(edge2)
+    )
+    componentID[pixID] = components
+    component_partition = np.zeros(np.max(components) + 1, dtype=int)
+    component_partition[components] = labels[pixID]
+    ncomponents = np.bincount(
+        component_partition[1:], minlength=Npartitions + 1
+    )[1 : Npartitions + 1]
+    return componentID, ncomponents
@@ -337,3 +337,102 @@ def backward_rotate(
     _phi, _the = rotate_usphere(_phi, _the, ra2)
     _phi, _the = rotate_usphere(_phi, _the, ra1)
     return _phi, _the
+
+
+def rotate2plane_basis(
+    c1: List[float], c2: List[float]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Finds the axes of the frame produced by rotate2plane expressed as unit
+    vectors in the original frame, so the rotation can be applied with dot
+    products instead of Euler rotations.
+
+    In this frame c1 and c2 lie along the equator with a midpoint at longitude
+    pi, i.e. the rotated longitude of a unit vector r is arctan2(yaxis.r, xaxis.r).
+
+    Parameters
+    ----------
+    c1, c2 : list
+        Coordinates of two points where c1 = [phi1, theta1] and c2 = [phi2, theta2].
+
+    Returns
+    -------
+    xaxis, yaxis, zaxis : array
+        Unit vectors of the rotated frame axes.
+    """
+    v1 = np.array(coords.sphere2cart(1.0, c1[0], c1[1]))
+    v2 = np.array(coords.sphere2cart(1.0, c2[0], c2[1]))
+    return _rotate2plane_basis(v1, v2)
+
+
+def _rotate2plane_basis(
+    v1: np.ndarray, v2: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Finds the axes of the frame produced by rotate2plane from two unit vectors.
+    See rotate2plane_basis.
+
+    Parameters
+    ----------
+    v1, v2 : array
+        Unit vectors of the two points.
+
+    Returns
+    -------
+    xaxis, yaxis, zaxis : array
+        Unit vectors of the rotated frame axes.
+    """
+    v1 = np.asarray(v1, dtype=float)
+    v2 = np.asarray(v2, dtype=float)
+    mid = v1 + v2
+    if maths.vector_norm(mid) == 0.0:
+        # Antipodal points have no unique midpoint.
+        mid = _perpendicular(v2)
+    mid = maths.vector_normalise(mid)
+    tangent = v2 - v1
+    tangent = tangent - maths.vector_dot(tangent, mid) * mid
+    if maths.vector_norm(tangent) == 0.0:
+        # Coincident points have no unique great circle.
+        tangent = _perpendicular(mid)
+    tangent = maths.vector_normalise(tangent)
+    xaxis = -mid
+    yaxis = -tangent
+    zaxis = maths.vector_cross(xaxis, yaxis)
+    return xaxis, yaxis, zaxis
+
+
+def _perpendicular(v: np.ndarray) -> np.ndarray:
+    """Returns a unit vector perpendicular to v.
+
+    Parameters
+    ----------
+    v : array
+        Input vector.
+    """
+    axis = np.zeros(3)
+    axis[np.argmin(np.abs(v))] = 1.0
+    return maths.vector_normalise(maths.vector_cross(v, axis))
+
+
+def _pseudo_longitude(
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    xaxis: np.ndarray,
+    yaxis: np.ndarray,
+) -> np.ndarray:
+    """Returns the pseudo-angle of the longitude of unit vectors in a rotated frame.
+
+    Parameters
+    ----------
+    x, y, z : array
+        Unit vector coordinates.
+    xaxis, yaxis : array
+        The x and y axes of the rotated frame.
+
+    Returns
+    -------
+    p : array
+        Pseudo-angle of the longitude in the rotated frame, in the range [0, 4).
+    """
+    xr = xaxis[0] * x + xaxis[1] * y + xaxis[2] * z
+    yr = yaxis[0] * x + yaxis[1] * y + yaxis[2] * z
+    return maths.pseudo_angle(yr, xr)
@@ -0,0 +1,153 @@
+import numpy as np
+from typing import Dict, List, Optional
+
+
+def weighted_sketch(
+    lo: float, hi: float, tolerance: float = 1e-4
+) -> Dict[str, np.ndarray]:
+    """Returns an empty weighted quantile sketch of the values in [lo, hi].
+
+    The sketch is a weighted histogram with bins no wider than tolerance. It can
+    be fed values chunk by chunk with update_sketch, and sketches built from
+    different chunks or workers with the same lo, hi and tolerance are merged
+    exactly with merge_sketches, so splitting longitudes can be found without
+    holding every longitude in memory.
+
+    Parameters
+    ----------
+    lo, hi : float
+        Range of the values.
+    tolerance : float, optional
+        Maximum bin width, which sets the accuracy of the quantiles.
+
+    Returns
+    -------
+    sketch : dict
+        Empty sketch.
+    """
+    if hi < lo:
+        raise ValueError("hi must be greater than or equal to lo.")
+    if tolerance <= 0.0:
+        raise ValueError("tolerance must be > 0.")
+    nbins = max(int(np.ceil((hi - lo) / tolerance)), 1)
+    sketch = {"lo": float(lo), "hi": float(hi), "weights": np.zeros(nbins)}
+    return sketch
+
+
+def update_sketch(
+    sketch: Dict[str, np.ndarray],
+    values: np.ndarray,
+    weights: Optional[np.ndarray] = None,
+) -> None:
+    """Adds values to a weighted quantile sketch, in place.
+
+    Values outside of the sketch range are added to the first or last bin.
+
+    Parameters
+    ----------
+    sketch : dict
+        Weighted quantile sketch.
+    values : array
+        Values to add.
+    weights : array, optional
+        Weights of the values.
+    """
+    values = np.asarray(values, dtype=float)
+    if weights is None:
+        weights = np.ones(len(values))
+    nbins = len(sketch["weights"])
+    width = sketch["hi"] - sketch["lo"]
+    if width == 0.0:
+        bins = np.zeros(len(values), dtype=int)
+    else:
+        # Bin i holds lo + i * dx < value <= lo + (i + 1) * dx.
+        bins = np.ceil((values - sketch["lo"]) * nbins / width).astype(int) - 1
+        bins = np.clip(bins, 0, nbins - 1)
+    sketch["weights"] += np.bincount(bins, weights=weights, minlength=nbins)
+
+
+def merge_sketches(sketches: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Merges weighted quantile sketches of the same range and resolution.
+
+    Parameters
+    ----------
+    sketches : list
+        Weighted quantile sketches.
+
+    Returns
+    -------
+    sketch : dict
+        Merged sketch.
+    """
+    for _sketch in sketches[1:]:
+        if (
+            _sketch["lo"] != sketches[0]["lo"]
+            or _sketch["hi"] != sketches[0]["hi"]
+            or len(_sketch["weights"]) != len(sketches[0]["weights"])
+        ):
+            raise ValueError("Sketches must have the same range and resolution.")
+    sketch = {
+        "lo": sketches[0]["lo"],
+        "hi": sketches[0]["hi"],
+        "weights": np.sum([_sketch["weights"] for _sketch in sketches], axis=0),
+    }
+    return sketch
+
+
+def sketch_quantiles(
+    sketch: Dict[str, np.ndarray], shares: List[float]
+) -> np.ndarray:
+    """Returns the values splitting the sketched weights into len(shares) pieces
+    with weights proportional to shares.
+
+    The cumulative weight is interpolated linearly within the bin containing each
+    target, so the values are found to within the bin width.
+
+    Parameters
+    ----------
+    sketch : dict
+        Weighted quantile sketch.
+    shares : list
+        Relative weight assigned to each piece.
+
+    Returns
+    -------
+    quantiles : array
+        The len(shares) - 1 splitting values.
+    """
+    if np.sum(sketch["weights"]) == 0.0:
+        raise ValueError("Weights must contain at least one non-zero value.")
+    if len(shares) < 2:
+        raise ValueError("shares must have at least two elements.")
+    nbins = len(sketch["weights"])
+    edges = np.linspace(sketch["lo"], sketch["hi"], nbins + 1)
+    cumweights = np.concatenate([[0.0], np.cumsum(sketch["weights"])])
+    targets = cumweights[-1] * np.cumsum(shares)[:-1] / np.sum(shares)
+    ind = np.searchsorted(cumweights, targets, side="left")
+    ind = np.clip(ind, 1, nbins)
+    binweights = sketch["weights"][ind - 1]
+    frac = np.zeros(len(targets))
+    cond = np.where(binweights > 0.0)[0]
+    frac[cond] = (targets[cond] - cumweights[ind[cond] - 1]) / binweights[cond]
+    quantiles = edges[ind - 1] + np.clip(frac, 0.0, 1.0) * (edges[ind] - edges[ind - 1])
+    return quantiles
+
+
+def sketch_dphi(sketch: Dict[str, np.ndarray], balance: float = 1) -> float:
+    """Returns the splitting longitude from a weighted quantile sketch, with the
+    weights below the split multiplied by balance equal to the weights above, as
+    in find_dphi.
+
+    Parameters
+    ----------
+    sketch : dict
+        Weighted quantile sketch of the longitudes.
+    balance : float, optional
+        A multiplication factor assigned to weights below the split.
+
+    Returns
+    -------
+    dphi : float
+        Splitting longitude.
+    """
+    return float(sketch_quantiles(sketch, [1.0, balance])[0])
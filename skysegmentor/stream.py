@@ -0,0 +1,584 @@
+import os
+import tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from . import coords, maths, rotate
+from .partition import _center_basis, _check_Nsplit, _most_dist_vectors, _split_shares
+from .tree import _new_tree, _record_split
+
+
+Shard = Union[str, np.ndarray]
+
+
+def _load_shard(shard: Shard, mode: str = "r") -> np.ndarray:
+    """Returns a shard as an array, memory mapping .npy files.
+
+    Parameters
+    ----------
+    shard : str or array
+        Path to a .npy file or an array.
+    mode : str, optional
+        Memory map mode used for .npy files.
+
+    Returns
+    -------
+    data : array
+        Shard data.
+    """
+    if isinstance(shard, str):
+        return np.load(shard, mmap_mode=mode)
+    return shard
+
+
+def _iterate_chunks(
+    data: np.ndarray, chunksize: int
+) -> Iterator[Tuple[slice, np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """Iterates over a catalog shard in chunks, converting each chunk to unit
+    vectors.
+
+    Parameters
+    ----------
+    data : array
+        Shard of shape (N, 2) or (N, 3) with columns phi, theta and optionally the
+        weights.
+    chunksize : int
+        Number of rows read at once.
+
+    Yields
+    ------
+    chunk : slice
+        Rows of the chunk.
+    x, y, z : array
+        Unit vector coordinates.
+    weights : array
+        Weights.
+    """
+    for start in range(0, len(data), chunksize):
+        chunk = slice(start, min(start + chunksize, len(data)))
+        _data = np.asarray(data[chunk], dtype=float)
+        x, y, z = coords.sphere2cart(np.ones(len(_data)), _data[:, 0], _data[:, 1])
+        if np.shape(_data)[1] > 2:
+            weights = _data[:, 2]
+        else:
+            weights = np.ones(len(_data))
+        yield chunk, x, y, z, weights
+
+
+def _reduce_border(
+    keys: np.ndarray, dots: np.ndarray, vecs: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Keeps the border candidate with the smallest dot product for each key.
+
+    Parameters
+    ----------
+    keys : int array
+        Partition and angular bin key of each candidate.
+    dots : array
+        Dot product of each candidate with its partition center.
+    vecs : array
+        Unit vectors of the candidates, shape (N, 3).
+
+    Returns
+    -------
+    keys, dots, vecs : array
+        Reduced candidates, one per key.
+    """
+    order = np.lexsort((dots, keys))
+    keys, first = np.unique(keys[order], return_index=True)
+    ind = order[first]
+    return keys, dots[ind], vecs[ind]
+
+
+def _chunk_members(
+    labels: np.ndarray, lookup: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the members of a chunk in the partitions being processed.
+
+    Parameters
+    ----------
+    labels : int array
+        Partition IDs of the chunk.
+    lookup : int array
+        Row of each partition ID in the per-partition arrays, -1 if not processed.
+
+    Returns
+    -------
+    ind : int array
+        Index of the members in the chunk.
+    rows : int array
+        Row of each member's partition.
+    """
+    rows = lookup[np.asarray(labels, dtype=int)]
+    ind = np.where(rows >= 0)[0]
+    return ind, rows[ind]
+
+
+def _shard_pass(
+    shard: Shard,
+    labels: Shard,
+    chunksize: int = 1000000,
+    moments: Optional[int] = None,
+    assign: Optional[Dict[str, np.ndarray]] = None,
+    border: Optional[Dict[str, np.ndarray]] = None,
+    hist: Optional[Dict[str, np.ndarray]] = None,
+) -> Dict[str, np.ndarray]:
+    """Makes a single chunked pass over a shard, assigning split partitions and
+    collecting the summaries needed to split the next partitions.
+
+    Parameters
+    ----------
+    shard : str or array
+        Catalog shard, see segmentshardsN.
+    labels : str or array
+        Partition IDs of the shard, updated in place if assign is given.
+    chunksize : int, optional
+        Number of rows read at once.
+    moments : int, optional
+        If given, the moments of partitions 1 to moments are summed.
+    assign : dict, optional
+        Splits to apply, with the partition lookup, frame axes, padded cuts and
+        first new partition ID of each split partition.
+    border : dict, optional
+        Partitions to find border candidates for, with the partition lookup,
+        center basis vectors, centers and angular resolution.
+    hist : dict, optional
+        Partitions to histogram, with the partition lookup, frame axes, window
+        edges and number of bins.
+
+    Returns
+    -------
+    summary : dict
+        Reduced summaries of the shard.
+    """
+    data = _load_shard(shard)
+    _labels = _load_shard(labels, mode="r+")
+    summary = {}
+    if moments is not None:
+        summary["moments"] = np.zeros((moments, 4))
+    if border is not None:
+        summary["border"] = (np.zeros(0, dtype=int), np.zeros(0), np.zeros((0, 3)))
+    if hist is not None:
+        nrows, nwindows = np.shape(hist["lo"])
+        summary["hist"] = np.zeros((nwindows, nrows * hist["nbins"], 4))
+    for chunk, x, y, z, weights in _iterate_chunks(data, chunksize):
+        labels_chunk = np.array(_labels[chunk], dtype=int)
+        if assign is not None:
+            ind, rows = _chunk_members(labels_chunk, assign["lookup"])
+            p = rotate._pseudo_longitude(
+                x[ind], y[ind], z[ind], assign["xaxis"][rows].T, assign["yaxis"][rows].T
+            )
+            child = np.sum(p[:, np.newaxis] > assign["cuts"][rows], axis=1)
+            cond = np.where(child > 0)[0]
+            labels_chunk[ind[cond]] = (
+                assign["newpartition"][rows[cond]] + child[cond] - 1
+            )
+            _labels[chunk] = labels_chunk
+        if moments is not None:
+            for i, w in enumerate([weights * x, weights * y, weights * z, weights]):
+                summary["moments"][:, i] += np.bincount(
+                    labels_chunk, weights=w, minlength=moments + 1
+                )[1 : moments + 1]
+        if border is not None:
+            ind, rows = _chunk_members(labels_chunk, border["lookup"])
+            _x, _y, _z = x[ind], y[ind], z[ind]
+            p = rotate._pseudo_longitude(
+                _x, _y, _z, border["etheta"][rows].T, border["ephi"][rows].T
+            )
+            res = border["res"]
+            keys = rows * res + np.minimum((p * (res / 4.0)).astype(int), res - 1)
+            dots = np.sum(np.array([_x, _y, _z]).T * border["centers"][rows], axis=1)
+            vecs = np.array([_x, _y, _z]).T
+            summary["border"] = _reduce_border(
+                *[
+                    np.concatenate([a, b])
+                    for a, b in zip(summary["border"], (keys, dots, vecs))
+                ]
+            )
+        if hist is not None:
+            ind, rows = _chunk_members(labels_chunk, hist["lookup"])
+            _x, _y, _z, _w = x[ind], y[ind], z[ind], weights[ind]
+            p = rotate._pseudo_longitude(
+                _x, _y, _z, hist["xaxis"][rows].T, hist["yaxis"][rows].T
+            )
+            nbins = hist["nbins"]
+            for j in range(nwindows):
+                lo, hi = hist["lo"][rows, j], hist["hi"][rows, j]
+                cond = np.where((p >= lo) & (p <= hi))[0]
+                bins = np.ceil((p[cond] - lo[cond]) * nbins / (hi[cond] - lo[cond]))
+                bins = np.clip(bins.astype(int) - 1, 0, nbins - 1)
+                keys = rows[cond] * nbins + bins
+                for i, w in enumerate([_w * _x, _w * _y, _w * _z, _w]):
+                    summary["hist"][j, :, i] += np.bincount(
+                        keys, weights=w[cond], minlength=nrows * nbins
+                    )
+    if isinstance(labels, str):
+        _labels.flush()
+    if hist is not None:
+        summary["hist"] = summary["hist"].reshape(nwindows, nrows, hist["nbins"], 4)
+    return summary
+
+
+def _shard_pass_star(args: Tuple) -> Dict[str, np.ndarray]:
+    """Runs _shard_pass from a single tuple of arguments, for use with map.
+
+    Parameters
+    ----------
+    args : tuple
+        The shard, labels, chunk size and keyword arguments of _shard_pass.
+
+    Returns
+    -------
+    summary : dict
+        Reduced summaries of the shard.
+    """
+    shard, labels, chunksize, kwargs = args
+    return _shard_pass(shard, labels, chunksize=chunksize, **kwargs)
+
+
+def _reduce_summaries(summaries: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Merges the summaries of several shards.
+
+    Parameters
+    ----------
+    summaries : list
+        Shard summaries from _shard_pass.
+
+    Returns
+    -------
+    summary : dict
+        Merged summary.
+    """
+    summary = {}
+    for key in summaries[0]:
+        if key == "border":
+            summary[key] = _reduce_border(
+                *[np.concatenate([s[key][i] for s in summaries]) for i in range(3)]
+            )
+        else:
+            summary[key] = np.sum([s[key] for s in summaries], axis=0)
+    return summary
+
+
+def _level_splits(
+    part_Npart: np.ndarray, maxpartition: int, Nsplit: int
+) -> Tuple[List[Tuple[int, np.ndarray, List[int]]], int]:
+    """Returns every split of one level of the partition tree, so that all
+    partitions of a level can be split from the same passes over the data.
+
+    Parameters
+    ----------
+    part_Npart : int array
+        The number of final partitions assigned to each partition ID, updated in
+        place.
+    maxpartition : int
+        The number of partition IDs already in use.
+    Nsplit : int
+        Maximum number of pieces each region is split into at once.
+
+    Returns
+    -------
+    splits : list
+        Index of the partition, indices of the new partitions and shares of each
+        split.
+    maxpartition : int
+        The number of partition IDs in use after the splits.
+    """
+    splits = []
+    for i in np.where(part_Npart > 1)[0]:
+        shares = _split_shares(part_Npart[i], min(Nsplit, part_Npart[i]))
+        newindex = np.arange(maxpartition, maxpartition + len(shares) - 1)
+        part_Npart[i] = shares[0]
+        part_Npart[newindex] = shares[1:]
+        maxpartition += len(shares) - 1
+        splits.append((i, newindex, shares))
+    return splits, maxpartition
+
+
+def _histogram_windows(
+    hist: np.ndarray,
+    lo: np.ndarray,
+    hi: np.ndarray,
+    base: np.ndarray,
+    targets: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Finds the histogram bins containing target cumulative weights.
+
+    Parameters
+    ----------
+    hist : array
+        Moments in each bin, shape (nbins, 4).
+    lo, hi : float
+        Edges of the histogrammed window.
+    base : array
+        Cumulative moments below the window.
+    targets : array
+        Target cumulative weights.
+
+    Returns
+    -------
+    cut_lo, cut_hi : array
+        Edges of the bin containing each target.
+    cut_base : array
+        Cumulative moments below each bin, shape (len(targets), 4).
+    cuts : array
+        Bin edge closest to each target.
+    cut_moments : array
+        Cumulative moments below each closest edge, shape (len(targets), 4).
+    """
+    nbins = len(hist)
+    edges = lo + (hi - lo) * np.arange(nbins + 1) / nbins
+    cum = base + np.concatenate([np.zeros((1, 4)), np.cumsum(hist, axis=0)])
+    ind = np.searchsorted(cum[:, 3], targets, side="left")
+    ind = np.clip(ind, 1, nbins)
+    closer = np.abs(cum[ind - 1, 3] - targets) <= np.abs(cum[ind, 3] - targets)
+    best = np.where(closer, ind - 1, ind)
+    return edges[ind - 1], edges[ind], cum[ind - 1], edges[best], cum[best]
+
+
+def segmentshardsN(
+    shards: List[Shard],
+    Npartitions: int,
+    labels: Optional[List[Shard]] = None,
+    res: int = 100,
+    Nsplit: int = 2,
+    nbins: int = 1024,
+    nrefine: int = 1,
+    chunksize: int = 1000000,
+    return_tree: bool = False,
+    mapper: Callable = map,
+    nworkers: int = 1,
+) -> Union[List[np.ndarray], Tuple[List[np.ndarray], Dict[str, np.ndarray]]]:
+    """Segments a catalog of points stored in shards into equal Npartition sides,
+    without loading the catalog into memory.
+
+    Shards are read in chunks of chunksize rows, so peak memory is set by the chunk
+    size rather than the catalog size. All the partitions of a level of the tree
+    are split together: the border of each partition is found from one pass
+    (shared with writing the labels of the previous level) and the splitting
+    longitudes from a weighted histogram of the rotated longitudes, which is then
+    refined nrefine times around each target. The moments of each bin are stored
+    so that the moments of the children are exact, so the moments of the full
+    catalog are only summed once.
+
+    Each pass is a map over the shards followed by a reduction of the small per
+    shard summaries (moments, border candidates and longitude histograms), so with
+    nworkers > 1 the shards are processed by a pool of local worker processes
+    which read the shards and write the labels themselves, and coordinates are
+    never sent between processes.
+
+    Parameters
+    ----------
+    shards : list
+        Catalog shards, either paths to .npy files (which are memory mapped) or
+        arrays, of shape (N, 2) or (N, 3) with columns phi, theta and optionally
+        the weights.
+    Npartitions : int
+        Number of partitioned regions
+    labels : list, optional
+        Paths to .npy files or arrays of length N for each shard, where the
+        partition IDs are written. Files are created or overwritten. By
+        default labels are returned as in-memory arrays.
+    res : int, optional
+        Number of angular bins around the barycenter used to find region border.
+    Nsplit : int, optional
+        Maximum number of pieces each region is split into at once.
+    nbins : int, optional
+        Number of bins of the longitude histograms.
+    nrefine : int, optional
+        Number of extra passes refining the histogram around each split, the
+        splitting longitude is found to within 4 / nbins ** (nrefine + 1) in
+        pseudo-angle.
+    chunksize : int, optional
+        Number of rows read at once.
+    return_tree : bool, optional
+        If True the partition tree is also returned.
+    mapper : callable, optional
+        Map function used to run the per-shard passes, e.g. the map method of a
+        process pool executor.
+    nworkers : int, optional
+        If > 1, the number of worker processes used to run the per-shard passes.
+        Shards and labels should then be paths to .npy files, if labels are not
+        given they are written to a temporary directory and returned in memory.
+
+    Returns
+    -------
+    labels : list
+        Partition IDs for each shard.
+    tree : dict
+        Partition tree, only returned if return_tree is True.
+    """
+    if Npartitions <= 1:
+        raise ValueError("Npartitions must be > 1.")
+    _check_Nsplit(Nsplit)
+
+    if nworkers > 1:
+        kwargs = {
+            "res": res,
+            "Nsplit": Nsplit,
+            "nbins": nbins,
+            "nrefine": nrefine,
+            "chunksize": chunksize,
+            "return_tree": return_tree,
+        }
+        if labels is None:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                _labels = [
+                    os.path.join(tmpdir, "labels%i.npy" % i) for i in range(len(shards))
+                ]
+                output = segmentshardsN(
+                    shards, Npartitions, labels=_labels, nworkers=nworkers, **kwargs
+                )
+                if return_tree:
+                    return [np.array(label) for label in output[0]], output[1]
+                return [np.array(label) for label in output]
+        if any(not isinstance(label, str) for label in labels):
+            raise ValueError("labels must be paths to .npy files when nworkers > 1.")
+        with ProcessPoolExecutor(max_workers=nworkers) as executor:
+            return segmentshardsN(
+                shards, Npartitions, labels=labels, mapper=executor.map, **kwargs
+            )
+
+    if labels is None:
+        labels = [np.ones(len(_load_shard(shard)), dtype=int) for shard in shards]
+    else:
+        for shard, label in zip(shards, labels):
+            if isinstance(label, str):
+                _label = np.lib.format.open_memmap(
+                    label, mode="w+", dtype=int, shape=(len(_load_shard(shard)),)
+                )
+            else:
+                _label = label
+            _label[:] = 1
+            if isinstance(label, str):
+                _label.flush()
+                del _label
+
+    def _run_pass(**kwargs):
+        summaries = list(
+            mapper(
+                _shard_pass_star,
+                [
+                    (shard, label, chunksize, kwargs)
+                    for shard, label in zip(shards, labels)
+                ],
+            )
+        )
+        return _reduce_summaries(summaries)
+
+    part_Npart = np.zeros(Npartitions, dtype=int)
+    part_Npart[0] = Npartitions
+    part_moments = np.zeros((Npartitions, 4))
+    part_moments[0] = _run_pass(moments=1)["moments"][0]
+    tree = _new_tree()
+    maxpartition = 1
+    assign = None
+
+    while any(part_Npart == 0):
+        splits, maxpartition = _level_splits(part_Npart, maxpartition, Nsplit)
+        nrows = len(splits)
+        index = np.array([split[0] for split in splits])
+        lookup = np.full(Npartitions + 1, -1)
+        lookup[index + 1] = np.arange(nrows)
+        if np.any(part_moments[index, 3] == 0.0):
+            raise ValueError("Weights must contain at least one non-zero value.")
+        # Moments which cancel to rounding error have no barycenter direction.
+        norms = np.linalg.norm(part_moments[index, :3], axis=1)
+        if np.any(norms <= 1e-12 * np.abs(part_moments[index, 3])):
+            raise ValueError(
+                "Weighted moments of a partition sum to zero, so its barycenter "
+                "direction is undefined."
+            )
+
+        centers = np.array([maths.vector_normalise(part_moments[i, :3]) for i in index])
+        etheta, ephi = np.array(
+            [_center_basis(center) for center in centers]
+        ).transpose(1, 0, 2)
+        border = {
+            "lookup": lookup,
+            "centers": centers,
+            "etheta": etheta,
+            "ephi": ephi,
+            "res": res,
+        }
+        keys, _, vecs = _run_pass(assign=assign, border=border)["border"]
+        xaxis, yaxis = np.zeros((nrows, 3)), np.zeros((nrows, 3))
+        for row in range(nrows):
+            cond = np.where(keys // res == row)[0]
+            v1, v2 = _most_dist_vectors(*vecs[cond].T)
+            xaxis[row], yaxis[row], _ = rotate._rotate2plane_basis(v1, v2)
+
+        ncuts = max(len(split[2]) for split in splits) - 1
+        targets = np.full((nrows, ncuts), np.inf)
+        for row, (i, _, shares) in enumerate(splits):
+            targets[row, : len(shares) - 1] = (
+                part_moments[i, 3] * np.cumsum(shares)[:-1] / np.sum(shares)
+            )
+        lo, hi = np.zeros((nrows, 1)), np.full((nrows, 1), 4.0)
+        base = np.zeros((nrows, 1, 4))
+        for k in range(nrefine + 1):
+            hists = _run_pass(
+                hist={
+                    "lookup": lookup,
+                    "xaxis": xaxis,
+                    "yaxis": yaxis,
+                    "lo": lo,
+                    "hi": hi,
+                    "nbins": nbins,
+                }
+            )["hist"]
+            # Windows of missing cuts are left empty, with lo > hi.
+            _lo, _hi = np.ones((nrows, ncuts)), np.zeros((nrows, ncuts))
+            _base = np.zeros((nrows, ncuts, 4))
+            cuts = np.full((nrows, ncuts), np.inf)
+            cut_moments = np.zeros((nrows, ncuts, 4))
+            for row in range(nrows):
+                for j in range(ncuts):
+                    if np.isinf(targets[row, j]):
+                        continue
+                    # The first pass has a single window shared by every cut.
+                    w = 0 if k == 0 else j
+                    output = _histogram_windows(
+                        hists[w, row],
+                        lo[row, w],
+                        hi[row, w],
+                        base[row, w],
+                        targets[row, j : j + 1],
+                    )
+                    _lo[row, j], _hi[row, j] = output[0][0], output[1][0]
+                    _base[row, j] = output[2][0]
+                    cuts[row, j], cut_moments[row, j] = output[3][0], output[4][0]
+            lo, hi, base = _lo, _hi, _base
+
+        newpartition = np.zeros(nrows, dtype=int)
+        for row, (i, j, shares) in enumerate(splits):
+            nsplit = len(shares)
+            cum = np.concatenate(
+                [np.zeros((1, 4)), cut_moments[row, : nsplit - 1], [part_moments[i]]]
+            )
+            child_moments = np.diff(cum, axis=0)
+            part_moments[i] = child_moments[0]
+            part_moments[j] = child_moments[1:]
+            newpartition[row] = j[0] + 1
+            _record_split(
+                tree,
+                i + 1,
+                j[0] + 1,
+                shares,
+                (xaxis[row], yaxis[row], cuts[row, : nsplit - 1]),
+            )
+        assign = {
+            "lookup": lookup,
+            "xaxis": xaxis,
+            "yaxis": yaxis,
+            "cuts": cuts,
+            "newpartition": newpartition,
+        }
+
+    _run_pass(assign=assign)
+
+    labels = [_load_shard(label) for label in labels]
+    if return_tree:
+        return labels, tree
+    return labels
@@ -0,0 +1,223 @@
+import numpy as np
+from typing import Dict, List, Tuple
+
+from . import rotate
+
+
+def _new_tree() -> Dict[str, np.ndarray]:
+    """Returns an empty partition tree.
+
+    A partition tree records every split in the order it was made. Split i divides
+    partition[i] into nsplit[i] pieces, the first keeps the partition ID while the
+    rest are given the IDs newpartition[i] to newpartition[i] + nsplit[i] - 2.
+    Each split is stored as the frame axes xaxis[i] and yaxis[i] and the pseudo-
+    longitudes cuts[i] of the split in that frame (see apply_partition_tree),
+    together with the number of final partitions assigned to each piece, shares[i].
+
+    Returns
+    -------
+    tree : dict
+        Empty partition tree.
+    """
+    tree = {
+        "partition": np.zeros(0, dtype=int),
+        "newpartition": np.zeros(0, dtype=int),
+        "nsplit": np.zeros(0, dtype=int),
+        "shares": np.zeros((0, 2), dtype=int),
+        "xaxis": np.zeros((0, 3)),
+        "yaxis": np.zeros((0, 3)),
+        "cuts": np.zeros((0, 1)),
+    }
+    return tree
+
+
+def _pad_columns(array: np.ndarray, ncols: int, val: float) -> np.ndarray:
+    """Pads a 2D array with extra columns filled with a given value.
+
+    Parameters
+    ----------
+    array : array
+        2D array.
+    ncols : int
+        Minimum number of columns.
+    val : float
+        Value assigned to the padded columns.
+    """
+    if np.shape(array)[1] >= ncols:
+        return array
+    pad = np.full((len(array), ncols - np.shape(array)[1]), val, dtype=array.dtype)
+    return np.concatenate([array, pad], axis=1)
+
+
+def _record_split(
+    tree: Dict[str, np.ndarray],
+    partition: int,
+    newpartition: int,
+    shares: List[int],
+    geometry: Tuple[np.ndarray, np.ndarray, np.ndarray],
+) -> None:
+    """Appends a split to a partition tree.
+
+    Parameters
+    ----------
+    tree : dict
+        Partition tree, updated in place.
+    partition : int
+        ID of the partition that was split.
+    newpartition : int
+        ID of the first new partition.
+    shares : list
+        Number of final partitions assigned to each piece.
+    geometry : tuple
+        The split frame axes and splitting pseudo-longitudes (xaxis, yaxis, cuts).
+    """
+    xaxis, yaxis, cuts = geometry
+    nsplit = len(shares)
+    tree["shares"] = _pad_columns(tree["shares"], nsplit, 0)
+    tree["cuts"] = _pad_columns(tree["cuts"], nsplit - 1, np.nan)
+    _shares = np.zeros((1, np.shape(tree["shares"])[1]), dtype=int)
+    _shares[0, :nsplit] = shares
+    _cuts = np.full((1, np.shape(tree["cuts"])[1]), np.nan)
+    _cuts[0, : nsplit - 1] = cuts
+    tree["partition"] = np.append(tree["partition"], int(partition))
+    tree["newpartition"] = np.append(tree["newpartition"], int(newpartition))
+    tree["nsplit"] = np.append(tree["nsplit"], nsplit)
+    tree["shares"] = np.concatenate([tree["shares"], _shares])
+    tree["xaxis"] = np.concatenate([tree["xaxis"], [xaxis]])
+    tree["yaxis"] = np.concatenate([tree["yaxis"], [yaxis]])
+    tree["cuts"] = np.concatenate([tree["cuts"], _cuts])
+
+
+def _coarsen_mapping(tree: Dict[str, np.ndarray], nkeep: int) -> np.ndarray:
+    """Returns the partition each final partition belongs to once every split
+    after the first nkeep splits is undone.
+
+    Parameters
+    ----------
+    tree : dict
+        Partition tree.
+    nkeep : int
+        Number of splits kept.
+
+    Returns
+    -------
+    mapping : int array
+        Coarser partition ID of final partitions 0 to the number of partitions.
+    """
+    maxpartition = 1 + int(np.sum(tree["nsplit"] - 1))
+    mapping = np.arange(maxpartition + 1)
+    for i in range(nkeep, len(tree["partition"])):
+        newpartition = tree["newpartition"][i]
+        newIDs = np.arange(newpartition, newpartition + tree["nsplit"][i] - 1)
+        mapping[newIDs] = mapping[tree["partition"][i]]
+    return mapping
+
+
+def _is_balanced(mapping: np.ndarray) -> bool:
+    """Checks every coarser partition holds the same number of final partitions."""
+    counts = np.bincount(mapping[1:])[1:]
+    return bool(np.all(counts == counts[0]))
+
+
+def get_tree_levels(
+    tree: Dict[str, np.ndarray], balanced: bool = False
+) -> np.ndarray:
+    """Returns the number of partitions after each split of a partition tree.
+
+    Parameters
+    ----------
+    tree : dict
+        Partition tree.
+    balanced : bool, optional
+        If True only the levels whose partitions each hold the same number of
+        final partitions, and are therefore equal in weight, are returned. These
+        are the levels that can be read out with coarsen_partition.
+
+    Returns
+    -------
+    levels : int array
+        Number of partitions after each split, starting from the single unsplit
+        region.
+    """
+    levels = np.concatenate([[1], 1 + np.cumsum(tree["nsplit"] - 1)])
+    if balanced:
+        cond = [_is_balanced(_coarsen_mapping(tree, i)) for i in range(len(levels))]
+        levels = levels[np.array(cond, dtype=bool)]
+    return levels
+
+
+def coarsen_partition(
+    partitionID: np.ndarray, tree: Dict[str, np.ndarray], Npartitions: int
+) -> np.ndarray:
+    """Reads out the coarser partitioning of a recorded partition tree, by undoing
+    every split made after the tree first reached Npartitions.
+
+    Npartitions must be a balanced level of the tree (see get_tree_levels), where
+    every partition holds the same number of final partitions and so the same
+    weight. These include the levels the tree was built or refined to, e.g. by
+    running segmentmapN for the smallest Npartitions and refining with refinemapN
+    for each larger one, and the levels of a tree built for a power of Nsplit.
+
+    Parameters
+    ----------
+    partitionID : int array
+        Partition IDs from the tree, zero for unassigned elements.
+    tree : dict
+        Partition tree.
+    Npartitions : int
+        Number of partitions to read out.
+
+    Returns
+    -------
+    partitionID : int array
+        Coarser partition IDs.
+    """
+    levels = get_tree_levels(tree)
+    nkeep = np.searchsorted(levels, Npartitions, side="left")
+    if nkeep == len(levels) or levels[nkeep] != Npartitions:
+        raise ValueError("Npartitions is not a level of the partition tree.")
+    mapping = _coarsen_mapping(tree, nkeep)
+    if not _is_balanced(mapping):
+        raise ValueError(
+            "Npartitions is not a balanced level of the partition tree, its "
+            "partitions would not be equal in weight."
+        )
+    _partitionID = np.asarray(partitionID)
+    return mapping[_partitionID.astype(int)].astype(_partitionID.dtype)
+
+
+def apply_partition_tree(
+    x: np.ndarray, y: np.ndarray, z: np.ndarray, tree: Dict[str, np.ndarray]
+) -> np.ndarray:
+    """Assigns unit vectors to partitions by replaying the splits of a recorded
+    partition tree.
+
+    For each split the members of the partition are assigned to the pieces by
+    comparing the pseudo-angle of arctan2(yaxis.r, xaxis.r) with the cuts, where
+    piece i contains cuts[i-1] < p <= cuts[i].
+
+    Parameters
+    ----------
+    x, y, z : array
+        Unit vector coordinates.
+    tree : dict
+        Partition tree.
+
+    Returns
+    -------
+    partitionID : int array
+        Partition IDs.
+    """
+    partitionID = np.ones(len(x), dtype=int)
+    for i in range(0, len(tree["partition"])):
+        ind = np.where(partitionID == tree["partition"][i])[0]
+        if len(ind) == 0:
+            continue
+        p = rotate._pseudo_longitude(
+            x[ind], y[ind], z[ind], tree["xaxis"][i], tree["yaxis"][i]
+        )
+        cuts = tree["cuts"][i, : tree["nsplit"][i] - 1]
+        child = np.searchsorted(cuts, p, side="left")
+        cond = np.where(child > 0)[0]
+        partitionID[ind[cond]] = tree["newpartition"][i] + child[cond] - 1
+    return partitionID
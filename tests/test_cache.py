@@ -0,0 +1,75 @@
+import os
+import numpy as np
+import healpy as hp
+
+import skysegmentor
+
+
+def _footprint(nside=16):
+    the, phi = hp.pix2ang(nside, np.arange(hp.nside2npix(nside)))
+    bnmap = np.zeros(len(the))
+    bnmap[the < 0.6 * np.pi] = 1.0
+    return bnmap
+
+
+def test_segmentmapN_result_cache(tmp_path):
+    bnmap = _footprint()
+    cache_dir = str(tmp_path / "cache")
+    partitionmap = skysegmentor.segmentmapN(bnmap, 4, result_cache=cache_dir)
+    assert np.array_equal(partitionmap, skysegmentor.segmentmapN(bnmap, 4))
+    assert len(os.listdir(cache_dir)) == 1
+    cached = skysegmentor.segmentmapN(bnmap, 4, result_cache=cache_dir)
+    assert isinstance(cached, np.memmap)
+    assert np.array_equal(cached, partitionmap)
+    # Different parameters or inputs are stored separately.
+    skysegmentor.segmentmapN(bnmap, 5, result_cache=cache_dir)
+    bnmap[0] = 0.0
+    skysegmentor.segmentmapN(bnmap, 4, result_cache=cache_dir)
+    assert len(os.listdir(cache_dir)) == 3
+    partitionmap, tree = skysegmentor.segmentmapN(
+        bnmap, 4, return_tree=True, result_cache=cache_dir
+    )
+    cached, cached_tree = skysegmentor.segmentmapN(
+        bnmap, 4, return_tree=True, result_cache=cache_dir
+    )
+    assert np.array_equal(cached, partitionmap)
+    for key in tree:
+        assert np.array_equal(cached_tree[key], tree[key], equal_nan=True)
+    skysegmentor.clear_result_cache(cache_dir)
+    assert len(os.listdir(cache_dir)) == 0
+
+
+def test_segmentpointsN_unionfinder_result_cache(tmp_path):
+    cache_dir = str(tmp_path)
+    rng = np.random.default_rng(0)
+    phi = rng.uniform(0.0, 2.0 * np.pi, 1000)
+    the = np.arccos(rng.uniform(-1.0, 1.0, 1000))
+    labels = skysegmentor.segmentpointsN(phi, the, 4, result_cache=cache_dir)
+    cached = skysegmentor.segmentpointsN(phi, the, 4, result_cache=cache_dir)
+    assert isinstance(cached, np.memmap) and np.array_equal(cached, labels)
+    bnmap = _footprint()
+    groupID, stats = skysegmentor.unionfinder(
+        bnmap, return_stats=True, result_cache=cache_dir
+    )
+    cached, cached_stats = skysegmentor.unionfinder(
+        bnmap, return_stats=True, result_cache=cache_dir
+    )
+    assert isinstance(cached, np.memmap) and np.array_equal(cached, groupID)
+    assert np.array_equal(cached_stats["counts"], stats["counts"])
+
+
+def test_result_cache_eviction(tmp_path):
+    cache_dir = str(tmp_path)
+    bnmap = _footprint()
+    try:
+        skysegmentor.set_result_cache_size(int(2.5 * bnmap.nbytes))
+        skysegmentor.segmentmapN(bnmap, 2, result_cache=cache_dir)
+        (fname,) = os.listdir(cache_dir)
+        os.utime(os.path.join(cache_dir, fname), (0, 0))
+        skysegmentor.segmentmapN(bnmap, 3, result_cache=cache_dir)
+        skysegmentor.segmentmapN(bnmap, 4, result_cache=cache_dir)
+        # The least recently used result is evicted.
+        assert len(os.listdir(cache_dir)) == 2
+        assert fname not in os.listdir(cache_dir)
+    finally:
+        skysegmentor.set_result_cache_size(2**32)
@@ -80,6 +80,25 @@ def test_cascade_all_single_element():
     assert np.array_equal(result, expected)
 
 
+def test_cascade_all_long_chain():
+    # 1 <- 2 <- 3 <- ... <- n, every label cascades to 1.
+    n = 100000
+    labels = np.arange(n)
+    labels[0] = 1
+    result = skysegmentor._cascade_all(labels)
+    assert np.all(result == 1)
+
+
+def test_cascade_all_matches_cascade():
+    rng = np.random.default_rng(0)
+    labels = np.arange(1, 201)
+    for i in range(1, 200):
+        labels[i] = rng.integers(1, i + 2)
+    result = skysegmentor._cascade_all(labels)
+    expected = [skysegmentor._cascade(labels, label) for label in labels]
+    assert np.array_equal(result, expected)
+
+
 def test_cascade_all_with_invalid_index():
     labels = np.array([2, 3, 10])  # 10 is out of bounds
     with pytest.raises(IndexError):
@@ -155,6 +174,14 @@ def test_shuffle_down_non_consecutive_labels():
     assert np.array_equal(result, expected)
 
 
+def test_shuffle_down_large():
+    rng = np.random.default_rng(1)
+    labels = rng.integers(1, 1000, 5000)
+    result = skysegmentor._shuffle_down(labels)
+    assert np.array_equal(np.unique(result), np.arange(1, len(np.unique(labels)) + 1))
+    assert np.all(np.diff(result[np.argsort(labels)]) >= 0)
+
+
 def test_shuffle_down_empty():
     labels = np.array([])
     expected = np.array([])
@@ -330,4 +357,153 @@ def test_labels_are_contiguous():
     unique_labels = np.unique(groupID[groupID > 0])
     # Labels should be contiguous from 1 to number of unique labels
     expected_labels = np.arange(1, len(unique_labels) + 1)
-    assert np.array_equal(unique_labels, expected_labels)
\ No newline at end of file
+    assert np.array_equal(unique_labels, expected_labels)
+
+
+def test_unionfinder_packed_and_pixels():
+    nside = 8
+    rng = np.random.default_rng(1)
+    binmap = (rng.uniform(size=hp.nside2npix(nside)) < 0.4).astype(int)
+    groupID = skysegmentor.unionfinder(binmap)
+    pixels = np.nonzero(binmap)[0]
+    sparse = skysegmentor.unionfinder(pixels, mask_type="pixels", nside=nside)
+    assert np.array_equal(sparse, groupID[pixels])
+    packed = skysegmentor.pack_mask(binmap)
+    sparse = skysegmentor.unionfinder(packed, mask_type="packed", nside=nside)
+    assert np.array_equal(sparse, groupID[pixels])
+    empty = skysegmentor.unionfinder(np.array([], dtype=int), "pixels", nside)
+    assert len(empty) == 0
+
+
+def test_unionfinder_sparse_matches_unionfinder():
+    nside = 16
+    rng = np.random.default_rng(2)
+    for fraction in [0.1, 0.45, 0.7]:
+        binmap = (rng.uniform(size=hp.nside2npix(nside)) < fraction).astype(int)
+        groupID = skysegmentor.unionfinder(binmap)
+        pixels = np.nonzero(binmap)[0]
+        sparse = skysegmentor.unionfinder_sparse(pixels, nside, chunksize=100)
+        assert np.array_equal(sparse, groupID[pixels])
+
+
+def test_unionfinder_sparse_partial_sky():
+    nside = 256
+    the, phi = hp.pix2ang(nside, np.arange(hp.nside2npix(nside) // 50))
+    pixels = np.arange(hp.nside2npix(nside) // 50)
+    # Two caps separated by an empty ring.
+    pixels = pixels[(the < 0.05) | ((the > 0.07) & (the < 0.1))]
+    groupID = skysegmentor.unionfinder_sparse(pixels, nside)
+    assert len(groupID) == len(pixels)
+    assert np.array_equal(np.unique(groupID), [1, 2])
+    assert np.all(groupID[the[pixels] < 0.05] == 1)
+    with pytest.raises(ValueError):
+        skysegmentor.unionfinder_sparse(pixels[::-1], nside)
+
+
+@pytest.mark.parametrize("nblocks", [12, 48])
+def test_unionfinder_blocks(nblocks):
+    nside = 16
+    rng = np.random.default_rng(3)
+    for fraction in [0.3, 0.6]:
+        binmap = (rng.uniform(size=hp.nside2npix(nside)) < fraction).astype(int)
+        groupID = skysegmentor.unionfinder(binmap)
+        blocks = skysegmentor.unionfinder(binmap, nworkers=2, nblocks=nblocks)
+        assert np.array_equal(blocks, groupID)
+        pixels = np.nonzero(binmap)[0]
+        serial = skysegmentor.groupfinder._unionfinder_blocks(
+            pixels, nside, nblocks=nblocks
+        )
+        assert np.array_equal(serial, groupID[pixels])
+
+
+def test_unionfinder_blocks_errors():
+    nside = 4
+    pixels = np.arange(10)
+    for nblocks in [10, 24, 12 * 4**4]:
+        with pytest.raises(ValueError):
+            skysegmentor.groupfinder._unionfinder_blocks(pixels, nside, nblocks=nblocks)
+    empty = skysegmentor.unionfinder(np.zeros(0, dtype=int), "pixels", nside, nworkers=2)
+    assert len(empty) == 0
+
+
+def test_unionfinder_rings():
+    rng = np.random.default_rng(4)
+    for nside in [1, 4, 16]:
+        for fraction in [0.0, 0.3, 0.6, 1.0]:
+            binmap = (rng.uniform(size=hp.nside2npix(nside)) < fraction).astype(int)
+            groupID = skysegmentor.unionfinder_rings(binmap)
+            assert np.array_equal(groupID, skysegmentor.unionfinder(binmap))
+
+
+def test_unionfinder_rings_random():
+    # Groups whose components in a ring window are only joined through earlier
+    # rings, as for the neighbouring pixels 2854 and 2893 here.
+    rng = np.random.default_rng(1)
+    for _ in range(3):
+        rng.uniform(size=hp.nside2npix(8))
+    binmap = (rng.uniform(size=hp.nside2npix(16)) < 0.3).astype(int)
+    groupID = skysegmentor.unionfinder_rings(binmap)
+    assert groupID[2854] == groupID[2893]
+    assert np.array_equal(groupID, skysegmentor.unionfinder(binmap))
+    rng = np.random.default_rng(7)
+    for _ in range(40):
+        nside = rng.choice([8, 16])
+        fraction = rng.uniform(0.25, 0.6)
+        binmap = (rng.uniform(size=hp.nside2npix(nside)) < fraction).astype(int)
+        groupID = skysegmentor.unionfinder_rings(binmap)
+        assert np.array_equal(groupID, skysegmentor.unionfinder(binmap))
+
+
+def test_unionfinder_rings_memmap(tmp_path):
+    nside = 8
+    the, phi = hp.pix2ang(nside, np.arange(hp.nside2npix(nside)))
+    binmap = ((the < 0.5) | (the > 2.5) | (np.abs(phi - 3.0) < 0.4)).astype(int)
+    fname = str(tmp_path / "binmap.npy")
+    np.save(fname, binmap)
+    output = str(tmp_path / "groupID.npy")
+    skysegmentor.unionfinder_rings(fname, output=output)
+    groupID = np.load(output)
+    assert np.array_equal(groupID, skysegmentor.unionfinder(binmap))
+    assert np.max(groupID) == 1
+
+
+def test_unionfinder_stats_min_size():
+    nside = 16
+    npix = hp.nside2npix(nside)
+    the, phi = hp.pix2ang(nside, np.arange(npix))
+    binmap = np.zeros(npix)
+    binmap[the < 0.3] = 1.0
+    binmap[the > np.pi - 0.6] = 1.0
+    binmap[np.argmin(np.abs(the - np.pi / 2) + np.abs(phi - 1.0))] = 1.0
+    wmap = 1.0 + np.random.default_rng(2).random(npix)
+    groupID = skysegmentor.unionfinder(binmap)
+    assert np.max(groupID) == 3
+    sizes = np.bincount(groupID)[1:]
+    for kwargs in [
+        {},
+        {"nworkers": 2},
+    ]:
+        labels, stats = skysegmentor.unionfinder(
+            binmap, weights=wmap, return_stats=True, **kwargs
+        )
+        assert np.array_equal(labels, groupID)
+        assert np.array_equal(stats["counts"], sizes)
+        for i in range(3):
+            region = (groupID == i + 1).astype(float)
+            phic, thec, _ = skysegmentor.find_map_barycenter(region, wmap)
+            assert np.isclose(stats["weights"][i], np.sum(wmap[groupID == i + 1]))
+            assert np.isclose(stats["phi"][i], phic)
+            assert np.isclose(stats["the"][i], thec)
+        labels = skysegmentor.unionfinder(binmap, min_size=2, **kwargs)
+        assert np.array_equal(np.unique(labels), [0, 1, 2])
+        assert np.sum(labels != 0) == np.sum(sizes[sizes >= 2])
+        kept = np.where(sizes >= 2)[0] + 1
+        for new, old in enumerate(kept):
+            assert np.array_equal(labels == new + 1, groupID == old)
+    pixels = np.where(binmap == 1)[0]
+    labels, stats = skysegmentor.unionfinder(
+        pixels, mask_type="pixels", nside=nside, min_size=2, return_stats=True
+    )
+    expected = skysegmentor.unionfinder(binmap, min_size=2)[pixels]
+    assert np.array_equal(labels, expected)
+    assert np.array_equal(stats["counts"], sizes[sizes >= 2])
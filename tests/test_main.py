@@ -0,0 +1,58 @@
+import os
+import numpy as np
+import healpy as hp
+import pytest
+
+import skysegmentor
+from skysegmentor.__main__ import _output_name, main
+
+
+def _footprint(nside=16):
+    the, phi = hp.pix2ang(nside, np.arange(hp.nside2npix(nside)))
+    bnmap = np.zeros(len(the))
+    bnmap[the < 0.3] = 1.0
+    bnmap[the > 0.6 * np.pi] = 1.0
+    return bnmap
+
+
+def test_main_map(tmp_path, capsys):
+    bnmap = _footprint()
+    np.save(tmp_path / "mask.npy", bnmap)
+    hp.write_map(str(tmp_path / "mask2.fits"), bnmap)
+    main(["map", str(tmp_path / "mask.npy"), str(tmp_path / "mask2.fits"), "-N", "6"])
+    expected = skysegmentor.segmentmapN(bnmap, 6)
+    for name in ["mask", "mask2"]:
+        labels = np.load(tmp_path / (name + ".map.labels.npy"))
+        assert labels.dtype == np.uint8
+        assert np.array_equal(labels, expected)
+    out = capsys.readouterr().out
+    assert "peak memory" in out and "2 files" in out
+    main(["map", str(tmp_path / "mask.npy"), "-N", "6", "--res-theta", "20"])
+    labels = np.load(tmp_path / "mask.map.labels.npy")
+    assert np.array_equal(labels, skysegmentor.segmentmapN(bnmap, 6, res=[100, 20]))
+
+
+def test_output_name():
+    assert _output_name("a/b.fits.gz", "map", None) == os.path.join(
+        "a", "b.map.labels.npy"
+    )
+    assert _output_name("b.npy", "groups", "out") == os.path.join(
+        "out", "b.groups.labels.npy"
+    )
+
+
+def test_main_points_groups(tmp_path):
+    rng = np.random.default_rng(0)
+    phi = rng.uniform(0.0, 2.0 * np.pi, 1000)
+    the = np.arccos(rng.uniform(-1.0, 1.0, 1000))
+    np.save(tmp_path / "cat.npy", np.column_stack([phi, the]))
+    np.save(tmp_path / "mask.npy", _footprint())
+    outdir = str(tmp_path / "out")
+    main(["points", str(tmp_path / "cat.npy"), "-N", "4", "--output-dir", outdir])
+    labels = np.load(os.path.join(outdir, "cat.points.labels.npy"))
+    assert np.array_equal(labels, skysegmentor.segmentpointsN(phi, the, 4))
+    main(["groups", str(tmp_path / "mask.npy"), "--nworkers", "2"])
+    labels = np.load(tmp_path / "mask.groups.labels.npy")
+    assert np.array_equal(labels, skysegmentor.unionfinder(_footprint()))
+    with pytest.raises(SystemExit):
+        main(["map", str(tmp_path / "mask.npy")])
@@ -0,0 +1,46 @@
+import numpy as np
+import healpy as hp
+import pytest
+
+import skysegmentor
+
+
+def _get_binmap(nside=16, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.uniform(size=hp.nside2npix(nside)) < 0.3).astype(int)
+
+
+def test_pack_mask():
+    binmap = _get_binmap()
+    packed = skysegmentor.pack_mask(binmap)
+    assert packed.dtype == np.uint8
+    assert len(packed) == len(binmap) // 8
+    assert np.all(np.unpackbits(packed) == binmap)
+
+
+def test_packed2pixels():
+    for nside in [1, 4, 16]:
+        binmap = _get_binmap(nside)
+        packed = skysegmentor.pack_mask(binmap)
+        pixels = skysegmentor.packed2pixels(packed, nside, chunksize=5)
+        assert np.all(pixels == np.nonzero(binmap)[0])
+    with pytest.raises(ValueError):
+        skysegmentor.packed2pixels(packed, 8)
+
+
+def test_mask2pixels():
+    nside = 16
+    binmap = _get_binmap(nside)
+    pixels = np.nonzero(binmap)[0]
+    assert np.all(skysegmentor.mask2pixels(binmap) == pixels)
+    packed = skysegmentor.pack_mask(binmap)
+    assert np.all(skysegmentor.mask2pixels(packed, "packed", nside) == pixels)
+    assert np.all(skysegmentor.mask2pixels(pixels, "pixels", nside) == pixels)
+    with pytest.raises(ValueError):
+        skysegmentor.mask2pixels(packed, "packed")
+    with pytest.raises(ValueError):
+        skysegmentor.mask2pixels(pixels[::-1], "pixels", nside)
+    with pytest.raises(ValueError):
+        skysegmentor.mask2pixels(np.array([0, hp.nside2npix(nside)]), "pixels", nside)
+    with pytest.raises(ValueError):
+        skysegmentor.mask2pixels(binmap, "dense")
@@ -164,4 +164,29 @@ def test_matrix_dot_3by3_zero_matrix():
     result = skysegmentor.matrix_dot_3by3(mat, zero)
     assert np.allclose(result, zero)
     result = skysegmentor.matrix_dot_3by3(zero, mat)
-    assert np.allclose(result, zero)
\ No newline at end of file
+    assert np.allclose(result, zero)
+
+
+def test_vector_normalise():
+    v = np.array([3.0, 4.0, 0.0])
+    result = skysegmentor.vector_normalise(v)
+    assert np.allclose(result, [0.6, 0.8, 0.0])
+
+
+def test_pseudo_angle_monotonic():
+    angles = np.linspace(0.0, 2.0 * np.pi, 1000, endpoint=False)
+    p = skysegmentor.pseudo_angle(np.sin(angles), np.cos(angles))
+    assert np.all(np.diff(p) > 0.0)
+    assert np.all((p >= 0.0) & (p < 4.0))
+
+
+def test_pseudo_angle_quadrants():
+    p = skysegmentor.pseudo_angle(
+        np.array([0.0, 1.0, 0.0, -1.0]), np.array([1.0, 0.0, -1.0, 0.0])
+    )
+    assert np.allclose(p, [0.0, 1.0, 2.0, 3.0])
+
+
+def test_pseudo_angle_origin():
+    p = skysegmentor.pseudo_angle(np.array([0.0]), np.array([0.0]))
+    assert np.allclose(p, 0.0)
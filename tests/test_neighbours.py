@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import healpy as hp
+import pytest
+
+import skysegmentor
+
+
+def test_get_neighbour_table():
+    skysegmentor.clear_neighbour_cache()
+    for nest in [False, True]:
+        nside = 8
+        table = skysegmentor.get_neighbour_table(nside, nest=nest)
+        assert np.shape(table) == (8, hp.nside2npix(nside))
+        assert table.dtype == np.int32
+        expected = hp.get_all_neighbours(
+            nside, np.arange(hp.nside2npix(nside)), nest=nest
+        )
+        assert np.array_equal(table, expected)
+        assert skysegmentor.get_neighbour_table(nside, nest=nest) is table
+
+
+def test_neighbour_table_readonly():
+    skysegmentor.clear_neighbour_cache()
+    table = skysegmentor.get_neighbour_table(4)
+    with pytest.raises(ValueError):
+        table[0, 0] = 0
+
+
+def test_get_footprint_neighbours():
+    skysegmentor.clear_neighbour_cache()
+    nside = 16
+    pixels = np.arange(100, 150)
+    expected = hp.get_all_neighbours(nside, pixels)
+    # A small footprint does not build the full sky table.
+    neighs = skysegmentor.get_footprint_neighbours(nside, pixels, chunksize=20)
+    assert np.array_equal(neighs, expected)
+    assert (nside, False) not in skysegmentor.neighbours._NEIGHBOUR_CACHE
+    # Once the table is cached it is used.
+    skysegmentor.get_neighbour_table(nside)
+    assert np.array_equal(
+        skysegmentor.get_footprint_neighbours(nside, pixels), expected
+    )
+    skysegmentor.clear_neighbour_cache()
+
+
+def test_neighbour_cache_eviction():
+    skysegmentor.clear_neighbour_cache()
+    nbytes = skysegmentor.get_neighbour_table(4).nbytes
+    skysegmentor.set_neighbour_cache_size(int(2.1 * nbytes))
+    try:
+        table4 = skysegmentor.get_neighbour_table(4)
+        skysegmentor.get_neighbour_table(4, nest=True)
+        # Using the nside=4 RING table again makes the NESTED one the oldest.
+        assert skysegmentor.get_neighbour_table(4) is table4
+        skysegmentor.get_neighbour_table(2)
+        cache = skysegmentor.neighbours._NEIGHBOUR_CACHE
+        assert (4, False) in cache and (2, False) in cache
+        assert (4, True) not in cache
+    finally:
+        skysegmentor.set_neighbour_cache_size(2**30)
+        skysegmentor.clear_neighbour_cache()
+
+
+def test_neighbour_table_cache_dir(tmp_path):
+    skysegmentor.clear_neighbour_cache()
+    cache_dir = str(tmp_path / "cache")
+    table = skysegmentor.get_neighbour_table(4, cache_dir=cache_dir)
+    fname = os.path.join(cache_dir, "neighbours_nside4_ring.npy")
+    assert os.path.exists(fname)
+    assert isinstance(table, np.memmap)
+    skysegmentor.clear_neighbour_cache()
+    table2 = skysegmentor.get_neighbour_table(4, cache_dir=cache_dir)
+    assert np.array_equal(table, table2)
+    assert np.array_equal(table2, hp.get_all_neighbours(4, np.arange(192)))
+    binmap = (np.random.default_rng(0).uniform(size=192) < 0.5).astype(int)
+    assert np.array_equal(
+        skysegmentor.unionfinder(binmap, cache_dir=cache_dir),
+        skysegmentor.unionfinder(binmap),
+    )
@@ -1,3 +1,4 @@
+import os
 import numpy as np
 import healpy as hp
 import skysegmentor
@@ -157,6 +158,44 @@ def test_fill_map_invalid_pixID_raises():
     with pytest.raises(IndexError):
         skysegmentor.fill_map(pixID, nside, val=1.0)
 
+
+def test_assign_points_to_partitionmap():
+    nside = 16
+    partitionmap = np.arange(hp.nside2npix(nside)) % 7
+    rng = np.random.default_rng(0)
+    phi = rng.uniform(0.0, 2.0 * np.pi, 10001)
+    the = np.arccos(rng.uniform(-1.0, 1.0, 10001))
+    expected = partitionmap[hp.ang2pix(nside, the, phi)]
+    result = skysegmentor.assign_points_to_partitionmap(
+        phi, the, partitionmap, chunksize=1000, nthreads=3
+    )
+    assert result.dtype == int
+    assert np.all(result == expected)
+    output = np.zeros(10001, dtype=np.int32)
+    result = skysegmentor.assign_points_to_partitionmap(
+        phi, the, partitionmap, output=output, chunksize=999
+    )
+    assert result is output
+    assert np.all(output == expected)
+    with pytest.raises(ValueError):
+        skysegmentor.assign_points_to_partitionmap(
+            phi, the, partitionmap, output=np.zeros(10, dtype=int)
+        )
+    with pytest.raises(ValueError):
+        skysegmentor.assign_points_to_partitionmap(phi[:10], the, partitionmap)
+
+
+def test_assign_points_to_partitionmap_memmap(tmp_path):
+    nside = 8
+    partitionmap = np.arange(hp.nside2npix(nside)) % 5
+    phi = np.linspace(0.0, 2.0 * np.pi, 500, endpoint=False)
+    the = np.linspace(0.01, np.pi - 0.01, 500)
+    fname = str(tmp_path / "labels.npy")
+    skysegmentor.assign_points_to_partitionmap(
+        phi, the, partitionmap, output=fname, chunksize=64
+    )
+    assert np.all(np.load(fname) == partitionmap[hp.ang2pix(nside, the, phi)])
+
 def test_barycenter_single_pixel():
     nside = 4
     npix = hp.nside2npix(nside)
@@ -732,4 +771,536 @@ def test_segmentpointsN_single_point():
     weights = np.array([1.0])
     partitionID = skysegmentor.segmentpointsN(phi, the, Npartitions=2, weights=weights)
     # Only one point, partition should remain 1
-    assert np.array_equal(partitionID, np.array([1]))
\ No newline at end of file
+    assert np.array_equal(partitionID, np.array([1]))
+
+
+def test_barycenter_with_moments_matches():
+    nside = 8
+    npix = hp.nside2npix(nside)
+    bnmap = np.zeros(npix)
+    bnmap[:200] = 1.0
+    wmap = np.linspace(1.0, 2.0, npix)
+    x, y, z = hp.pix2vec(nside, np.arange(200))
+    moments = skysegmentor.partition._get_moments(x, y, z, wmap[:200])
+    result1 = skysegmentor.find_map_barycenter(bnmap, wmap)
+    result2 = skysegmentor.find_map_barycenter(bnmap, wmap, moments=moments)
+    assert np.allclose(result1, result2)
+    # Given unit vectors of the non-zero pixels replace the coordinate pass.
+    result3 = skysegmentor.find_map_barycenter(
+        bnmap, wmap, moments=moments, vectors=(x, y, z)
+    )
+    assert np.array_equal(result1, result3)
+
+
+def test_find_points_barycenter_with_moments_matches():
+    phi = np.array([0.1, 0.4, 0.9])
+    the = np.array([1.0, 1.2, 1.4])
+    weights = np.array([1.0, 2.0, 3.0])
+    x, y, z = skysegmentor.sphere2cart(np.ones(3), phi, the)
+    moments = skysegmentor.partition._get_moments(x, y, z, weights)
+    result1 = skysegmentor.find_points_barycenter(phi, the, weights)
+    result2 = skysegmentor.find_points_barycenter(phi, the, weights, moments=moments)
+    assert np.allclose(result1, result2)
+    result3 = skysegmentor.find_points_barycenter(
+        phi, the, weights, moments=moments, vectors=(x, y, z)
+    )
+    assert np.allclose(result1, result3)
+
+
+def test_split_moments_smaller_child():
+    x = np.array([1.0, 0.0, 0.0, 0.0])
+    y = np.array([0.0, 1.0, 0.0, 0.0])
+    z = np.array([0.0, 0.0, 1.0, 1.0])
+    weights = np.array([1.0, 2.0, 3.0, 4.0])
+    moments = skysegmentor.partition._get_moments(x, y, z, weights)
+    def get_vectors(ind):
+        return x[ind], y[ind], z[ind]
+    for child in [np.array([0, 0, 0, 1]), np.array([0, 1, 1, 1]), np.array([0, 2, 1, 2])]:
+        nchild = np.max(child) + 1
+        child_moments = skysegmentor.partition._split_moments(moments, get_vectors, weights, child, nchild)
+        for i in range(nchild):
+            mask = child == i
+            expected = skysegmentor.partition._get_moments(x[mask], y[mask], z[mask], weights[mask])
+            assert np.allclose(child_moments[i], expected)
+
+
+def test_split_moments_binary_exact():
+    # A binary split sums the smaller child exactly as _get_moments does, so the
+    # default Nsplit=2 partitions are unchanged.
+    rng = np.random.default_rng(5)
+    x, y, z = rng.normal(size=(3, 1001))
+    weights = rng.uniform(size=1001)
+    moments = skysegmentor.partition._get_moments(x, y, z, weights)
+    child = (rng.uniform(size=1001) < 0.3).astype(int)
+
+    def get_vectors(ind):
+        return x[ind], y[ind], z[ind]
+
+    child_moments = skysegmentor.partition._split_moments(
+        moments, get_vectors, weights, child
+    )
+    cond = child == 1
+    expected = skysegmentor.partition._get_moments(
+        x[cond], y[cond], z[cond], weights[cond]
+    )
+    assert np.array_equal(child_moments[1], expected)
+    assert np.array_equal(child_moments[0], moments - expected)
+
+
+def test_segmentpoints2_with_moments_matches():
+    n = 50
+    phi = np.linspace(0.1, 1.5, n)
+    the = np.linspace(0.5, 1.5, n)
+    weights = np.linspace(1, 3, n)
+    x, y, z = skysegmentor.sphere2cart(np.ones(n), phi, the)
+    moments = skysegmentor.partition._get_moments(x, y, z, weights)
+    part1 = skysegmentor.segmentpoints2(phi, the, weights)
+    part2 = skysegmentor.segmentpoints2(phi, the, weights, moments=moments)
+    assert np.array_equal(part1, part2)
+
+
+def test_segmentmap2_normal_split():
+    nside = 8
+    npix = hp.nside2npix(nside)
+    weightmap = np.zeros(npix)
+    weightmap[:300] = 1.0
+    part_map = skysegmentor.segmentmap2(weightmap, split="normal")
+    assert set(np.unique(part_map)) == {0, 1, 2}
+    assert abs(np.sum(part_map == 1) - np.sum(part_map == 2)) < 20
+
+
+def test_segmentpoints2_normal_matches_rotate():
+    rng = np.random.default_rng(0)
+    phi = rng.uniform(0.0, 1.5, 500)
+    the = rng.uniform(0.5, 2.0, 500)
+    part1 = skysegmentor.segmentpoints2(phi, the, split="rotate")
+    part2 = skysegmentor.segmentpoints2(phi, the, split="normal")
+    assert np.mean(part1 == part2) > 0.95
+
+
+def test_segmentpointsN_invalid_split():
+    phi = np.linspace(0, 1, 10)
+    the = np.linspace(0.5, 1, 10)
+    with pytest.raises(ValueError, match="split must be either 'rotate' or 'normal'."):
+        skysegmentor.segmentpointsN(phi, the, Npartitions=2, split="exact")
+
+
+def test_segmentmapN_normal_split():
+    nside = 8
+    npix = hp.nside2npix(nside)
+    weightmap = np.ones(npix)
+    partitionmap = skysegmentor.segmentmapN(weightmap, Npartitions=6, split="normal")
+    counts = np.bincount(partitionmap.astype(int))[1:]
+    assert len(counts) == 6
+    assert counts.max() - counts.min() < 10
+
+
+def test_find_vectors_barycenter_matches_points():
+    phi = np.array([0.1, 0.4, 0.9])
+    the = np.array([1.0, 1.2, 1.4])
+    weights = np.array([1.0, 2.0, 3.0])
+    x, y, z = skysegmentor.sphere2cart(np.ones(3), phi, the)
+    center, mindot = skysegmentor.find_vectors_barycenter(x, y, z, weights)
+    phic, thec, themax = skysegmentor.find_points_barycenter(phi, the, weights)
+    assert np.allclose(center, skysegmentor.sphere2cart(1.0, phic, thec))
+    assert np.isclose(np.arccos(mindot), themax)
+
+
+def test_find_vectors_barycenter_invalid_input():
+    with pytest.raises(ValueError, match="Input unit vector arrays must not be empty."):
+        skysegmentor.find_vectors_barycenter(np.array([]), np.array([]), np.array([]))
+    with pytest.raises(ValueError, match="Input arrays x, y and z must have the same length."):
+        skysegmentor.find_vectors_barycenter(np.ones(2), np.ones(2), np.ones(1))
+    with pytest.raises(ValueError, match="Weights array must be the same length as x, y and z."):
+        skysegmentor.find_vectors_barycenter(np.ones(2), np.ones(2), np.ones(2), np.ones(3))
+
+
+def test_get_vectors_border_circle():
+    phi = np.linspace(0.0, 2 * np.pi, 200, endpoint=False)
+    the = np.full(200, 0.3)
+    phi = np.concatenate([phi, np.zeros(1)])
+    the = np.concatenate([the, np.zeros(1)])
+    x, y, z = skysegmentor.sphere2cart(np.ones(len(phi)), phi, the)
+    xb, yb, zb = skysegmentor.get_vectors_border(x, y, z, res=20)
+    assert len(xb) == 20
+    assert np.allclose(zb, np.cos(0.3))
+
+
+def test_get_vectors_most_dist_points_circle():
+    phi = np.linspace(0.0, 2 * np.pi, 100, endpoint=False)
+    the = np.full(100, np.pi / 4)
+    x, y, z = skysegmentor.sphere2cart(np.ones(100), phi, the)
+    v1, v2 = skysegmentor.get_vectors_most_dist_points(x, y, z)
+    assert np.isclose(np.arccos(np.dot(v1, v2)), np.pi / 2)
+
+
+def test_segmentvectors2_basic():
+    rng = np.random.default_rng(2)
+    phi = rng.uniform(0.0, 1.5, 400)
+    the = rng.uniform(0.5, 2.0, 400)
+    x, y, z = skysegmentor.sphere2cart(np.ones(400), phi, the)
+    part = skysegmentor.segmentvectors2(x, y, z)
+    assert set(np.unique(part)) == {1, 2}
+    assert abs(np.sum(part == 1) - np.sum(part == 2)) <= 2
+
+
+def test_segmentvectorsN_basic():
+    rng = np.random.default_rng(3)
+    phi = rng.uniform(0.0, 2 * np.pi, 1000)
+    the = np.arccos(rng.uniform(-1.0, 1.0, 1000))
+    x, y, z = skysegmentor.sphere2cart(np.ones(1000), phi, the)
+    part = skysegmentor.segmentvectorsN(x, y, z, Npartitions=5)
+    counts = np.bincount(part.astype(int))[1:]
+    assert len(counts) == 5
+    assert counts.max() - counts.min() <= 5
+
+
+def test_segmentvectorsN_invalid_Npartitions():
+    with pytest.raises(ValueError, match="Npartitions must be > 1."):
+        skysegmentor.segmentvectorsN(np.ones(2), np.zeros(2), np.zeros(2), Npartitions=1)
+
+
+def test_segmentpointsN_cartesian():
+    n = 200
+    phi = np.linspace(0, np.pi, n)
+    the = np.linspace(0.2, np.pi / 2, n)
+    partitionID = skysegmentor.segmentpointsN(phi, the, Npartitions=4, cartesian=True)
+    assert np.array_equal(np.unique(partitionID), [1, 2, 3, 4])
+
+
+def test_segmentmapN_cartesian():
+    nside = 8
+    npix = hp.nside2npix(nside)
+    weightmap = np.ones(npix)
+    weightmap[:100] = 0.0
+    partitionmap = skysegmentor.segmentmapN(weightmap, Npartitions=4, cartesian=True)
+    assert np.all(partitionmap[:100] == 0)
+    counts = np.bincount(partitionmap.astype(int))[1:]
+    assert len(counts) == 4
+    assert counts.max() - counts.min() < 10
+
+
+def test_find_dphis_equal_shares():
+    phi = np.arange(12.0)
+    weights = np.ones(12)
+    dphis = skysegmentor.find_dphis(phi, weights, [1, 1, 1])
+    assert np.allclose(dphis, [3.0, 7.0])
+
+
+def test_find_dphis_unequal_shares():
+    phi = np.linspace(0.0, 1.0, 100)
+    weights = np.ones(100)
+    dphis = skysegmentor.find_dphis(phi, weights, [1, 3])
+    assert np.sum(phi <= dphis[0]) == 25
+
+
+def test_find_dphis_invalid():
+    phi = np.arange(4.0)
+    with pytest.raises(ValueError, match="Weights must contain at least one non-zero value."):
+        skysegmentor.find_dphis(phi, np.zeros(4), [1, 1])
+    with pytest.raises(ValueError, match="shares must have at least two elements."):
+        skysegmentor.find_dphis(phi, np.ones(4), [1])
+
+
+def test_segmentpointsN_Nsplit():
+    rng = np.random.default_rng(4)
+    phi = rng.uniform(0.0, 2.0, 2000)
+    the = rng.uniform(0.5, 2.0, 2000)
+    for Nsplit in [3, 4, 7]:
+        partitionID = skysegmentor.segmentpointsN(phi, the, Npartitions=7, Nsplit=Nsplit)
+        counts = np.bincount(partitionID.astype(int))[1:]
+        assert len(counts) == 7
+        assert counts.max() - counts.min() <= 5
+
+
+def test_segmentmapN_Nsplit():
+    nside = 8
+    npix = hp.nside2npix(nside)
+    weightmap = np.ones(npix)
+    partitionmap = skysegmentor.segmentmapN(weightmap, Npartitions=9, Nsplit=3)
+    counts = np.bincount(partitionmap.astype(int))[1:]
+    assert len(counts) == 9
+    assert counts.max() - counts.min() <= 10
+
+
+def test_segmentvectorsN_invalid_Nsplit():
+    with pytest.raises(ValueError, match="Nsplit must be >= 2."):
+        skysegmentor.segmentvectorsN(np.ones(4), np.zeros(4), np.zeros(4), Npartitions=4, Nsplit=1)
+
+
+def test_segmentpoints2_tolerance():
+    rng = np.random.default_rng(4)
+    phi = rng.uniform(0.0, 2.0 * np.pi, 5000)
+    the = np.arccos(rng.uniform(-1.0, 1.0, 5000))
+    weights = rng.uniform(0.5, 1.5, 5000)
+    for split in ["rotate", "normal"]:
+        partitionID = skysegmentor.segmentpoints2(
+            phi, the, weights=weights, split=split, tolerance=1e-5
+        )
+        exact = skysegmentor.segmentpoints2(phi, the, weights=weights, split=split)
+        assert np.mean(partitionID == exact) > 0.99
+        w1, w2 = np.bincount(partitionID.astype(int), weights=weights)[1:]
+        assert abs(w1 / w2 - 1) < 1e-2
+    partitionID = skysegmentor.segmentpointsN(phi, the, 6, weights=weights, tolerance=1e-5)
+    counts = np.bincount(partitionID.astype(int), weights=weights)[1:]
+    assert np.all(np.abs(counts / np.mean(counts) - 1) < 1e-2)
+
+
+def test_segmentpoints2_tolerance_units(monkeypatch):
+    # tolerance is in radians, so the pseudo-longitude sketch of 'normal' mode,
+    # which changes by at least half a unit per radian, has bins half as wide.
+    rng = np.random.default_rng(4)
+    phi = rng.uniform(0.0, 2.0 * np.pi, 1000)
+    the = np.arccos(rng.uniform(-1.0, 1.0, 1000))
+    _weighted_sketch = skysegmentor.sketch.weighted_sketch
+    tolerances = []
+
+    def _recorded(lo, hi, tolerance=1e-4):
+        tolerances.append(tolerance)
+        return _weighted_sketch(lo, hi, tolerance=tolerance)
+
+    monkeypatch.setattr(skysegmentor.sketch, "weighted_sketch", _recorded)
+    for split in ["rotate", "normal"]:
+        skysegmentor.segmentpoints2(phi, the, split=split, tolerance=1e-3)
+    assert tolerances == [1e-3, 5e-4]
+
+
+def test_segmentpointsN_nside():
+    rng = np.random.default_rng(7)
+    phi = rng.uniform(0.0, 2.0 * np.pi, 50000)
+    the = np.arccos(rng.uniform(-0.5, 1.0, 50000))
+    for kwargs in [{}, {"cartesian": True, "Nsplit": 3}]:
+        partitionID, tree = skysegmentor.segmentpointsN(
+            phi, the, 6, nside=32, return_tree=True, **kwargs
+        )
+        counts = np.bincount(partitionID.astype(int))[1:]
+        assert len(counts) == 6
+        assert np.all(np.abs(counts / np.mean(counts) - 1) < 0.05)
+        # Points in straddling pixels follow the exact cuts of the tree.
+        x, y, z = skysegmentor.sphere2cart(np.ones(len(phi)), phi, the)
+        exact = skysegmentor.apply_partition_tree(x, y, z, tree)
+        assert np.mean(exact == partitionID) > 0.99
+
+
+def test_unique_points():
+    phi = np.array([0.1, 0.2, 0.1, 0.1, 0.3])
+    the = np.array([1.0, 1.0, 1.0, 1.5, 1.0])
+    weights = np.array([1.0, 2.0, 3.0, 4.0, 5.0])
+    _phi, _the, _weights, inverse = skysegmentor.partition._unique_points(
+        phi, the, weights
+    )
+    assert len(_phi) == 4
+    assert np.all(_phi[inverse] == phi)
+    assert np.all(_the[inverse] == the)
+    assert np.isclose(np.sum(_weights), np.sum(weights))
+    assert _weights[inverse[0]] == 4.0
+
+
+def test_segmentpointsN_unique():
+    rng = np.random.default_rng(8)
+    phi = rng.uniform(0.0, 2.0 * np.pi, 2000)
+    the = np.arccos(rng.uniform(-1.0, 1.0, 2000))
+    weights = rng.uniform(0.5, 1.5, 2000)
+    repeat = rng.integers(1, 5, 2000)
+    _phi, _the = np.repeat(phi, repeat), np.repeat(the, repeat)
+    _weights = np.repeat(weights, repeat)
+    partitionID = skysegmentor.segmentpointsN(_phi, _the, 4, weights=_weights, unique=True)
+    expected = skysegmentor.segmentpointsN(phi, the, 4, weights=weights * repeat)
+    assert np.all(partitionID == np.repeat(expected, repeat))
+
+
+def test_segmentmapN_mask_type():
+    nside = 16
+    bnmap = np.zeros(hp.nside2npix(nside))
+    the, phi = hp.pix2ang(nside, np.arange(len(bnmap)))
+    bnmap[the < 0.6 * np.pi] = 1.0
+    pixels = np.nonzero(bnmap)[0]
+    packed = skysegmentor.pack_mask(bnmap)
+    for kwargs in [{}, {"cartesian": True}]:
+        sparse = skysegmentor.segmentmapN(
+            pixels, 5, mask_type="pixels", nside=nside, **kwargs
+        )
+        assert len(sparse) == len(pixels)
+        counts = np.bincount(sparse.astype(int))[1:]
+        assert len(counts) == 5
+        assert np.all(np.abs(counts / np.mean(counts) - 1) < 0.03)
+        fromPacked = skysegmentor.segmentmapN(
+            packed, 5, mask_type="packed", nside=nside, **kwargs
+        )
+        assert np.array_equal(sparse, fromPacked)
+    with pytest.raises(ValueError):
+        skysegmentor.segmentmapN(packed, 5, mask_type="packed")
+    with pytest.raises(ValueError):
+        skysegmentor.segmentmapN(
+            np.zeros(0, dtype=int), 5, mask_type="pixels", nside=nside
+        )
+
+
+def test_updatemapN():
+    nside = 32
+    npix = hp.nside2npix(nside)
+    the, phi = hp.pix2ang(nside, np.arange(npix))
+    bnmap = np.zeros(npix)
+    bnmap[the < 0.6 * np.pi] = 1.0
+    partitionmap, tree = skysegmentor.segmentmapN(bnmap, 8, return_tree=True)
+    # An unchanged map keeps every split.
+    _partitionmap, _tree = skysegmentor.updatemapN(bnmap, tree)
+    assert np.array_equal(_partitionmap, partitionmap)
+    for key in tree:
+        assert np.array_equal(_tree[key], tree[key], equal_nan=True)
+    # A small edit only recomputes the splits it unbalances.
+    bnmap2 = np.copy(bnmap)
+    bnmap2[(np.abs(the - 1.0) < 0.2) & (np.abs(phi - 2.0) < 0.2)] = 0.0
+    _partitionmap, _tree = skysegmentor.updatemapN(bnmap2, tree)
+    recomputed = np.any(_tree["xaxis"] != tree["xaxis"], axis=1)
+    assert 0 < np.sum(recomputed) < len(recomputed)
+    counts = np.bincount(_partitionmap.astype(int))[1:]
+    assert len(counts) == 8
+    assert np.all(np.abs(counts / np.mean(counts) - 1.0) <= 0.02)
+    pixID = np.nonzero(bnmap2)[0]
+    x, y, z = hp.pix2vec(nside, pixID)
+    assert np.array_equal(
+        skysegmentor.apply_partition_tree(x, y, z, _tree), _partitionmap[pixID]
+    )
+    with pytest.raises(ValueError):
+        skysegmentor.updatemapN(bnmap, tree, tolerance=-1.0)
+
+
+def test_updatemapN_Nsplit():
+    nside = 32
+    the, phi = hp.pix2ang(nside, np.arange(hp.nside2npix(nside)))
+    bnmap = np.zeros(len(the))
+    bnmap[the < 0.6 * np.pi] = 1.0
+    partitionmap, tree = skysegmentor.segmentmapN(
+        bnmap, 9, Nsplit=3, return_tree=True
+    )
+    # An unchanged map keeps every split, with or without the previous IDs.
+    for previous in [None, partitionmap]:
+        _partitionmap, _tree = skysegmentor.updatemapN(
+            bnmap, tree, partitionmap=previous
+        )
+        assert np.array_equal(_partitionmap, partitionmap)
+        for key in tree:
+            assert np.array_equal(_tree[key], tree[key], equal_nan=True)
+
+
+def test_updatemapN_partitionmap(monkeypatch):
+    nside = 32
+    the, phi = hp.pix2ang(nside, np.arange(hp.nside2npix(nside)))
+    bnmap = np.zeros(len(the))
+    bnmap[the < 0.6 * np.pi] = 1.0
+    partitionmap, tree = skysegmentor.segmentmapN(bnmap, 8, return_tree=True)
+    _segmentmap2 = skysegmentor.partition._segmentmap2
+    calls = []
+
+    def _counted(*args, **kwargs):
+        calls.append(1)
+        return _segmentmap2(*args, **kwargs)
+
+    monkeypatch.setattr(skysegmentor.partition, "_segmentmap2", _counted)
+    skysegmentor.updatemapN(bnmap, tree, partitionmap=partitionmap)
+    assert len(calls) == 0
+    # Previous IDs which do not follow the tree, here with two partitions
+    # swapped, have every split from the root down recomputed.
+    previous = np.copy(partitionmap)
+    previous[partitionmap == 1], previous[partitionmap == 2] = 2, 1
+    _partitionmap, _tree = skysegmentor.updatemapN(
+        bnmap, tree, partitionmap=previous
+    )
+    assert len(calls) == len(tree["partition"])
+    counts = np.bincount(_partitionmap.astype(int))[1:]
+    assert np.all(np.abs(counts / np.mean(counts) - 1.0) <= 0.02)
+    pixID = np.nonzero(bnmap)[0]
+    x, y, z = hp.pix2vec(nside, pixID)
+    assert np.array_equal(
+        skysegmentor.apply_partition_tree(x, y, z, _tree), _partitionmap[pixID]
+    )
+    with pytest.raises(ValueError):
+        skysegmentor.updatemapN(bnmap, tree, partitionmap=partitionmap[:-1])
+    with pytest.raises(ValueError):
+        skysegmentor.updatemapN(bnmap, tree, partitionmap=partitionmap + 1)
+
+
+def test_segmentmapN_checkpoint(tmp_path, monkeypatch):
+    nside = 16
+    the, phi = hp.pix2ang(nside, np.arange(hp.nside2npix(nside)))
+    bnmap = np.zeros(len(the))
+    bnmap[the < 0.6 * np.pi] = 1.0
+    partitionmap, tree = skysegmentor.segmentmapN(bnmap, 8, return_tree=True)
+    checkpoint = str(tmp_path / "checkpoint.npz")
+
+    # Count the splits made, interrupting the partitioning after 5 of the 7.
+    _segmentmap2 = skysegmentor.partition._segmentmap2
+    calls = []
+    limit = [5]
+
+    def _counted(*args, **kwargs):
+        if len(calls) == limit[0]:
+            raise KeyboardInterrupt
+        calls.append(1)
+        return _segmentmap2(*args, **kwargs)
+
+    monkeypatch.setattr(skysegmentor.partition, "_segmentmap2", _counted)
+    with pytest.raises(KeyboardInterrupt):
+        skysegmentor.segmentmapN(bnmap, 8, checkpoint=checkpoint, checkpoint_splits=2)
+    assert os.path.exists(checkpoint)
+
+    # The rerun resumes from the checkpoint after 4 splits.
+    calls.clear()
+    limit[0] = None
+    _partitionmap, _tree = skysegmentor.segmentmapN(
+        bnmap, 8, return_tree=True, checkpoint=checkpoint, checkpoint_splits=2
+    )
+    assert len(calls) == 3
+    assert np.array_equal(_partitionmap, partitionmap)
+    for key in tree:
+        assert np.array_equal(_tree[key], tree[key], equal_nan=True)
+    assert not os.path.exists(checkpoint)
+
+    with pytest.raises(ValueError):
+        skysegmentor.segmentmapN(bnmap, 8, cartesian=True, checkpoint=checkpoint)
+
+
+@pytest.mark.parametrize("Nsplit", [3, 4])
+def test_apply_partition_tree_Nsplit_rotate(Nsplit):
+    nside = 16
+    npix = hp.nside2npix(nside)
+    the, phi = hp.pix2ang(nside, np.arange(npix))
+    for weightmap in [np.ones(npix), (the < 0.6 * np.pi).astype(float)]:
+        for N in [9, 12]:
+            partitionmap, tree = skysegmentor.segmentmapN(
+                weightmap, N, Nsplit=Nsplit, return_tree=True
+            )
+            pixID = np.nonzero(weightmap)[0]
+            x, y, z = hp.pix2vec(nside, pixID)
+            assert np.array_equal(
+                skysegmentor.apply_partition_tree(x, y, z, tree), partitionmap[pixID]
+            )
+    rng = np.random.default_rng(3)
+    phi = rng.uniform(0.0, 2.0 * np.pi, 3000)
+    the = np.arccos(rng.uniform(-1.0, 1.0, 3000))
+    partitionID, tree = skysegmentor.segmentpointsN(
+        phi, the, 9, Nsplit=Nsplit, return_tree=True
+    )
+    x, y, z = skysegmentor.sphere2cart(1.0, phi, the)
+    assert np.array_equal(skysegmentor.apply_partition_tree(x, y, z, tree), partitionID)
+
+
+def test_replay_cuts_only_with_tree(monkeypatch):
+    nside = 16
+    the, phi = hp.pix2ang(nside, np.arange(hp.nside2npix(nside)))
+    weightmap = (the < 0.6 * np.pi).astype(float)
+    _replay_cuts = skysegmentor.partition._replay_cuts
+    calls = []
+
+    def _counted(*args):
+        calls.append(1)
+        return _replay_cuts(*args)
+
+    monkeypatch.setattr(skysegmentor.partition, "_replay_cuts", _counted)
+    skysegmentor.segmentmapN(weightmap, 9, Nsplit=3)
+    skysegmentor.segmentpointsN(phi, the, 9, Nsplit=3)
+    assert len(calls) == 0
+    skysegmentor.segmentmapN(weightmap, 9, Nsplit=3, return_tree=True)
+    skysegmentor.segmentpointsN(phi, the, 9, Nsplit=3, return_tree=True)
+    assert len(calls) == 8
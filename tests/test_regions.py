@@ -0,0 +1,117 @@
+import numpy as np
+import healpy as hp
+import pytest
+
+import skysegmentor
+
+
+def _brute_adjacency(partitionmap):
+    nside = hp.npix2nside(len(partitionmap))
+    counts = {}
+    for pix in np.nonzero(partitionmap)[0]:
+        for neigh in hp.get_all_neighbours(nside, pix):
+            if neigh < 0:
+                continue
+            l1, l2 = int(partitionmap[pix]), int(partitionmap[neigh])
+            if 0 < l1 < l2:
+                counts[(l1, l2)] = counts.get((l1, l2), 0) + 1
+    return counts
+
+
+def test_partition_adjacency():
+    nside = 16
+    bnmap = np.zeros(hp.nside2npix(nside))
+    the, phi = hp.pix2ang(nside, np.arange(len(bnmap)))
+    bnmap[the < 0.6 * np.pi] = 1.0
+    partitionmap = skysegmentor.segmentmapN(bnmap, 8)
+    region1, region2, counts = skysegmentor.partition_adjacency(
+        partitionmap, chunksize=100
+    )
+    assert np.all(region1 < region2)
+    assert np.all(counts > 0)
+    expected = _brute_adjacency(partitionmap)
+    assert dict(zip(zip(region1, region2), counts)) == expected
+    # Every region touches at least one other region.
+    assert np.array_equal(np.unique(np.concatenate([region1, region2])), np.arange(1, 9))
+
+
+def test_partition_adjacency_empty():
+    partitionmap = np.zeros(hp.nside2npix(4))
+    region1, region2, counts = skysegmentor.partition_adjacency(partitionmap)
+    assert len(region1) == len(region2) == len(counts) == 0
+    partitionmap[:10] = 1
+    region1, region2, counts = skysegmentor.partition_adjacency(partitionmap)
+    assert len(region1) == 0
+
+
+def test_partition_summary_map():
+    nside = 16
+    bnmap = np.zeros(hp.nside2npix(nside))
+    the, phi = hp.pix2ang(nside, np.arange(len(bnmap)))
+    bnmap[the < 0.6 * np.pi] = 1.0
+    wmap = 1.0 + np.random.default_rng(0).random(len(bnmap))
+    partitionmap = skysegmentor.segmentmapN(bnmap, 5)
+    summary = skysegmentor.partition_summary(partitionmap, weights=wmap)
+    assert np.array_equal(summary["partition"], np.arange(1, 6))
+    for row in summary:
+        region = np.zeros(len(bnmap))
+        region[partitionmap == row["partition"]] = 1.0
+        pixID = np.where(region == 1.0)[0]
+        phic, thec, themax = skysegmentor.find_map_barycenter(region, wmap)
+        assert row["count"] == len(pixID)
+        assert np.isclose(row["area"], len(pixID) * hp.nside2pixarea(nside))
+        assert np.isclose(row["weight"], np.sum(wmap[pixID]))
+        assert np.isclose(row["phi"], phic) and np.isclose(row["the"], thec)
+        assert np.isclose(row["extent"], themax)
+        neff = np.sum(wmap[pixID]) ** 2 / np.sum(wmap[pixID] ** 2)
+        assert np.isclose(row["neff"], neff)
+
+
+def test_partition_summary_points():
+    rng = np.random.default_rng(1)
+    phi = rng.uniform(0.0, 2.0 * np.pi, 2000)
+    the = np.arccos(rng.uniform(-1.0, 1.0, 2000))
+    labels = skysegmentor.segmentpointsN(phi, the, 4)
+    summary = skysegmentor.partition_summary(labels, phi=phi, the=the)
+    assert np.array_equal(summary["count"], np.bincount(labels.astype(int))[1:])
+    assert np.all(np.isnan(summary["area"]))
+    assert np.allclose(summary["neff"], summary["count"])
+    summary = skysegmentor.partition_summary(labels, phi=phi, the=the, nside=4)
+    assert np.isclose(np.sum(summary["area"]), 4.0 * np.pi, rtol=0.3)
+    assert np.all(summary["area"] > 0.0)
+
+
+def test_partition_summary_errors():
+    labels = np.ones(10, dtype=int)
+    with pytest.raises(ValueError):
+        skysegmentor.partition_summary(labels, phi=np.zeros(10))
+    with pytest.raises(ValueError):
+        skysegmentor.partition_summary(labels, phi=np.zeros(9), the=np.zeros(9))
+    summary = skysegmentor.partition_summary(np.zeros(hp.nside2npix(2), dtype=int))
+    assert len(summary) == 0
+
+
+def test_partition_components():
+    nside = 16
+    npix = hp.nside2npix(nside)
+    the, phi = hp.pix2ang(nside, np.arange(npix))
+    partitionmap = np.zeros(npix, dtype=int)
+    partitionmap[the < 0.5] = 1
+    partitionmap[the > np.pi - 0.5] = 1
+    partitionmap[(the > 1.2) & (the < 1.9) & (phi < 1.0)] = 2
+    partitionmap[(the > 1.2) & (the < 1.9) & (phi > 1.0) & (phi < 3.0)] = 3
+    componentID, ncomponents = skysegmentor.partition_components(
+        partitionmap, chunksize=500
+    )
+    assert np.array_equal(ncomponents, [2, 1, 1])
+    assert np.array_equal(componentID != 0, partitionmap != 0)
+    # Per partition, components match unionfinder on the partition alone.
+    for i in range(1, 4):
+        groupID = skysegmentor.unionfinder((partitionmap == i).astype(float))
+        assert len(np.unique(componentID[groupID != 0])) == np.max(groupID)
+    # Touching partitions are not merged.
+    assert len(np.unique(componentID)) == 5
+    partitionmap = skysegmentor.segmentmapN((the < 0.6 * np.pi).astype(float), 6)
+    componentID, ncomponents = skysegmentor.partition_components(partitionmap)
+    assert len(ncomponents) == 6 and np.all(ncomponents >= 1)
+    assert np.max(componentID) == np.sum(ncomponents)
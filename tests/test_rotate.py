@@ -348,4 +348,33 @@ def test_output_types_and_shapes():
     
     phi_rot, the_rot = skysegmentor.forward_rotate(0.5, 0.5, a1, a2, a3)
     assert isinstance(phi_rot, float) or isinstance(phi_rot, np.floating)
-    assert isinstance(the_rot, float) or isinstance(the_rot, np.floating)
\ No newline at end of file
+    assert isinstance(the_rot, float) or isinstance(the_rot, np.floating)
+
+
+def test_rotate2plane_basis_matches_forward_rotate():
+    c1 = [0.3, 1.0]
+    c2 = [1.2, 1.9]
+    a1, a2, a3 = skysegmentor.rotate2plane(c1, c2)
+    xaxis, yaxis, zaxis = skysegmentor.rotate2plane_basis(c1, c2)
+    phi = np.linspace(0.1, 6.0, 50)
+    the = np.linspace(0.2, 3.0, 50)
+    phi_rot, the_rot = skysegmentor.forward_rotate(phi, the, a1, a2, a3)
+    x, y, z = skysegmentor.sphere2cart(np.ones(50), phi, the)
+    v = np.array([x, y, z])
+    phi_dot = np.arctan2(yaxis @ v, xaxis @ v) % (2.0 * np.pi)
+    the_dot = np.arccos(zaxis @ v)
+    assert np.allclose(phi_dot, phi_rot)
+    assert np.allclose(the_dot, the_rot)
+
+
+def test_rotate2plane_basis_orthonormal():
+    xaxis, yaxis, zaxis = skysegmentor.rotate2plane_basis([0.0, 0.5], [2.0, 2.5])
+    basis = np.array([xaxis, yaxis, zaxis])
+    assert np.allclose(basis @ basis.T, np.eye(3))
+
+
+def test_rotate2plane_basis_degenerate():
+    for c2 in [[0.5, 1.0], [0.5 + np.pi, np.pi - 1.0]]:
+        xaxis, yaxis, zaxis = skysegmentor.rotate2plane_basis([0.5, 1.0], c2)
+        basis = np.array([xaxis, yaxis, zaxis])
+        assert np.allclose(basis @ basis.T, np.eye(3))
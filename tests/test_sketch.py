@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import skysegmentor
+
+
+def test_weighted_sketch():
+    sketch = skysegmentor.weighted_sketch(0.0, 1.0, tolerance=0.01)
+    assert len(sketch["weights"]) == 100
+    assert np.all(sketch["weights"] == 0.0)
+    sketch = skysegmentor.weighted_sketch(1.0, 1.0)
+    assert len(sketch["weights"]) == 1
+    with pytest.raises(ValueError):
+        skysegmentor.weighted_sketch(1.0, 0.0)
+    with pytest.raises(ValueError):
+        skysegmentor.weighted_sketch(0.0, 1.0, tolerance=0.0)
+
+
+def test_update_sketch():
+    sketch = skysegmentor.weighted_sketch(0.0, 1.0, tolerance=0.25)
+    skysegmentor.update_sketch(sketch, np.array([0.0, 0.1, 0.25, 0.3, 0.9, 2.0]))
+    assert np.all(sketch["weights"] == [3.0, 1.0, 0.0, 2.0])
+    skysegmentor.update_sketch(sketch, np.array([0.6]), np.array([0.5]))
+    assert np.all(sketch["weights"] == [3.0, 1.0, 0.5, 2.0])
+
+
+def test_merge_sketches():
+    rng = np.random.default_rng(0)
+    values = rng.uniform(0.0, 2.0 * np.pi, 1000)
+    sketch = skysegmentor.weighted_sketch(0.0, 2.0 * np.pi)
+    skysegmentor.update_sketch(sketch, values)
+    sketches = []
+    for _values in np.array_split(values, 4):
+        sketches.append(skysegmentor.weighted_sketch(0.0, 2.0 * np.pi))
+        skysegmentor.update_sketch(sketches[-1], _values)
+    merged = skysegmentor.merge_sketches(sketches)
+    assert np.all(merged["weights"] == sketch["weights"])
+    with pytest.raises(ValueError):
+        skysegmentor.merge_sketches([sketch, skysegmentor.weighted_sketch(0.0, 1.0)])
+
+
+def test_sketch_quantiles():
+    rng = np.random.default_rng(1)
+    values = rng.uniform(0.0, 1.0, 100000)
+    weights = rng.uniform(0.0, 2.0, 100000)
+    sketch = skysegmentor.weighted_sketch(0.0, 1.0, tolerance=1e-3)
+    skysegmentor.update_sketch(sketch, values, weights)
+    quantiles = skysegmentor.sketch_quantiles(sketch, [1, 2, 1])
+    assert len(quantiles) == 2
+    total = np.sum(weights)
+    for quantile, fraction in zip(quantiles, [0.25, 0.75]):
+        assert abs(np.sum(weights[values <= quantile]) / total - fraction) < 2e-3
+    with pytest.raises(ValueError):
+        skysegmentor.sketch_quantiles(sketch, [1])
+    with pytest.raises(ValueError):
+        skysegmentor.sketch_quantiles(skysegmentor.weighted_sketch(0.0, 1.0), [1, 1])
+
+
+def test_sketch_dphi():
+    rng = np.random.default_rng(2)
+    phi = rng.uniform(0.0, 2.0 * np.pi, 50000)
+    sketch = skysegmentor.weighted_sketch(0.0, 2.0 * np.pi, tolerance=1e-4)
+    skysegmentor.update_sketch(sketch, phi)
+    for balance in [1, 2, 0.5]:
+        dphi = skysegmentor.sketch_dphi(sketch, balance=balance)
+        exact = skysegmentor.find_dphi(phi, np.ones(len(phi)), balance=balance)
+        assert abs(dphi - exact) < 2e-3
@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+import pytest
+
+import skysegmentor
+
+
+def _get_catalog(n=20000, seed=1):
+    rng = np.random.default_rng(seed)
+    phi = rng.uniform(0.0, 2.0 * np.pi, n)
+    the = np.arccos(rng.uniform(-0.2, 1.0, n))
+    weights = rng.uniform(0.5, 1.5, n)
+    return phi, the, weights
+
+
+def _save_shards(tmp_path, data, nshards=3):
+    shards = []
+    for i, _data in enumerate(np.array_split(data, nshards)):
+        fname = os.path.join(str(tmp_path), "shard%i.npy" % i)
+        np.save(fname, _data)
+        shards.append(fname)
+    return shards
+
+
+@pytest.mark.parametrize("Nsplit", [2, 3])
+def test_segmentshardsN_files(tmp_path, Nsplit):
+    phi, the, weights = _get_catalog()
+    shards = _save_shards(tmp_path, np.array([phi, the, weights]).T)
+    labels = [os.path.join(str(tmp_path), "labels%i.npy" % i) for i in range(3)]
+    output, tree = skysegmentor.segmentshardsN(
+        shards, 6, labels=labels, Nsplit=Nsplit, chunksize=3000, return_tree=True
+    )
+    partitionID = np.concatenate(output)
+    assert np.all(partitionID == np.concatenate([np.load(l) for l in labels]))
+    partition_weights = np.bincount(partitionID, weights=weights)[1:]
+    assert len(partition_weights) == 6
+    assert np.all(np.abs(partition_weights / np.mean(partition_weights) - 1) < 1e-3)
+    x, y, z = skysegmentor.sphere2cart(np.ones(len(phi)), phi, the)
+    assert np.all(skysegmentor.apply_partition_tree(x, y, z, tree) == partitionID)
+
+
+def test_segmentshardsN_arrays():
+    phi, the, _ = _get_catalog(n=9000, seed=2)
+    shards = np.array_split(np.array([phi, the]).T, 2)
+    output = skysegmentor.segmentshardsN(shards, 4, chunksize=1000)
+    counts = np.bincount(np.concatenate(output))[1:]
+    assert np.all(np.abs(counts - 2250) <= 2)
+    # Chunking does not change the result.
+    output2 = skysegmentor.segmentshardsN(shards, 4, chunksize=100000)
+    assert np.all(np.concatenate(output) == np.concatenate(output2))
+
+
+def test_segmentshardsN_errors():
+    phi, the, _ = _get_catalog(n=100)
+    shards = [np.array([phi, the]).T]
+    with pytest.raises(ValueError):
+        skysegmentor.segmentshardsN(shards, 1)
+    with pytest.raises(ValueError):
+        skysegmentor.segmentshardsN(shards, 4, Nsplit=1)
+    with pytest.raises(ValueError):
+        skysegmentor.segmentshardsN([np.array([phi, the, np.zeros(100)]).T], 4)
+    # Antipodal points of equal weight have no barycenter direction.
+    antipodal = np.array([[0.0, 0.5 * np.pi], [np.pi, 0.5 * np.pi]])
+    with pytest.raises(ValueError, match="barycenter"):
+        skysegmentor.segmentshardsN([antipodal], 2)
+
+
+def test_segmentshardsN_nworkers(tmp_path):
+    phi, the, weights = _get_catalog(n=12000, seed=3)
+    shards = _save_shards(tmp_path, np.array([phi, the, weights]).T, nshards=4)
+    serial = skysegmentor.segmentshardsN(shards, 5, chunksize=2000)
+    parallel, tree = skysegmentor.segmentshardsN(
+        shards, 5, chunksize=2000, nworkers=2, return_tree=True
+    )
+    assert all(isinstance(label, np.ndarray) for label in parallel)
+    assert np.all(np.concatenate(serial) == np.concatenate(parallel))
+    assert len(tree["partition"]) == 4
+    labels = [os.path.join(str(tmp_path), "labels%i.npy" % i) for i in range(4)]
+    skysegmentor.segmentshardsN(shards, 5, labels=labels, chunksize=2000, nworkers=2)
+    assert np.all(
+        np.concatenate([np.load(l) for l in labels]) == np.concatenate(serial)
+    )
+    with pytest.raises(ValueError):
+        skysegmentor.segmentshardsN(
+            shards, 5, labels=[np.zeros(3000, dtype=int)] * 4, nworkers=2
+        )
@@ -0,0 +1,128 @@
+import numpy as np
+import healpy as hp
+import pytest
+
+import skysegmentor
+
+
+def _get_map(nside=32):
+    bnmap = np.zeros(hp.nside2npix(nside))
+    pix = np.arange(len(bnmap))
+    the, phi = hp.pix2ang(nside, pix)
+    cond = np.where((the < 0.6 * np.pi) & ((phi < 1.2 * np.pi) | (the < 0.3 * np.pi)))[0]
+    bnmap[cond] = 1.0
+    return bnmap
+
+
+def _map_vectors(bnmap):
+    pixID = np.nonzero(bnmap)[0]
+    x, y, z = hp.pix2vec(hp.npix2nside(len(bnmap)), pixID)
+    return pixID, x, y, z
+
+
+def test_get_tree_levels():
+    bnmap = _get_map()
+    _, tree = skysegmentor.segmentmapN(bnmap, 6, return_tree=True)
+    levels = skysegmentor.get_tree_levels(tree)
+    assert np.all(levels == np.arange(1, 7))
+    _, tree = skysegmentor.segmentmapN(bnmap, 9, Nsplit=3, return_tree=True)
+    levels = skysegmentor.get_tree_levels(tree)
+    assert levels[0] == 1 and levels[-1] == 9
+    assert np.all(np.diff(levels) == 2)
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"split": "normal"},
+        {"Nsplit": 4},
+        {"cartesian": True},
+        {"cartesian": True, "Nsplit": 3},
+    ],
+)
+def test_apply_partition_tree_map(kwargs):
+    bnmap = _get_map()
+    partitionmap, tree = skysegmentor.segmentmapN(
+        bnmap, 7, return_tree=True, **kwargs
+    )
+    pixID, x, y, z = _map_vectors(bnmap)
+    partitionID = skysegmentor.apply_partition_tree(x, y, z, tree)
+    assert np.mean(partitionID == partitionmap[pixID]) > 0.999
+
+
+def test_apply_partition_tree_points():
+    rng = np.random.default_rng(3)
+    phi = rng.uniform(0.0, 2.0 * np.pi, 4000)
+    the = np.arccos(rng.uniform(0.2, 1.0, 4000))
+    partitionID, tree = skysegmentor.segmentpointsN(phi, the, 5, return_tree=True)
+    x, y, z = skysegmentor.sphere2cart(np.ones(len(phi)), phi, the)
+    assert np.mean(skysegmentor.apply_partition_tree(x, y, z, tree) == partitionID) > 0.999
+
+
+def test_coarsen_partition():
+    bnmap = _get_map()
+    partitionmap4, tree4 = skysegmentor.segmentmapN(bnmap, 4, return_tree=True)
+    partitionmap8, tree8 = skysegmentor.refinemapN(bnmap, partitionmap4, 8, tree=tree4)
+    assert len(np.unique(partitionmap8[partitionmap8 != 0])) == 8
+    assert np.all(skysegmentor.get_tree_levels(tree8)[:4] == np.arange(1, 5))
+    assert np.all(skysegmentor.get_tree_levels(tree8, balanced=True) == [1, 2, 4, 8])
+    assert len(tree4["partition"]) == 3
+    coarse = skysegmentor.coarsen_partition(partitionmap8, tree8, 4)
+    assert np.all(coarse == partitionmap4)
+    coarse = skysegmentor.coarsen_partition(partitionmap8, tree8, 1)
+    assert np.all(coarse == bnmap)
+    # Every partition of the coarser level is split in two equal halves.
+    for i in range(1, 5):
+        sub = partitionmap8[partitionmap4 == i]
+        assert len(np.unique(sub)) == 2
+
+
+def test_coarsen_partition_error():
+    bnmap = _get_map()
+    partitionmap, tree = skysegmentor.segmentmapN(
+        bnmap, 9, Nsplit=3, return_tree=True
+    )
+    with pytest.raises(ValueError):
+        skysegmentor.coarsen_partition(partitionmap, tree, 2)
+    # Level 4 of a tree built for 8 partitions is passed through with partitions
+    # holding 4, 2, 1 and 1 final partitions, so it cannot be read out.
+    partitionmap, tree = skysegmentor.segmentmapN(bnmap, 8, return_tree=True)
+    assert np.all(skysegmentor.get_tree_levels(tree, balanced=True) == [1, 2, 8])
+    with pytest.raises(ValueError):
+        skysegmentor.coarsen_partition(partitionmap, tree, 4)
+    coarse = skysegmentor.coarsen_partition(partitionmap, tree, 2)
+    counts = np.bincount(coarse.astype(int))[1:]
+    assert abs(counts[0] - counts[1]) <= 0.01 * np.sum(counts)
+
+
+def test_refinepointsN():
+    rng = np.random.default_rng(5)
+    phi = rng.uniform(0.0, 2.0 * np.pi, 3000)
+    the = np.arccos(rng.uniform(-1.0, 1.0, 3000))
+    partitionID = skysegmentor.segmentpointsN(phi, the, 3)
+    for cartesian in [False, True]:
+        refined = skysegmentor.refinepointsN(
+            phi, the, partitionID, 6, cartesian=cartesian
+        )
+        counts = np.bincount(refined.astype(int))[1:]
+        assert len(counts) == 6
+        assert np.all(np.abs(counts - 500) <= 2)
+    with pytest.raises(ValueError):
+        skysegmentor.refinepointsN(phi, the, partitionID, 3)
+
+
+def test_refinevectorsN_uneven():
+    rng = np.random.default_rng(6)
+    x, y, z = skysegmentor.vector_normalise(rng.normal(size=(3, 2000)))
+    partitionID = skysegmentor.segmentvectorsN(x, y, z, 2)
+    refined, tree = skysegmentor.refinevectorsN(
+        x, y, z, partitionID, 5, tree=skysegmentor.segmentvectorsN(
+            x, y, z, 2, return_tree=True
+        )[1]
+    )
+    counts = np.bincount(refined.astype(int))[1:]
+    assert len(counts) == 5
+    # Existing boundaries are kept, so one half is split in 3 and the other in 2.
+    assert np.all(np.abs(np.sort(counts) - [333, 333, 333, 500, 500]) <= 2)
+    assert np.all(skysegmentor.get_tree_levels(tree) == np.arange(1, 6))